@@ -0,0 +1,7 @@
+"""
+Benchmarks of the Invest Tracker aplication.
+
+Run them from the root directory of the repository, e.g.:
+
+    python -m benchmarks.startup_benchmark
+"""
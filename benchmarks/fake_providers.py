@@ -0,0 +1,144 @@
+"""
+Offline fake NBP, Yahoo Finance and gov.pl providers
+
+The providers answer from a SyntheticPortfolio instead of the network, so the whole pipeline can be benchmarked offline and with any data size.
+They are installed by the `offline_providers` context manager, which replaces:
+- nbp_api.get_response_from_url - NBP exchange rates API (table A, single day and date range queries),
+- yahoo_finance_api.yf - the yfinance module (Ticker.history and Ticker.fast_info),
+- goverment_bond_getting_table_of_interest.download_goverment_bond_workbook - the gov.pl workbook of bond interest tables.
+
+Every answered request is counted in `FakeProviders.calls`.
+"""
+
+
+
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import nbp_api
+import yahoo_finance_api
+import goverment_bond_getting_table_of_interest as goverment_bond
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, content: dict=None):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+class FakeTicker:
+
+    def __init__(self, providers, ticker: str):
+        self.providers = providers
+        self.ticker = ticker
+
+    def history(self, period: str=None, start=None, interval: str='1d'):
+        self.providers.calls["yahoo"] += 1
+        portfolio = self.providers.portfolio
+        if start is None:
+            start = portfolio.start_date
+        if start > portfolio.end_date:
+            return pd.DataFrame()
+        return portfolio.close_prices(self.ticker, start, portfolio.end_date)
+
+    @property
+    def fast_info(self):
+        self.providers.calls["yahoo"] += 1
+        portfolio = self.providers.portfolio
+        currency = portfolio.instruments.get(self.ticker, ("USD", None))[0]
+        return {"last_price": portfolio.price_on(self.ticker, portfolio.end_date), "currency": currency}
+
+
+class FakeYfinance:
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    def Ticker(self, ticker: str):
+        return FakeTicker(self.providers, ticker)
+
+
+class FakeBondWorkbook:
+
+    columns_to_drop = goverment_bond.columns_to_drop
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+
+    def parse(self, sheet_name: str):
+        years = goverment_bond.bond_sheets[sheet_name][0]
+        additional_columns = goverment_bond.bond_sheets[sheet_name][1]
+        rows = [{"Seria": "Seria"}]     #First row of every sheet is dropped by the parser
+        for series, interests in self.portfolio.bond_interest_rows(sheet_name).items():
+            row = {"Seria": series, "Oprocentowanie": interests[0]}
+            for year in range(2, years + 1):
+                row[f"Unnamed: {year + 8}"] = interests[year - 1]
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        for column in self.columns_to_drop + additional_columns:
+            df[column] = None
+        for year in range(1, years + 1):
+            column = "Oprocentowanie" if year == 1 else f"Unnamed: {year + 8}"
+            if column not in df.columns:
+                df[column] = None
+        return df
+
+
+class FakeProviders:
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+        self.calls = {"nbp": 0, "yahoo": 0, "gov.pl": 0}
+
+    def get_response_from_url(self, currency_code: str, date_param: str):
+        self.calls["nbp"] += 1
+        dates = date_param.split("/")
+        start_date = datetime.strptime(dates[0], "%Y-%m-%d").date()
+        end_date = datetime.strptime(dates[-1], "%Y-%m-%d").date()
+        if start_date > date.today() or end_date > date.today() or start_date > end_date:
+            return FakeResponse(400)
+        rates = []
+        day = start_date
+        while day <= end_date:
+            if day.isoweekday() <= 5 and day <= self.portfolio.end_date:
+                rates.append({"no": f"{len(rates) + 1:03d}/A/NBP/{day.year}",
+                              "effectiveDate": str(day),
+                              "mid": self.portfolio.exchange_rate(currency_code, day)})
+            day += timedelta(days = 1)
+        if not rates:
+            return FakeResponse(404)
+        return FakeResponse(200, {"table": "A", "code": currency_code.upper(), "rates": rates})
+
+    def download_goverment_bond_workbook(self, url: str=None):
+        self.calls["gov.pl"] += 1
+        return FakeBondWorkbook(self.portfolio)
+
+
+@contextmanager
+def offline_providers(portfolio):
+    """
+    Replaces the NBP, Yahoo Finance and gov.pl providers with fakes answering from the portfolio.
+
+    Example usage:
+    ```python
+    with offline_providers(SyntheticPortfolio(transactions=5000)) as providers:
+        nbp_api.check_nbp_api_for_new_exchange_rates(["USD", "EUR"])
+    print(providers.calls)
+    ```
+    """
+    providers = FakeProviders(portfolio)
+    originals = (nbp_api.get_response_from_url, yahoo_finance_api.yf, goverment_bond.download_goverment_bond_workbook)
+    nbp_api.get_response_from_url = providers.get_response_from_url
+    yahoo_finance_api.yf = FakeYfinance(providers)
+    goverment_bond.download_goverment_bond_workbook = providers.download_goverment_bond_workbook
+    try:
+        yield providers
+    finally:
+        nbp_api.get_response_from_url, yahoo_finance_api.yf, goverment_bond.download_goverment_bond_workbook = originals
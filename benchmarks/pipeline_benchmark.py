@@ -0,0 +1,193 @@
+"""
+Pipeline benchmark
+
+Runs the Invest Tracker pipeline on a synthetic portfolio with offline fake providers and times every stage:
+bond table refresh, transactions import, FX sync, price sync, investment view, historical values, historical balance and total cost.
+For every stage it reports wall time, rows processed, rows/s and peak memory allocated by Python (tracemalloc).
+
+Results are saved as JSON in benchmarks/results, so two runs can be compared for regressions.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --size small
+    python -m benchmarks.pipeline_benchmark --transactions 5000 --instruments 50 --years 5 --accounts 4 --currencies 4 --bond-series 8
+    python -m benchmarks.pipeline_benchmark --size medium --compare benchmarks/results/pipeline_small_20240101_120000.json
+
+The pipeline runs in a temporary directory, the data base in the repository is never touched.
+"""
+
+
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import invest_tracker_main as tracker
+import interest_goverment_bond as bond_interest
+import goverment_bond_getting_table_of_interest as goverment_bond
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+from benchmarks.synthetic_portfolio import SyntheticPortfolio
+from benchmarks.fake_providers import offline_providers
+
+
+sizes = {
+    "tiny":   dict(transactions=50,    instruments=6,   years=1,  accounts=1,  currencies=3, bond_series=2),
+    "small":  dict(transactions=500,   instruments=20,  years=3,  accounts=2,  currencies=3, bond_series=4),
+    "medium": dict(transactions=2000,  instruments=50,  years=5,  accounts=4,  currencies=4, bond_series=8),
+    "large":  dict(transactions=10000, instruments=200, years=10, accounts=10, currencies=5, bond_series=20),
+}
+results_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class StageTimer:
+
+    def __init__(self, trace_memory: bool=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    def run(self, name: str, function, rows_of=None):
+        """
+        Runs a stage and records its time, rows and peak memory.
+
+        :param rows_of: Function returning the number of rows processed by the stage, called after the stage.
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        function()
+        wall_time = time.perf_counter() - start
+        peak_memory = 0
+        if self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        rows = rows_of() if rows_of else 0
+        stage = {"stage": name,
+                 "wall_time": wall_time,
+                 "rows": rows,
+                 "rows_per_second": rows / wall_time if wall_time > 0 else 0.0,
+                 "peak_memory_mb": peak_memory / 2**20}
+        self.stages.append(stage)
+        print(f"{name:<22} {wall_time:>9.3f} s {rows:>10} rows {stage['rows_per_second']:>12.1f} rows/s {stage['peak_memory_mb']:>9.1f} MB")
+        return stage
+
+
+def count_rows(db, table_name: str):
+    if not db.check_table_exists(table_name):
+        return 0
+    return len(db.get_table(table_name))
+
+def run_pipeline(portfolio, trace_memory: bool=True):
+    """
+    Runs all stages of the pipeline for a portfolio in the current directory.
+
+    :return: (list of stage results, calls of the fake providers)
+    """
+    tracker.db = None
+    bond_interest.conn = None
+    db = tracker.get_database()
+    tracker.initialize_database(db)
+    portfolio.write_transactions_csv("transakcje.csv")
+    fx_currencies = [currency for currency in portfolio.currencies if currency != "PLN"]
+    fx_currencies += [currency for currency in ["USD", "EUR"] if currency not in fx_currencies][:max(0, 2 - len(fx_currencies))]
+    timer = StageTimer(trace_memory)
+
+    with offline_providers(portfolio) as providers:
+        accounts = [tracker.Account(f"Konto {account_id}") for account_id in range(1, portfolio.accounts + 1)]
+        timer.run("bond_table_refresh", lambda: goverment_bond.update_goverment_bond_interest_table(db.name),
+                  lambda: len(portfolio.bond_series))
+        timer.run("import_transactions", lambda: tracker.Transaction.import_transactions_from_csv("transakcje.csv"),
+                  lambda: count_rows(db, "Transactions"))
+        timer.run("fx_sync", lambda: nbp.check_nbp_api_for_new_exchange_rates(fx_currencies),
+                  lambda: count_rows(db, "EXCHANGE_RATE_TABLE"))
+        tickers = [ticker for ticker in portfolio.instruments if ticker not in portfolio.bond_series]
+        timer.run("price_sync", lambda: [yfin.download_historical_data(ticker= ticker, name_of_db= db.name) for ticker in tickers],
+                  lambda: sum(count_rows(db, ticker) for ticker in tickers))
+        timer.run("investment_view", lambda: [account.investment_view_by_type() for account in accounts],
+                  lambda: sum(count_rows(db, f"INVESTMENT_VIEW_ACCOUNT_{account.id}") for account in accounts))
+        timer.run("historical_values", lambda: [account.historical_values_for_investmens_on(db=db, sync_prices=False) for account in accounts],
+                  lambda: sum(count_rows(db, f"ACCOUNT_{account.id}_HISTORICAL_VALUE") for account in accounts))
+        timer.run("historical_balance", lambda: [account.calculate_historical_balance_and_append_to_db(db=db) for account in accounts],
+                  lambda: sum(count_rows(db, f"ACCOUNT_{account.id}_HISTORICAL_VALUE") for account in accounts))
+        timer.run("total_cost", lambda: [account.calculate_historical_total_cost_for(db=db) for account in accounts],
+                  lambda: count_rows(db, "Transactions"))
+    return timer.stages, dict(providers.calls)
+
+def compare(results: dict, previous: dict, threshold: float=0.2):
+    """
+    Prints the change of wall time of every stage against previous results and returns the stages slower by more than threshold.
+    """
+    previous_stages = {stage["stage"]: stage for stage in previous["stages"]}
+    regressions = []
+    print(f"Comparison with {previous.get('created', '?')} ({previous.get('parameters')}):")
+    for stage in results["stages"]:
+        if stage["stage"] not in previous_stages:
+            continue
+        previous_time = previous_stages[stage["stage"]]["wall_time"]
+        change = (stage["wall_time"] - previous_time) / previous_time if previous_time > 0 else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(stage["stage"])
+        print(f"{stage['stage']:<22} {previous_time:>9.3f} s -> {stage['wall_time']:>9.3f} s {change:>+8.1%} {flag}")
+    return regressions
+
+def run_benchmark(parameters: dict, seed: int=0, trace_memory: bool=True, save: bool=True, name: str="custom"):
+    portfolio = SyntheticPortfolio(seed=seed, **parameters)
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="invest_tracker_benchmark_") as directory:
+        os.chdir(directory)
+        try:
+            stages, calls = run_pipeline(portfolio, trace_memory)
+        finally:
+            tracker.db = None
+            bond_interest.conn = None
+            os.chdir(working_directory)
+    results = {"created": datetime.now().isoformat(timespec="seconds"),
+               "name": name,
+               "parameters": dict(parameters, seed=seed),
+               "stages": stages,
+               "total_wall_time": sum(stage["wall_time"] for stage in stages),
+               "provider_calls": calls}
+    if save:
+        os.makedirs(results_directory, exist_ok=True)
+        path = os.path.join(results_directory, f"pipeline_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        results["path"] = path
+        print(f"Results saved to {path}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Invest Tracker pipeline on a synthetic portfolio.")
+    parser.add_argument("--size", choices=sorted(sizes), default=None)
+    for parameter in ["transactions", "instruments", "years", "accounts", "currencies", "bond-series"]:
+        parser.add_argument(f"--{parameter}", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Don't trace memory (tracemalloc slows the stages down).")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", default=None, help="JSON file of previous results to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    args = parser.parse_args()
+
+    parameters = dict(sizes[args.size or "small"])
+    for parameter in parameters:
+        value = getattr(args, parameter)
+        if value is not None:
+            parameters[parameter] = value
+    name = args.size if args.size and parameters == sizes[args.size] else "custom"
+    results = run_benchmark(parameters, args.seed, not args.no_memory, not args.no_save, name)
+    print(f"Total: {results['total_wall_time']:.3f} s, provider calls: {results['provider_calls']}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            previous = json.load(file)
+        if compare(results, previous, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
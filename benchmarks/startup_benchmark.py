@@ -0,0 +1,81 @@
+"""
+Startup benchmark
+
+Imports the modules of the application in a fresh interpreter with `python -X importtime` and reports the import time of every module,
+so a heavy library pulled in at import time is visible at once.
+
+Usage:
+    python -m benchmarks.startup_benchmark [module ...] [--top N] [--repeat N]
+
+By default the `invest_tracker_main` module is measured. The report contains:
+- the total import time of the measured module (best of --repeat runs),
+- the modules with the highest cumulative import time,
+- whether heavy libraries (pandas, numpy, matplotlib, plotly, requests, yfinance) were imported at all.
+"""
+
+
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+heavy_libraries = ("pandas", "numpy", "matplotlib", "plotly", "requests", "yfinance")
+repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_import_time(stderr: str):
+    """
+    Parses the output of `python -X importtime`.
+
+    :return: A dictionary {module_name: (self_time_us, cumulative_time_us)}.
+    :rtype: dict
+    """
+    import_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, module_name = [part.strip() for part in line[len("import time:"):].split("|")]
+        import_times[module_name] = (int(self_time), int(cumulative_time))
+    return import_times
+
+def measure_import_of(module_name: str):
+    """
+    Imports a module in a fresh interpreter and returns its per-module import times.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            cwd=repository_path, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Can't import '{module_name}':\n{result.stderr[-2000:]}")
+    return parse_import_time(result.stderr)
+
+def report(module_name: str, top: int=15, repeat: int=3):
+    runs = [measure_import_of(module_name) for _ in range(repeat)]
+    import_times = min(runs, key=lambda run: run.get(module_name, (0, 0))[1])
+    total = import_times.get(module_name, (0, 0))[1]
+    print(f"Import of '{module_name}': {total / 1000:.1f} ms (best of {repeat})")
+    print(f"{'module':<50} {'self [ms]':>10} {'cumulative [ms]':>16}")
+    for name, (self_time, cumulative_time) in sorted(import_times.items(), key=lambda item: item[1][1], reverse=True)[:top]:
+        print(f"{name:<50} {self_time / 1000:>10.1f} {cumulative_time / 1000:>16.1f}")
+    imported_heavy = [library for library in heavy_libraries if library in import_times]
+    if imported_heavy:
+        print(f"Heavy libraries imported at start: {', '.join(imported_heavy)}")
+    else:
+        print("No heavy libraries imported at start.")
+    return import_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports import time per module.")
+    parser.add_argument("modules", nargs="*", default=["invest_tracker_main"])
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for module_name in args.modules:
+        report(module_name, args.top, args.repeat)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Synthetic portfolio generator
+
+Generates ledgers of any size in the format of `transakcje.csv` together with the market data needed to value them:
+daily close prices of every instrument, NBP exchange rates of every currency and interest tables of government bond series.
+Everything is deterministic for a given seed, so two runs of a benchmark work on the same data.
+
+Classes:
+- SyntheticPortfolio: Instruments, transactions and market data of a synthetic portfolio.
+    - write_transactions_csv(self, path: str): Writes the ledger in the format of `transakcje.csv`.
+    - close_prices(self, ticker: str, start_date: date, end_date: date): DataFrame of daily prices indexed by Date.
+    - exchange_rate(self, currency: str, day: date): NBP mid rate of a currency for a day.
+    - bond_interest_rows(self, prefix: str): Rows of the gov.pl interest table of a bond type.
+"""
+
+
+
+import csv
+import math
+import random
+from datetime import date, timedelta
+
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+
+
+bond_years = {'EDO': 10, 'COI': 4, 'ROS': 6, 'ROD': 12}
+currency_base_rates = {"PLN": 1.0, "USD": 4.0, "EUR": 4.5, "GBP": 5.2, "CHF": 4.6, "JPY": 0.03, "CZK": 0.18}
+csv_columns = ["account_id", "date_of_purchase", "operation_ticker", "type_of_transaction_value", "currency",
+               "number_of_units", "price_of_one_unit", "commission", "yahoo_ticker", "type_of_investment"]
+
+
+class SyntheticPortfolio:
+
+    def __init__(self,
+                 transactions: int = 1000,
+                 instruments: int = 20,
+                 years: int = 3,
+                 accounts: int = 1,
+                 currencies: int = 3,
+                 bond_series: int = 4,
+                 seed: int = 0,
+                 end_date: date = None):
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days = 365 * years)
+        self.accounts = accounts
+        self.seed = seed
+        self.currencies = list(currency_base_rates)[:max(currencies, 1)]
+        self.random = random.Random(seed)
+
+        #Instruments: {ticker: (currency, type_of_investment)}
+        self.instruments: dict = {}
+        self.bond_series: dict = {}     #{series: [interest of year 1, 2, ...]}
+        bond_series = min(bond_series, instruments)
+        for i in range(bond_series):
+            prefix = list(bond_years)[i % len(bond_years)]
+            series = f"{prefix}{(i // len(bond_years)) % 12 + 1:02d}{(33 + i // (12 * len(bond_years))) % 100:02d}"
+            self.instruments[series] = ("PLN", "OBLIGACJE SKARBOWE")
+            self.bond_series[series] = [round(self.random.uniform(0.02, 0.08), 4) for _ in range(bond_years[prefix])]
+        for i in range(instruments - bond_series):
+            self.instruments[f"SYN{i:04d}.WA"] = (self.currencies[i % len(self.currencies)], "ETF")
+
+        self.transactions = self.generate_transactions(transactions)
+
+    def generate_transactions(self, number_of_transactions: int):
+        days = (self.end_date - self.start_date).days
+        tickers = list(self.instruments)
+        transactions = []
+        for _ in range(number_of_transactions):
+            day = self.start_date + timedelta(days = self.random.randrange(max(days, 1)))
+            ticker = self.random.choice(tickers)
+            currency, type_of_investment = self.instruments[ticker]
+            if ticker in self.bond_series:
+                price = 100.0
+            else:
+                price = round(self.price_on(ticker, day), 2)
+            transactions.append({"account_id": self.random.randint(1, self.accounts),
+                                 "date_of_purchase": str(day),
+                                 "operation_ticker": "BUY",
+                                 "type_of_transaction_value": ticker,
+                                 "currency": currency,
+                                 "number_of_units": self.random.randint(1, 50),
+                                 "price_of_one_unit": price,
+                                 "commission": 0,
+                                 "yahoo_ticker": ticker,
+                                 "type_of_investment": type_of_investment})
+        transactions.sort(key=lambda transaction: transaction["date_of_purchase"])
+        return transactions
+
+    def write_transactions_csv(self, path: str):
+        with open(path, 'w', encoding="utf-8", newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=csv_columns, delimiter=';')
+            writer.writeheader()
+            writer.writerows(self.transactions)
+        return path
+
+    def _phase_of(self, name: str):
+        return (sum(ord(char) for char in name) + self.seed) % 97
+
+    def price_on(self, ticker: str, day: date):
+        phase = self._phase_of(ticker)
+        t = day.toordinal()
+        return 50 + phase + 10 * math.sin(t / 40 + phase) + 0.01 * (t - self.start_date.toordinal())
+
+    def close_prices(self, ticker: str, start_date: date, end_date: date):
+        dates = pd.bdate_range(start_date, end_date, name="Date")
+        ordinals = np.array([day.toordinal() for day in dates])
+        phase = self._phase_of(ticker)
+        close = 50 + phase + 10 * np.sin(ordinals / 40 + phase) + 0.01 * (ordinals - self.start_date.toordinal())
+        return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                             "Volume": 1000, "Dividends": 0.0, "Stock Splits": 0.0}, index=dates)
+
+    def exchange_rate(self, currency: str, day: date):
+        base_rate = currency_base_rates.get(currency.upper(), 1.0)
+        return round(base_rate * (1 + 0.05 * math.sin(day.toordinal() / 60 + self._phase_of(currency.upper()))), 4)
+
+    def bond_interest_rows(self, prefix: str):
+        return {series: interests for series, interests in self.bond_series.items() if series[:3] == prefix}
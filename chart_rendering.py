@@ -0,0 +1,219 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Headless chart rendering
+
+Builds the charts of an account (current value by instrument as bar and pie charts, historical balance and total cost as a line chart)
+and writes them to HTML, PNG or JSON files instead of opening a browser, for one or many accounts in parallel.
+
+- Downsampling: Long daily series are reduced to a target number of points with the Largest-Triangle-Three-Buckets (LTTB) algorithm,
+  which keeps the visual shape of the series (peaks and troughs) while the renderer gets a fraction of the points.
+- Cache: Every chart is keyed by a hash of the data it shows. When the data of a chart didn't change since the last render and its files exist,
+  the chart is not built again.
+
+Writing PNG files requires the `kaleido` package.
+
+Functions:
+- lttb(x, y, target_points: int): Returns indices of the points selected by LTTB.
+- downsample_df(df, x_column: str, y_columns: list, target_points: int): Returns rows of df selected by LTTB for every y column.
+- build_account_figures(db, account_id: int, target_points: int): Returns plotly figures of an account.
+- render_account_charts(db, account_id: int, output_dir: str, formats: tuple, target_points: int): Writes charts of an account to files.
+- render_charts_for_accounts(account_ids: list, output_dir: str, formats: tuple, target_points: int, workers: int, database_name: str): Writes charts of many accounts in parallel.
+"""
+
+
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy_import import lazy_module
+import snapshot_export
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+px = lazy_module("plotly.express")
+
+default_target_points = 2000
+cache_file_name = ".chart_cache_account_{account_id}.json"
+
+
+def lttb(x, y, target_points: int):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    :param x: Increasing x values (numbers).
+    :param y: y values.
+    :param target_points: The number of points to keep (at least 3).
+    :return: numpy array of indices of the kept points, always including the first and the last point.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    length = len(x)
+    if target_points >= length or target_points < 3:
+        return np.arange(length)
+
+    indices = np.empty(target_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+    bucket_edges = np.linspace(1, length - 1, target_points - 1).astype(np.int64)
+    selected = 0
+    for bucket in range(target_points - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        next_start, next_end = end, bucket_edges[bucket + 2] if bucket + 2 < len(bucket_edges) else length
+        next_end = max(next_end, next_start + 1)
+        average_x = x[next_start:next_end].mean()
+        average_y = np.nanmean(y[next_start:next_end]) if not np.isnan(y[next_start:next_end]).all() else 0.0
+        bucket_x = x[start:end]
+        bucket_y = np.nan_to_num(y[start:end])
+        areas = np.abs((x[selected] - average_x) * (bucket_y - y[selected]) - (x[selected] - bucket_x) * (average_y - y[selected]))
+        selected = start + int(np.argmax(areas)) if len(areas) else start
+        indices[bucket + 1] = selected
+    return indices
+
+def downsample_df(df, x_column: str, y_columns: list, target_points: int=default_target_points):
+    """
+    Returns the rows of df selected by LTTB for any of the y columns, in the original order.
+    """
+    if target_points is None or len(df) <= target_points:
+        return df
+    x = pd.to_datetime(df[x_column]).map(pd.Timestamp.toordinal).to_numpy()
+    points_per_column = max(target_points // max(len(y_columns), 1), 3)
+    selected = set()
+    for column in y_columns:
+        y = pd.to_numeric(df[column], errors='coerce').to_numpy()
+        selected.update(lttb(x, y, points_per_column).tolist())
+    return df.iloc[sorted(selected)]
+
+def hash_of(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(part, index=True).values.tobytes())
+            digest.update(",".join(map(str, part.columns)).encode())
+        else:
+            digest.update(str(part).encode())
+    return digest.hexdigest()
+
+def get_account_chart_data(db, account_id: int, target_points: int=default_target_points):
+    """
+    Reads the data of the charts of an account.
+
+    :return: A dictionary {chart name: (chart kind, DataFrame)}.
+    """
+    df_view = db.get_table_df(f"INVESTMENT_VIEW_ACCOUNT_{account_id}", 'type_of_transaction_value', 'current_value')
+    df_history = snapshot_export.read_account_history(db, account_id)
+    df_history["total_cost"] = df_history["total_cost"].fillna(method='ffill')
+    df_history = downsample_df(df_history, "Date", ["account_balance", "total_cost"], target_points)
+    return {"current_value_bar": ("bar", df_view),
+            "current_value_pie": ("pie", df_view),
+            "historical_balance": ("line", df_history)}
+
+def build_figure(kind: str, df):
+    if kind == "bar":
+        return px.bar(df, x='type_of_transaction_value', y='current_value')
+    if kind == "pie":
+        return px.pie(df, values='current_value', names='type_of_transaction_value')
+    return px.line(df, x="Date", y=["account_balance", "total_cost"], title='Historical balance')
+
+def build_account_figures(db, account_id: int, target_points: int=default_target_points):
+    """
+    Returns a dictionary {chart name: plotly figure} of an account.
+    """
+    return {name: build_figure(kind, df) for name, (kind, df) in get_account_chart_data(db, account_id, target_points).items()}
+
+def write_figure(fig, path_without_extension: str, output_format: str):
+    path = f"{path_without_extension}.{output_format}"
+    if output_format == "html":
+        fig.write_html(path, include_plotlyjs="cdn")
+    elif output_format == "json":
+        fig.write_json(path)
+    elif output_format == "png":
+        fig.write_image(path)
+    else:
+        raise ValueError(f"Unknown chart format '{output_format}'. Use 'html', 'png' or 'json'.")
+    return path
+
+def load_cache(output_dir: str, account_id: int):
+    path = os.path.join(output_dir, cache_file_name.format(account_id= account_id))
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+def save_cache(output_dir: str, account_id: int, cache: dict):
+    path = os.path.join(output_dir, cache_file_name.format(account_id= account_id))
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(cache, file, indent=1)
+
+def render_account_charts(db, account_id: int, output_dir: str="charts", formats: tuple=("html",), target_points: int=default_target_points):
+    """
+    Writes the charts of an account to files named account_{id}_{chart name}.{format}.
+
+    Charts whose data didn't change since the last render are served from the cache and not built again.
+
+    :return: A dictionary {file path: "rendered" or "cached"}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cache = load_cache(output_dir, account_id)
+    rendered = {}
+    for name, (kind, df) in get_account_chart_data(db, account_id, target_points).items():
+        path_without_extension = os.path.join(output_dir, f"account_{account_id}_{name}")
+        data_hash = hash_of(kind, target_points, df)
+        paths = [f"{path_without_extension}.{output_format}" for output_format in formats]
+        if cache.get(name) == data_hash and all(os.path.isfile(path) for path in paths):
+            rendered.update({path: "cached" for path in paths})
+            continue
+        fig = build_figure(kind, df)
+        for output_format in formats:
+            rendered[write_figure(fig, path_without_extension, output_format)] = "rendered"
+        cache[name] = data_hash
+    save_cache(output_dir, account_id, cache)
+    return rendered
+
+def _render_in_worker(arguments):
+    import invest_tracker_main as tracker
+    database_name, account_id, output_dir, formats, target_points = arguments
+    tracker.db = None
+    return render_account_charts(tracker.get_database(database_name), account_id, output_dir, formats, target_points)
+
+def render_charts_for_accounts(account_ids: list, output_dir: str="charts", formats: tuple=("html",), target_points: int=default_target_points,
+                               workers: int=None, database_name: str="invest_tracker_data_base"):
+    """
+    Writes the charts of many accounts in a pool of worker processes.
+
+    :return: A dictionary {file path: "rendered" or "cached"} of all accounts.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(len(account_ids), 1))
+    arguments = [(database_name, account_id, output_dir, tuple(formats), target_points) for account_id in account_ids]
+    rendered = {}
+    with ProcessPoolExecutor(max_workers= workers, mp_context= multiprocessing.get_context("spawn")) as executor:
+        for result in executor.map(_render_in_worker, arguments):
+            rendered.update(result)
+    return rendered
+
+
+def main():
+    import argparse
+    import invest_tracker_main as tracker
+    parser = argparse.ArgumentParser(description="Writes charts of accounts to files without a browser.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--accounts", type=int, nargs="*", default=None, help="Ids of accounts, defaults to all accounts.")
+    parser.add_argument("--output-dir", default="charts")
+    parser.add_argument("--formats", nargs="+", default=["html"], choices=["html", "png", "json"])
+    parser.add_argument("--target-points", type=int, default=default_target_points)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    account_ids = args.accounts
+    if not account_ids:
+        df_accounts = tracker.get_database(args.database).get_table_df("Accounts", "id")
+        account_ids = [int(account_id) for account_id in df_accounts["id"]]
+    rendered = render_charts_for_accounts(account_ids, args.output_dir, tuple(args.formats), args.target_points, args.workers, args.database)
+    print(f"{list(rendered.values()).count('rendered')} files rendered, {list(rendered.values()).count('cached')} served from cache.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Cross-rate matrix
+
+NBP publishes mid rates of currencies in PLN ('{currency}_PLN' columns of EXCHANGE_RATE_TABLE). Every other pair is derived from them:
+
+    rate[day, from, to] = PLN per unit of from / PLN per unit of to
+
+CrossRateMatrix keeps the PLN mids as a dates x currencies array (one row per calendar day, days without a table take the rate
+of the last published day, like nbp_api.get_exchange_rate) and calculates the whole dates x currencies x currencies array
+with one numpy broadcast. Converting values of many days to any base currency is then an indexing of that array, not a lookup per pair.
+Matrices are cached per data base, currencies and date range. A request for a shorter range or fewer currencies is served
+by a view of a cached matrix, and the cache is dropped when EXCHANGE_RATE_TABLE is written (Database.table_version).
+
+Classes:
+- CrossRateMatrix: Cross rates of currencies for a range of days.
+    - rates(self): Array dates x currencies x currencies.
+    - rate(self, from_currency: str, to_currency: str, day: str): Rate of one pair on one day.
+    - rates_for(self, from_currency: str, to_currency: str, days): Rates of one pair on many days.
+    - convert(self, amounts, from_currency: str, to_currency: str, days): Amounts converted on their days.
+    - select(self, currencies: list, start_date: str, end_date: str): Matrix of fewer currencies or a shorter range.
+
+Functions:
+- load_cross_rates(db, currencies: list, start_date: str, end_date: str, matrix_cache): Builds a CrossRateMatrix from the data base or a MarketMatrixCache.
+- get_cross_rates(db, currencies: list, start_date: str, end_date: str, matrix_cache): Cached load_cross_rates.
+- available_currencies(db): Currencies with a column in EXCHANGE_RATE_TABLE, and PLN.
+"""
+
+
+
+from datetime import date
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+max_cached_matrices = 16
+_cache = {}     #{(data base name, table version): [CrossRateMatrix]}
+
+
+def _forward_filled(values):
+    #Fills NaN of every column with the last value above it, NaN stays before the first value
+    rows = np.arange(len(values))[:, None]
+    last_rows = np.where(np.isnan(values), -1, rows)
+    np.maximum.accumulate(last_rows, axis=0, out=last_rows)
+    filled = np.take_along_axis(values, np.maximum(last_rows, 0), axis=0)
+    filled[last_rows < 0] = np.nan
+    return filled
+
+
+def _place(pln_rates, offsets, values):
+    #Writes quotations (rows of values) to their days (offsets from the first day), the last quotation before the first day fills its gaps
+    values = _forward_filled(values)
+    inside = offsets >= 0
+    pln_rates[offsets[inside]] = values[inside]
+    before = np.flatnonzero(~inside)
+    if len(before):
+        missing = np.isnan(pln_rates[0])
+        pln_rates[0, missing] = values[before[-1], missing]
+
+
+class CrossRateMatrix:
+
+    def __init__(self, dates, currencies: list, pln_rates):
+        self.dates = dates                  #numpy datetime64[D], one per calendar day
+        self.currencies = list(currencies)  #PLN is always one of them
+        self.pln_rates = pln_rates          #dates x currencies, PLN per unit of currency
+        self.positions = {currency: position for position, currency in enumerate(self.currencies)}
+        self._rates = None
+
+    @classmethod
+    def from_pln_rates(cls, dates, currencies: list, pln_rates):
+        """
+        Builds the matrix from PLN mids with gaps (NaN on days without a table), which are filled with the last published rate.
+        """
+        currencies = list(currencies)
+        pln_rates = np.array(pln_rates, dtype=np.float64, ndmin=2).reshape(len(dates), len(currencies))
+        if "PLN" not in currencies:
+            currencies.append("PLN")
+            pln_rates = np.column_stack([pln_rates, np.ones(len(dates))])
+        pln_rates[:, currencies.index("PLN")] = 1.0
+        return cls(np.asarray(dates, dtype="datetime64[D]"), currencies, _forward_filled(pln_rates))
+
+    def rates(self):
+        """
+        Returns the array dates x currencies x currencies, rates()[day, from, to] is the price of one unit of from in units of to.
+        """
+        if self._rates is None:
+            self._rates = self.pln_rates[:, :, None] / self.pln_rates[:, None, :]
+        return self._rates
+
+    def _rows(self, days):
+        days = np.asarray(days, dtype="datetime64[D]")
+        rows = (days - self.dates[0]).astype(np.int64) if len(self.dates) else np.full(days.shape, -1)
+        if np.any((rows < 0) | (rows >= len(self.dates))):
+            raise ValueError(f"Days outside of the cross rates from {self.dates[0] if len(self.dates) else None} to {self.dates[-1] if len(self.dates) else None}.")
+        return rows
+
+    def _position(self, currency: str):
+        if currency not in self.positions:
+            raise ValueError(f"No exchange rates of '{currency}'.")
+        return self.positions[currency]
+
+    def rates_for(self, from_currency: str, to_currency: str, days):
+        """
+        Returns a numpy array of rates of one pair on many days (strings or datetime64).
+        """
+        if from_currency == to_currency:
+            return np.ones(np.shape(days))
+        return self.rates()[self._rows(days), self._position(from_currency), self._position(to_currency)]
+
+    def rate(self, from_currency: str, to_currency: str, day: str):
+        return float(self.rates_for(from_currency, to_currency, [day])[0])
+
+    def convert(self, amounts, from_currency, to_currency: str, days):
+        """
+        Converts amounts to to_currency with the rates of their days. from_currency is one currency or one currency per amount.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if isinstance(from_currency, str):
+            return amounts * self.rates_for(from_currency, to_currency, days)
+        from_positions = np.array([self._position(currency) for currency in from_currency])
+        return amounts * self.rates()[self._rows(days), from_positions, self._position(to_currency)]
+
+    def select(self, currencies: list=None, start_date: str=None, end_date: str=None):
+        """
+        Returns a matrix of the given currencies (and PLN) and days, sharing the arrays of this one when possible.
+        """
+        first = self._rows([start_date])[0] if start_date else 0
+        last = self._rows([end_date])[0] + 1 if end_date else len(self.dates)
+        if currencies is None:
+            selected = CrossRateMatrix(self.dates[first:last], self.currencies, self.pln_rates[first:last])
+            if self._rates is not None:
+                selected._rates = self._rates[first:last]
+            return selected
+        currencies = list(dict.fromkeys(list(currencies) + ["PLN"]))
+        columns = [self._position(currency) for currency in currencies]
+        return CrossRateMatrix(self.dates[first:last], currencies, self.pln_rates[first:last][:, columns])
+
+    def covers(self, currencies: list, start_date: str, end_date: str):
+        return (len(self.dates) > 0 and all(currency in self.positions for currency in currencies)
+                and self.dates[0] <= np.datetime64(start_date, "D") and np.datetime64(end_date, "D") <= self.dates[-1])
+
+
+def available_currencies(db):
+    if not db.check_table_exists("EXCHANGE_RATE_TABLE"):
+        return ["PLN"]
+    return [column[:-len("_PLN")] for column in db.get_column_names("EXCHANGE_RATE_TABLE") if column.endswith("_PLN")] + ["PLN"]
+
+def load_cross_rates(db, currencies: list, start_date: str, end_date: str=None, matrix_cache=None):
+    """
+    Builds the CrossRateMatrix of currencies (PLN is added) for the days from start_date to end_date (today by default).
+    PLN mids are read from the "fx" matrix of matrix_cache when it has all currencies, otherwise from EXCHANGE_RATE_TABLE.
+    """
+    start_date, end_date = str(start_date)[:10], str(end_date or date.today())[:10]
+    dates = np.arange(np.datetime64(start_date, "D"), np.datetime64(end_date, "D") + 1)
+    currencies = [currency for currency in dict.fromkeys(currencies) if currency != "PLN"]
+    pln_rates = np.full((len(dates), len(currencies)), np.nan)
+    if not currencies:
+        return CrossRateMatrix.from_pln_rates(dates, currencies, pln_rates)
+
+    opened = matrix_cache.matrix("fx") if matrix_cache is not None else None
+    if opened is not None and set(currencies) <= set(opened[1]) and len(opened[0]):
+        fx_dates, columns, matrix = opened
+        #Rows before start_date are read too, the matrix has NaN on days without a table and the last quotation may be days before
+        rows = np.arange(int(np.searchsorted(fx_dates, dates[-1], side="right")))
+        values = np.asarray(matrix[rows][:, [columns.index(currency) for currency in currencies]], dtype=np.float64)
+        _place(pln_rates, (fx_dates[rows] - dates[0]).astype(np.int64), values)
+    elif db.check_table_exists("EXCHANGE_RATE_TABLE"):
+        stored = set(db.get_column_names("EXCHANGE_RATE_TABLE"))
+        loaded = [currency for currency in currencies if f"{currency}_PLN" in stored]
+        if loaded:
+            df = db.read_sql(f"""SELECT Date, {', '.join(f'"{currency}_PLN"' for currency in loaded)} FROM EXCHANGE_RATE_TABLE
+                                 WHERE Date >= COALESCE((SELECT MAX(Date) FROM EXCHANGE_RATE_TABLE WHERE Date <= ?), '') AND Date <= ?
+                                 ORDER BY Date""", (start_date, end_date + "~"))
+            days = df["Date"].astype(str).str[:10].to_numpy().astype("datetime64[D]")
+            values = np.full((len(df), len(currencies)), np.nan)
+            for currency in loaded:
+                values[:, currencies.index(currency)] = pd.to_numeric(df[f"{currency}_PLN"], errors='coerce').to_numpy(dtype=np.float64)
+            _place(pln_rates, (days - dates[0]).astype(np.int64), values)
+    return CrossRateMatrix.from_pln_rates(dates, currencies, pln_rates)
+
+def get_cross_rates(db, currencies: list, start_date: str, end_date: str=None, matrix_cache=None):
+    """
+    Returns the CrossRateMatrix of currencies for the days from start_date to end_date, from the cache when a cached matrix covers them.
+    """
+    start_date, end_date = str(start_date)[:10], str(end_date or date.today())[:10]
+    currencies = list(dict.fromkeys(list(currencies) + ["PLN"]))
+    key = (db.name, db.table_version("EXCHANGE_RATE_TABLE"))
+    if key not in _cache:
+        for old_key in [old_key for old_key in _cache if old_key[0] == db.name]:
+            del _cache[old_key]
+    matrices = _cache.setdefault(key, [])
+    for matrix in matrices:
+        if matrix.covers(currencies, start_date, end_date):
+            if set(currencies) == set(matrix.currencies):
+                matrix.rates()      #Calculated once, shorter ranges are views of it
+                return matrix.select(None, start_date, end_date)
+            return matrix.select(currencies, start_date, end_date)
+    matrix = load_cross_rates(db, currencies, start_date, end_date, matrix_cache)
+    matrices.append(matrix)
+    del matrices[:-max_cached_matrices]
+    return matrix
@@ -8,7 +8,12 @@
 
     - create_table(self, table_name: str, *columns): Creates a new table in the database with the specified name and columns.
 
-    - check_table_exists(self, table_name): Checks if a table with the given name already exists in the database.
+    - check_table_exists(self, table_name, schema: str = None): Checks if a table with the given name already exists in the database
+        (or in an attached one).
+
+    - attach_database(self, database_name: str, schema: str): Attaches another SQLite database file under a schema name.
+
+    - detach_database(self, schema: str): Detaches a database attached with attach_database.
 
     - drop_table(self, table_name: str): Drops (deletes) a table from the database.
 
@@ -18,6 +23,8 @@
 
     - is_table_empty(self, table_name: str): Checks if a table is empty.
 
+    - set_journal_mode(self, journal_mode: str = "WAL"): Sets the journal mode of the database file.
+
     - get_table(self, table_name: str): Retrieves all rows from a specified table.
 
     - get_table_df(self, table_name: str, *column_names, sort_col: str = None, sort_order: str = None, where_condition: str = None): 
@@ -34,11 +41,77 @@
 
     - get_last_id(self, table_name: str): Retrieves the last ID from a specified table.
 
+    - get_max_value(self, table_name: str, column_name: str): Retrieves the greatest value of a column using an index seek when possible.
+
+    - get_value(self, query: str, params: tuple = (), default = None): Retrieves the first column of the first row of a query.
+
+    - declare_index(self, table_name: str, *column_names, index_name: str = None, unique: bool = False): Declares an index maintained by the Database object.
+
+    - create_index(self, table_name: str, *column_names, index_name: str = None, unique: bool = False): Creates an index on a table if it doesn't exist.
+
+    - ensure_indexes(self, table_name: str = None): (Re)creates declared indexes on existing tables.
+
+    - get_index_names(self, table_name: str): Retrieves a list of index names for a given table.
+
+    - explain_query_plan(self, query: str, params: tuple = ()): Returns the EXPLAIN QUERY PLAN details of a query.
+
+    - check_query_plans(self, queries: dict): Reports queries which fall back to a full table scan.
+
     - update_data(self, table_name: str, attribute_name: str, attribute_value: str, item_id: int): Updates data in a specified table.
 
     - update_table(self, table_name: str, update_dict, where_dict): Updates rows in a specified table based on given key-value pairs.
 
+    - delete_rows(self, table_name: str, where_dict): Deletes rows of a specified table matching given key-value pairs.
+
+    - execute(self, query: str, params = (), many: bool = False): Executes a writing statement and commits it.
+
+    - transaction(self): Context manager running the statements executed in it in one transaction.
+
+    - add_column(self, table_name: str, column_definition: str): Adds a column to an existing table.
+
+    - create_trigger(self, trigger_name: str, table_name: str, event: str, *statements): Creates a trigger on a table if it doesn't exist.
+
+    - read_sql(self, query: str, params: tuple = ()): Runs a query and returns the result as a pandas DataFrame.
+
+    - read_typed(self, query: str, params: tuple = (), index: str = None, dates: tuple = (), categories: tuple = (), integers: tuple = ()):
+        Runs a query and returns a DataFrame of typed columns (int32 day ordinals, categoricals, int32, float32/float64), read in chunks.
+
+    - write_df(self, df, table_name: str, if_exists: str = "replace"): Writes a pandas DataFrame to a table.
+
+    - enable_instrumentation(cls, slow_query_threshold: float = 0.1): Starts recording duration, rows and caller of every statement of every Database object.
+
+    - disable_instrumentation(cls): Stops recording statements.
+
+    - print_query_summary(cls): Prints per-table read/write counters and the slow query log.
+
+    - enable_low_memory_mode(cls, float_dtype: str = "float32", memory_budget_mb: float = None, chunk_rows: int = 50000): Sets the dtype of
+        numeric columns of typed reads and the memory budget of all typed frames alive at once.
+
+    - disable_low_memory_mode(cls): Typed reads return float64 columns without a budget.
+
+    - enable_cache(self, max_entries: int = 256): Serves repeated read_sql queries (get_table_df, get_table_df_with_conditions) from memory.
+
+    - disable_cache(self): Stops caching query results and drops the cached ones.
+
+    - get_data_version(self): Returns PRAGMA data_version, which changes when another connection commits changes to the data base file.
+
+    - table_version(self, table_name: str): Returns a value which changes after every write to the table, for caches built on top of the data base.
+
     - __del__(self): Closes the database connection when the object is deleted.
+
+    Classes:
+    - QueryStatistics: Per-table read/write counters, per-caller timings and slow query log collected by the instrumentation hook.
+
+    - QueryResultCache: LRU cache of query results keyed by normalized query and parameters, invalidated per table.
+
+    - LowMemoryMode: Float dtype, chunk size and memory budget of typed reads.
+
+    Functions:
+    - date_ordinals(values): Dates (text, datetime64, date) as int32 days since 1970-01-01, missing_date for missing ones.
+
+    - dates_of_ordinals(ordinals): Text dates 'YYYY-MM-DD' of day ordinals.
+
+    - typed_frame(df, float_dtype = None): Converts a DataFrame indexed by dates to the layout of read_typed.
 """  
 
 
@@ -58,11 +131,216 @@
 import sqlite3
 import os
 import os.path
-import pandas as pd
+import re
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+
+#Schema prefixes (main.X, market."X") are skipped, the table is X. Dots are kept in other names, tickers like "SYN0000.WA" are table names
+_TABLE_NAME_PATTERN = re.compile(r"""\b(?:FROM|INTO|UPDATE|JOIN|TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?|INDEX\s.*?\bON)\s+(?:["'`\[]?(?:main|temp)["'`\]]?\.|["'`\[]?\w+["'`\]]?\.(?=["'`\[]))?["'`\[]?([A-Za-z0-9_.=^\-]+)""", re.IGNORECASE)
+_READ_STATEMENTS = ("SELECT", "PRAGMA", "EXPLAIN", "WITH")
+
+#Column kinds of typed reads (Database.read_typed) chosen by the column name
+date_columns = ("Date", "date_of_purchase")
+category_columns = ("yahoo_ticker", "operation_ticker", "currency", "type_of_transaction_value", "type_of_investment")
+integer_columns = ("id", "account_id")
+missing_date = -2**31   #Day ordinal of a missing date (the smallest int32)
+
+
+class QueryStatistics:
+    """
+    Statistics collected by the Database instrumentation hook.
+
+    For every statement it records duration, number of rows returned (or written) and the caller (first frame outside this module).
+    Statements slower than slow_query_threshold seconds are kept in the slow query log.
+    """
+
+    def __init__(self, slow_query_threshold: float=0.1):
+        self.slow_query_threshold = slow_query_threshold
+        self.tables: dict = {}          #{table_name: {"reads", "writes", "rows_read", "rows_written", "time"}}
+        self.callers: dict = {}         #{caller: {"statements", "time"}}
+        self.slow_queries: list = []    #[(duration, rows, caller, query)]
+        self.statements = 0
+        self.total_time = 0.0
+
+    @staticmethod
+    def tables_of(query: str):
+        """
+        Returns the names of tables used by a query.
+        """
+        return list(dict.fromkeys(_TABLE_NAME_PATTERN.findall(query))) or ["<none>"]
+
+    @staticmethod
+    def is_read(query: str):
+        """
+        Returns True if a query only reads from the database.
+        """
+        return query.lstrip().split(" ", 1)[0].upper() in _READ_STATEMENTS
+
+    def record(self, query: str, duration: float, rows: int, caller: str, is_read: bool=None):
+        if is_read is None:
+            is_read = self.is_read(query)
+        self.statements += 1
+        self.total_time += duration
+        for table_name in self.tables_of(query):
+            counters = self.tables.setdefault(table_name, {"reads": 0, "writes": 0, "rows_read": 0, "rows_written": 0, "time": 0.0})
+            if is_read:
+                counters["reads"] += 1
+                counters["rows_read"] += max(rows, 0)
+            else:
+                counters["writes"] += 1
+                counters["rows_written"] += max(rows, 0)
+            counters["time"] += duration
+        caller_counters = self.callers.setdefault(caller, {"statements": 0, "time": 0.0})
+        caller_counters["statements"] += 1
+        caller_counters["time"] += duration
+        if duration >= self.slow_query_threshold:
+            self.slow_queries.append((duration, rows, caller, " ".join(query.split())))
+
+    def summary(self, top: int=10):
+        """
+        Returns the statistics formatted as text.
+        """
+        lines = [f"Statements: {self.statements}, total time: {self.total_time:.3f} s"]
+        lines.append(f"{'table':<40} {'reads':>7} {'writes':>7} {'rows read':>10} {'rows written':>13} {'time [s]':>9}")
+        for table_name, counters in sorted(self.tables.items(), key=lambda item: item[1]["time"], reverse=True):
+            lines.append(f"{table_name:<40} {counters['reads']:>7} {counters['writes']:>7} {counters['rows_read']:>10} {counters['rows_written']:>13} {counters['time']:>9.3f}")
+        lines.append(f"Top {top} callers:")
+        for caller, counters in sorted(self.callers.items(), key=lambda item: item[1]["time"], reverse=True)[:top]:
+            lines.append(f"  {caller:<60} {counters['statements']:>7} {counters['time']:>9.3f}")
+        lines.append(f"Slow queries (>= {self.slow_query_threshold} s): {len(self.slow_queries)}")
+        for duration, rows, caller, query in sorted(self.slow_queries, reverse=True)[:top]:
+            lines.append(f"  {duration:.3f} s, {rows} rows, {caller}: {query[:200]}")
+        return "\n".join(lines)
+
+
+class QueryResultCache:
+    """
+    Cache of DataFrames returned by Database.read_sql.
+
+    Entries are keyed by normalized query and parameters and remember which tables they read,
+    so a write to one table only drops the results which depend on it.
+    The whole cache is dropped when SQLite's PRAGMA data_version shows that another connection changed the file.
+    """
+
+    def __init__(self, max_entries: int=256):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()    #{(query, params): (tables, DataFrame)}
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_of(query: str, params: tuple=()):
+        return " ".join(query.split()), tuple(params or ())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1].copy()
+
+    def put(self, key, tables: list, df):
+        self.entries[key] = (set(tables), df.copy())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, tables: list):
+        tables = set(tables)
+        for key in [key for key, (entry_tables, _) in self.entries.items() if entry_tables & tables]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+
+class LowMemoryMode:
+    """
+    Settings of typed reads (Database.read_typed) shared by every Database object.
+
+    Numeric columns are read as float_dtype. float32 halves them, but keeps only about 7 significant digits
+    (amounts above ~100 000 are not exact to a grosz). Rows are fetched and converted chunk_rows at a time, so the object rows
+    of sqlite3 never exist for the whole result. memory_budget_mb limits the memory of all typed frames alive at once:
+    a read which would exceed it raises MemoryError, the memory of a frame is given back when the frame is garbage collected.
+    """
+
+    def __init__(self, float_dtype: str="float32", memory_budget_mb: float=None, chunk_rows: int=50_000):
+        self.float_dtype = np.dtype(float_dtype)
+        self.memory_budget = None if memory_budget_mb is None else int(memory_budget_mb * 2**20)
+        self.chunk_rows = chunk_rows
+        self.used = 0       #Bytes of typed frames alive and of the read in progress
+        self.peak = 0
+
+    def reserve(self, nbytes: int, query: str):
+        if self.memory_budget is not None and self.used + nbytes > self.memory_budget:
+            raise MemoryError(f"Typed read over the memory budget: {(self.used + nbytes) / 2**20:.1f} MB of {self.memory_budget / 2**20:.1f} MB "
+                              f"({' '.join(query.split())[:100]})")
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+    def release(self, nbytes: int):
+        self.used -= nbytes
+
+    def track(self, df, nbytes: int):
+        weakref.finalize(df, self.release, nbytes)
+
+    def __repr__(self):
+        budget = f"{self.memory_budget / 2**20:.0f} MB" if self.memory_budget is not None else "none"
+        return f"LowMemoryMode(float_dtype={self.float_dtype}, used={self.used / 2**20:.1f} MB, peak={self.peak / 2**20:.1f} MB, budget={budget})"
+
+
+def date_ordinals(values):
+    """
+    Returns a numpy int32 array of days since 1970-01-01 of dates given as text ('YYYY-MM-DD', optionally with a time), datetime64 or date.
+    Missing dates are missing_date.
+    """
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        days = values.astype("datetime64[D]")
+    else:
+        days = np.array([str(value)[:10] if value is not None and value == value and value != "" else "NaT" for value in values.tolist()],
+                        dtype="datetime64[D]")
+    return np.where(np.isnat(days), missing_date, days.astype(np.int64)).astype(np.int32)
+
+def dates_of_ordinals(ordinals):
+    """
+    Returns a pandas Index of text dates 'YYYY-MM-DD' of day ordinals, the layout of the Date columns of the data base.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    days = np.where(ordinals == missing_date, np.datetime64("NaT"), ordinals.astype("datetime64[D]"))
+    return pd.Index(np.datetime_as_string(days, unit="D"), dtype=object, name="Date")
+
+def typed_frame(df, float_dtype=None):
+    """
+    Returns df in the layout of Database.read_typed: the index of dates as int32 day ordinals and numeric columns as float_dtype
+    (low memory mode dtype by default). Frames already in that layout are returned unchanged.
+    """
+    float_dtype = np.dtype(float_dtype or (Database.low_memory.float_dtype if Database.low_memory else np.float64))
+    if df.index.dtype != np.int32:
+        df = df.set_axis(pd.Index(date_ordinals(df.index), name=df.index.name), axis=0)
+    converted = {column: pd.to_numeric(df[column], errors='coerce').astype(float_dtype) for column in df.columns
+                 if not isinstance(df[column].dtype, pd.CategoricalDtype) and df[column].dtype not in (float_dtype, np.int32)}
+    return df.assign(**converted) if converted else df
+
 
 class Database:
 
-    def __init__(self, database_name: str="db"):
+    statistics: QueryStatistics = None    #Shared by every Database object while instrumentation is enabled
+    tracer = None                         #tracing.Tracer counting statements in its current span, set by tracing.enable_tracing()
+    low_memory: LowMemoryMode = None      #Settings of typed reads, set by enable_low_memory_mode()
+
+    def __init__(self, database_name: str="db", timeout: float=5.0):
         """
         Initializes a Database object.
 
@@ -70,6 +348,8 @@ class Database:
 
         :param database_name: The name of the SQLite database file. Defaults to "db".
         :type database_name: str
+        :param timeout: How many seconds to wait for a lock held by another connection before raising an error. Defaults to 5.0.
+        :type timeout: float
         :return: None
         :rtype: None
 
@@ -79,16 +359,22 @@ class Database:
         db = Database("example.db")
         ```
         """        
+        self.declared_indexes: dict = {}    #Indexes maintained by this object {table_name: [(index_name, columns, unique)]}
+        self.trigger_targets: dict = {}     #Tables written by triggers created through this object {table_name: set of tables}
+        self.query_cache: QueryResultCache = None
+        self.table_versions: dict = {}      #Number of writes made through this object {table_name: int}
+        self.attached_schemas: dict = {}    #Databases attached with attach_database {schema: database_name}
+        self._transaction_depth = 0         #Open transaction() blocks, statements aren't committed one by one inside them
         if os.path.isfile(database_name):
             print(f"{database_name} exists in the current directory.")
-            self.conn = sqlite3.connect(database_name)
+            self.conn = sqlite3.connect(database_name, timeout=timeout)
             self.cur = self.conn.cursor()
             self.name = database_name
             print(f"Connected to {database_name}. ")
         else:
             print(f"{database_name} does not exist in the current directory.")
             print(f"Creating {database_name} data base ....................")
-            self.conn = sqlite3.connect(database_name)
+            self.conn = sqlite3.connect(database_name, timeout=timeout)
             self.cur = self.conn.cursor()
             self.name = database_name
             print(f"DONE -> {database_name}  created.")
@@ -112,22 +398,27 @@ class Database:
         db.create_table("employees", "id INTEGER PRIMARY KEY AUTOINCREMENT", "name TEXT", "age INTEGER")
         ```
         """
-        if not self.check_table_exists(table_name):
+        if not self.check_table_exists(table_name, schema="main"):
             column_definition = ', '.join([f"{column}" for column in columns])
             print(f"CREATING -> '{table_name}' in '{self.name}' data base.")
-            self.cur.executescript(f"""CREATE TABLE IF NOT EXISTS '{table_name}' ({column_definition})""")
-            self.conn.commit()
+            self._execute(f"""CREATE TABLE IF NOT EXISTS '{table_name}' ({column_definition})""", commit=True)
             print(f"The {table_name} table has been created.")
+            self.ensure_indexes(table_name)
         else:
             print(f"Table {table_name} exists. Can't create new")
         
 
-    def check_table_exists(self, table_name):
+    def check_table_exists(self, table_name, schema: str=None):
         """
         Checks if a table with the given name already exists in the database.
 
+        Tables of attached databases (attach_database) are found too, like SQLite resolves names of tables in queries,
+        unless schema limits the check to one database ("main" - the file of this object).
+
         :param table_name: The name of the table to check.
         :type table_name: str
+        :param schema: The only schema to check. Defaults to all of them.
+        :type schema: str
         :return: True if the table exists, False otherwise.
         :rtype: bool
 
@@ -140,9 +431,45 @@ class Database:
             print("The 'employees' table does not exist.")
         ```
         """        
-        self.cur.execute(f"""SELECT name FROM sqlite_master WHERE type == 'table' AND name == '{table_name}'""")
-        result = self.cur.fetchone()
-        return True if result else False
+        for name in ([schema] if schema else ["main", *self.attached_schemas]):
+            if self._execute(f"""SELECT name FROM "{name}".sqlite_master WHERE type == 'table' AND name == ?""", (table_name,), fetch="one"):
+                return True
+        return False
+
+    def attach_database(self, database_name: str, schema: str):
+        """
+        Attaches another SQLite database file to the connection under a schema name (ATTACH DATABASE).
+
+        Queries find tables of the attached file by their names when this file has no table of that name.
+        Tables are created, dropped and indexed only in this file.
+
+        :param database_name: The path of the attached database file.
+        :type database_name: str
+        :param schema: The schema name of the attached file, e.g. "market".
+        :type schema: str
+        :return: None
+        :rtype: None
+
+        Example usage:
+        ```python
+        db = Database("invest_tracker_shards/account_1")
+        db.attach_database("invest_tracker_data_base", "market")
+        ```
+        """
+        if schema not in self.attached_schemas:
+            self.conn.commit()      #ATTACH can't run inside a transaction
+            self._execute("ATTACH DATABASE ? AS ?", (database_name, schema))
+            self.attached_schemas[schema] = database_name
+            if self.query_cache is not None:
+                self.query_cache.clear()
+
+    def detach_database(self, schema: str):
+        if schema in self.attached_schemas:
+            self.conn.commit()
+            self._execute(f'DETACH DATABASE "{schema}"')
+            del self.attached_schemas[schema]
+            if self.query_cache is not None:
+                self.query_cache.clear()
     
 
     def drop_table(self, table_name: str):
@@ -162,10 +489,9 @@ class Database:
         db.drop_table("employees")
         ```
         """        
-        if self.check_table_exists(table_name):
+        if self.check_table_exists(table_name, schema="main"):
             print(f"DELETING -> '{table_name}' from '{self.name}' data base.")
-            self.cur.execute(f"""DROP TABLE IF EXISTS {table_name};""")
-            self.conn.commit()
+            self._execute(f"""DROP TABLE IF EXISTS main.{table_name};""", commit=True)
             print("DONE")
         else: 
             print(f"The {table_name} table does not exist.")
@@ -184,8 +510,7 @@ class Database:
         print("Tables in the database:", table_names)
         ```
         """
-        self.cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
-        table_names = [table[0] for table in self.cur.fetchall()]
+        table_names = [table[0] for table in self._execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
         return table_names
     
     def get_column_names(self, table_name: str):
@@ -204,8 +529,7 @@ class Database:
         print("Column names in 'employees' table:", column_names)
         ```
         """
-        self.cur.execute(f"PRAGMA table_info('{table_name}')")
-        columns_names = [column[1] for column in self.cur.fetchall()]
+        columns_names = [column[1] for column in self._execute(f"PRAGMA table_info('{table_name}')")]
         return columns_names
     
     def is_table_empty(self, table_name: str):
@@ -226,10 +550,22 @@ class Database:
             print("The 'employees' table is not empty.")
         ```
         """        
-        self.cur.execute(f"SELECT COUNT(*) FROM '{table_name}'")
-        count = self.cur.fetchone()[0]
+        count = self._execute(f"SELECT COUNT(*) FROM '{table_name}'", fetch="one")[0]
         return count == 0
     
+    def set_journal_mode(self, journal_mode: str="WAL"):
+        """
+        Sets the journal mode of the database file.
+
+        In "WAL" mode readers don't block the writer, which lets several processes work on one file at once.
+
+        :param journal_mode: The journal mode, e.g. "WAL" or "DELETE".
+        :type journal_mode: str
+        :return: The journal mode in effect.
+        :rtype: str
+        """
+        return self._execute(f"PRAGMA journal_mode={journal_mode}", fetch="one")[0]
+
     def get_table(self, table_name: str):
         """
         Retrieves all rows from a specified table.
@@ -246,8 +582,7 @@ class Database:
         print("Data from 'employees' table:", table_data)
         ```
         """        
-        self.cur.execute(f"SELECT * FROM '{table_name}'")
-        table_data = self.cur.fetchall()
+        table_data = self._execute(f"SELECT * FROM '{table_name}'")
         return table_data
 
     def get_table_df(self, table_name: str, *column_names, sort_col: str=None, sort_order: str=None, where_condition: str=None):
@@ -289,7 +624,7 @@ class Database:
                 raise ValueError("sort_order must be 'asc' or 'desc'")
 
         print(query)
-        table_df = pd.read_sql_query(query, self.conn)
+        table_df = self.read_sql(query)
         return table_df
     
     def get_table_df_with_conditions(self, table_name: str, *column_names, condition_operator: str="AND", limit: int=None, **kwargs): 
@@ -339,9 +674,162 @@ class Database:
         if limit:
             query += f" LIMIT {limit}"
         print(query)
-        result_df = pd.read_sql(query, self.conn)
+        result_df = self.read_sql(query)
         return result_df
         
+    def read_sql(self, query: str, params: tuple=()):
+        """
+        Runs a query and returns the result as a pandas DataFrame.
+
+        :param query: The SQL query to run.
+        :type query: str
+        :param params: Parameters bound to the query placeholders.
+        :type params: tuple
+        :return: A DataFrame containing the query result.
+        :rtype: pd.DataFrame
+        """
+        if self.query_cache is not None:
+            self._check_data_version()
+            key = QueryResultCache.key_of(query, params)
+            result_df = self.query_cache.get(key)
+            if result_df is not None:
+                return result_df
+        start = time.perf_counter()
+        result_df = pd.read_sql_query(query, self.conn, params=params or None)
+        self._record(query, start, len(result_df), is_read=True)
+        if self.query_cache is not None:
+            self.query_cache.put(key, QueryStatistics.tables_of(query), result_df)
+        return result_df
+
+    def read_typed(self, query: str, params: tuple=(), index: str=None, dates: tuple=(), categories: tuple=(), integers: tuple=()):
+        """
+        Runs a query and returns the result as a pandas DataFrame of typed columns instead of object columns.
+
+        Rows are fetched and converted in chunks (LowMemoryMode.chunk_rows) and counted against the memory budget of the low memory mode.
+        Columns of dates (date_columns and dates) become int32 days since 1970-01-01, columns of names (category_columns and categories)
+        become pandas Categoricals, columns of ids (integer_columns and integers) become int32 and other columns become floats
+        of the low memory mode dtype (float64 without it), text which isn't a number becoming NaN. Other columns of text are Categoricals.
+        Results are not cached.
+
+        :param query: The SQL query to run.
+        :type query: str
+        :param params: Parameters bound to the query placeholders.
+        :type params: tuple
+        :param index: The column set as the index of the DataFrame.
+        :type index: str
+        :param dates: More columns of dates.
+        :param categories: More columns of names.
+        :param integers: More columns of integers without NULL.
+        :return: The typed DataFrame.
+        :rtype: pd.DataFrame
+        :raises MemoryError: If the result doesn't fit in the memory budget.
+
+        Example usage:
+        ```python
+        Database.enable_low_memory_mode(float_dtype="float32", memory_budget_mb=512)
+        df = db.read_typed("SELECT Date, Close FROM 'AAPL' WHERE Date >= ?", ("2023-01-01",), index="Date")
+        ```
+        """
+        mode = Database.low_memory
+        float_dtype = mode.float_dtype if mode is not None else np.dtype(np.float64)
+        start = time.perf_counter()
+        cursor = self.conn.cursor()     #A cursor of its own, fetching in chunks while other statements run
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        kinds = None
+        parts = [[] for _ in columns]
+        codes_of = [{} for _ in columns]    #{category: code} of every categorical column
+        reserved = 0
+        rows = 0
+        try:
+            while True:
+                chunk = cursor.fetchmany(mode.chunk_rows if mode is not None else 50_000)
+                if not chunk:
+                    break
+                values_of_columns = list(zip(*chunk))
+                if kinds is None:
+                    kinds = [self._kind_of(column, values, dates, categories, integers) for column, values in zip(columns, values_of_columns)]
+                arrays = [self._typed_array(values, kind, float_dtype, codes) for values, kind, codes in zip(values_of_columns, kinds, codes_of)]
+                nbytes = sum(array.nbytes for array in arrays)
+                if mode is not None:
+                    mode.reserve(nbytes, query)
+                reserved += nbytes
+                for part, array in zip(parts, arrays):
+                    part.append(array)
+                rows += len(chunk)
+        except BaseException:
+            if mode is not None:
+                mode.release(reserved)
+            raise
+        finally:
+            cursor.close()
+
+        data = {}
+        for column, kind, part, codes in zip(columns, kinds or [None] * len(columns), parts, codes_of):
+            array = np.concatenate(part) if part else np.array([], dtype=np.int32 if kind in ("date", "integer") else float_dtype)
+            data[column] = pd.Categorical.from_codes(array, categories=list(codes)) if kind == "category" else array
+        result_df = pd.DataFrame(data, columns=columns)
+        if index is not None:
+            result_df = result_df.set_index(index)
+        if mode is not None:
+            mode.track(result_df, reserved)
+        self._record(query, start, rows, is_read=True)
+        return result_df
+
+    @staticmethod
+    def _kind_of(column: str, values: tuple, dates: tuple, categories: tuple, integers: tuple):
+        if column in dates or column in date_columns:
+            return "date"
+        if column in categories or column in category_columns:
+            return "category"
+        if column in integers or column in integer_columns:
+            return "integer"
+        for value in values:
+            if isinstance(value, str):
+                try:
+                    float(value)
+                except ValueError:
+                    return "category"
+        return "float"
+
+    @staticmethod
+    def _typed_array(values: tuple, kind: str, float_dtype, codes: dict):
+        if kind == "date":
+            return date_ordinals(values)
+        if kind == "category":
+            return np.fromiter((-1 if value is None else codes.setdefault(value, len(codes)) for value in values), dtype=np.int32, count=len(values))
+        if kind == "integer":
+            return np.array(values, dtype=np.int32)
+        try:
+            return np.array(values, dtype=float_dtype)     #None becomes NaN
+        except (TypeError, ValueError):
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float_dtype)
+
+    def write_df(self, df, table_name: str, if_exists: str="replace", index: bool=True):
+        """
+        Writes a pandas DataFrame to a table (pandas `to_sql`).
+
+        Declared indexes of the table are recreated after the table is replaced.
+
+        :param df: The DataFrame to write.
+        :type df: pd.DataFrame
+        :param table_name: The name of the table.
+        :type table_name: str
+        :param if_exists: "replace", "append" or "fail", as in pandas `to_sql`.
+        :type if_exists: str
+        :param index: Whether to write the DataFrame index as a column.
+        :type index: bool
+        :return: None
+        :rtype: None
+        """
+        start = time.perf_counter()
+        df.to_sql(table_name, self.conn, if_exists=if_exists, index=index)
+        self.conn.commit()
+        self._record(f"INSERT INTO {table_name} /* to_sql if_exists={if_exists} */", start, len(df), is_read=False)
+        self._invalidate_cache([table_name])
+        if if_exists == "replace":
+            self.ensure_indexes(table_name)
+
     def insert_row(self, table_name: str, *values):
         """
         Insert a new row into the specified table in the database.
@@ -351,8 +839,8 @@ class Database:
         :param values: The values to insert into the columns of the new row.
                        Can be a tuple of values for a single row, or a list of tuples for multiple rows.
         :type values: Tuple or List[Tuple]
-        :return: None
-        :rtype: None
+        :return: The rowid of the last inserted row.
+        :rtype: int
 
         Example usage:
         >>> insert_row('mytable', ('value1', 'value2', 'value3'))
@@ -362,10 +850,13 @@ class Database:
         
         if isinstance(values[0], list):
             for item in values[0]:
-                self.cur.execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in item])})", item)
+                self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in item])})", item, fetch=None)
+        elif len(values) == 1:
+            self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values[0], fetch=None)
         else:
-            self.cur.executemany(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values)
+            self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values, fetch=None, many=True)
         self.conn.commit()
+        return self.cur.lastrowid
 
     def insert(self, table_name: str, *values):
         """
@@ -378,13 +869,13 @@ class Database:
         :param values: Values to insert into the columns of the new row(s).
                     Can be a tuple of values for a single row or a list of tuples for multiple rows.
         :type values: Tuple or List[Tuple]
-        :return: None
-        :rtype: None
+        :return: The rowid of the last inserted row.
+        :rtype: int
 
         Example usage:
         ```python
         # Inserting a single row into a table named "employees"
-        db.insert("employees", ('Jan Kowalski', 30, 'Software Engineer'))
+        row_id = db.insert("employees", ('Jan Kowalski', 30, 'Software Engineer'))
 
         # Inserting multiple rows into a table named "employees"
         db.insert("employees", ('Ala Nowak', 25, 'Data Scientist'), ('Krzysztof Skoczylas', 35, 'Manager'))
@@ -393,10 +884,13 @@ class Database:
 
         if isinstance(values[0], list):
             for item in values[0]:
-                self.cur.execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in item])})", item)
+                self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in item])})", item, fetch=None)
+        elif len(values) == 1:
+            self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values[0], fetch=None)
         else:
-            self.cur.executemany(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values)
+            self._execute(f"INSERT INTO {table_name} VALUES({','.join(['?' for _ in values[0]])})", values, fetch=None, many=True)
         self.conn.commit()
+        return self.cur.lastrowid
 
     def get_first_row_value(self, table_name: str, *column_names):
         """       
@@ -415,8 +909,7 @@ class Database:
             column_string = "*"
 
         query = f"SELECT {column_string} FROM {table_name} ORDER BY rowid ASC LIMIT 1"
-        self.cur.execute(query)
-        result = self.cur.fetchone()
+        result = self._execute(query, fetch="one")
         if len(result) == 1:
             result = result[0]
         return result    
@@ -438,8 +931,7 @@ class Database:
             column_string = "*"
             
         query = f"SELECT {column_string} FROM {table_name} ORDER BY rowid DESC LIMIT 1"
-        self.cur.execute(query)
-        result = self.cur.fetchone()
+        result = self._execute(query, fetch="one")
         if len(result) == 1:
             result = result[0]
         return result        
@@ -449,6 +941,7 @@ class Database:
         Retrieves the last inserted ID (primary key) in the specified table.
 
         Note: This assumes the table has an 'id' column or a column with auto-incrementing values.
+        The value is read with MAX(id), which is a single seek on the INTEGER PRIMARY KEY instead of reading the whole column.
 
         :param table_name: The name of the table to retrieve the last ID from.
         :type table_name: str
@@ -462,10 +955,172 @@ class Database:
         print("Last inserted ID in 'employees' table:", last_id)
         ```
         """        
-        self.cur.execute(f"SELECT id FROM {table_name}")
-        last_id = self.cur.fetchall()[-1][0]
+        last_id = self._execute(f"SELECT MAX(id) FROM '{table_name}'", fetch="one")[0]
         return last_id  
 
+    def get_max_value(self, table_name: str, column_name: str):
+        """
+        Retrieves the greatest value stored in a column of the specified table.
+
+        If the column is the first column of an index (for example a date column of the rate or price tables), SQLite answers it with a single index seek.
+
+        :param table_name: The name of the table to read from.
+        :type table_name: str
+        :param column_name: The name of the column.
+        :type column_name: str
+        :return: The greatest value in the column or None if the table is empty.
+
+        Example usage:
+        ```python
+        # Retrieving the newest date from a table named "EXCHANGE_RATE_TABLE"
+        last_date = db.get_max_value("EXCHANGE_RATE_TABLE", "Date")
+        ```
+        """
+        return self._execute(f"""SELECT MAX("{column_name}") FROM '{table_name}'""", fetch="one")[0]
+
+    def get_value(self, query: str, params: tuple=(), default=None):
+        """
+        Retrieves the first column of the first row of a query, without building a DataFrame.
+
+        :param query: The SQL query with ? placeholders.
+        :type query: str
+        :param params: Values of the placeholders.
+        :type params: tuple
+        :param default: Returned when the query has no rows or the value is NULL.
+        :return: The value.
+
+        Example usage:
+        ```python
+        salary = db.get_value("SELECT salary FROM employees WHERE id = ?", (1,), default=0)
+        ```
+        """
+        row = self._execute(query, params, fetch="one")
+        if row is None or row[0] is None:
+            return default
+        return row[0]
+
+    def declare_index(self, table_name: str, *column_names, index_name: str=None, unique: bool=False):
+        """
+        Declares an index which is maintained by the Database object.
+
+        Declared indexes are created immediately if the table exists and recreated by create_table and ensure_indexes,
+        so they survive tables being dropped and rebuilt.
+
+        :param table_name: The name of the table to index.
+        :type table_name: str
+        :param column_names: The names of the indexed columns, in index order.
+        :type column_names: str
+        :param index_name: The name of the index. Defaults to "ix_{table_name}_{column_names}".
+        :type index_name: str
+        :param unique: Whether the index should be UNIQUE.
+        :type unique: bool
+        :return: The name of the index.
+        :rtype: str
+
+        Example usage:
+        ```python
+        db.declare_index("Transactions", "account_id", "yahoo_ticker", "date_of_purchase")
+        ```
+        """
+        if index_name is None:
+            index_name = f"ix_{table_name}_{'_'.join(column_names)}"
+        declared = self.declared_indexes.setdefault(table_name, [])
+        if index_name not in [name for name, _, _ in declared]:
+            declared.append((index_name, column_names, unique))
+        if self.check_table_exists(table_name, schema="main"):
+            self.create_index(table_name, *column_names, index_name=index_name, unique=unique)
+        return index_name
+
+    def create_index(self, table_name: str, *column_names, index_name: str=None, unique: bool=False):
+        """
+        Creates an index on the specified table if it doesn't exist yet.
+
+        :param table_name: The name of the table to index.
+        :type table_name: str
+        :param column_names: The names of the indexed columns, in index order.
+        :type column_names: str
+        :param index_name: The name of the index. Defaults to "ix_{table_name}_{column_names}".
+        :type index_name: str
+        :param unique: Whether the index should be UNIQUE.
+        :type unique: bool
+        :return: The name of the index.
+        :rtype: str
+        """
+        if index_name is None:
+            index_name = f"ix_{table_name}_{'_'.join(column_names)}"
+        columns_string = ", ".join([f'"{column}"' for column in column_names])
+        unique_string = "UNIQUE " if unique else ""
+        self._execute(f"""CREATE {unique_string}INDEX IF NOT EXISTS "{index_name}" ON '{table_name}' ({columns_string})""", commit=True)
+        return index_name
+
+    def ensure_indexes(self, table_name: str=None):
+        """
+        Creates every declared index whose table exists.
+
+        Tables rewritten with pandas `to_sql(if_exists="replace")` lose their indexes, so this should be called after such rewrites.
+
+        :param table_name: Limit the check to one table. Defaults to all declared tables.
+        :type table_name: str
+        :return: None
+        :rtype: None
+        """
+        tables = [table_name] if table_name else list(self.declared_indexes)
+        for table in tables:
+            if table not in self.declared_indexes or not self.check_table_exists(table, schema="main"):
+                continue
+            for index_name, column_names, unique in self.declared_indexes[table]:
+                self.create_index(table, *column_names, index_name=index_name, unique=unique)
+
+    def get_index_names(self, table_name: str):
+        """
+        Retrieves a list of index names for a given table.
+
+        :param table_name: The name of the table.
+        :type table_name: str
+        :return: A list containing the names of indexes of the specified table.
+        :rtype: list
+        """
+        return [index[0] for index in self._execute("SELECT name FROM sqlite_master WHERE type == 'index' AND tbl_name == ?", (table_name,))]
+
+    def explain_query_plan(self, query: str, params: tuple=()):
+        """
+        Returns the steps of EXPLAIN QUERY PLAN for a query.
+
+        :param query: The SQL query to explain.
+        :type query: str
+        :param params: Parameters bound to the query placeholders.
+        :type params: tuple
+        :return: A list of plan details, e.g. ["SEARCH Transactions USING INDEX ix_Transactions_account_id (account_id=?)"].
+        :rtype: list
+        """
+        return [row[-1] for row in self._execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+    def check_query_plans(self, queries: dict):
+        """
+        Reports queries which fall back to a full table scan.
+
+        A step is reported when its plan detail is a plain "SCAN <table>" - scans over an index or of temporary b-trees are not reported.
+
+        :param queries: A dictionary {query_name: query} or {query_name: (query, params)}.
+        :type queries: dict
+        :return: A dictionary {query_name: [plan details with full scans]} containing only the offending queries.
+        :rtype: dict
+
+        Example usage:
+        ```python
+        full_scans = db.check_query_plans({"units": ("SELECT * FROM Transactions WHERE account_id = ?", (1,))})
+        ```
+        """
+        full_scans = {}
+        for query_name, query in queries.items():
+            query, params = query if isinstance(query, tuple) else (query, ())
+            details = self.explain_query_plan(query, params)
+            scans = [detail for detail in details if detail.startswith("SCAN") and "USING" not in detail and "CONSTANT ROW" not in detail]
+            if scans:
+                full_scans[query_name] = scans
+                print(f"FULL SCAN -> '{query_name}': {'; '.join(scans)}")
+        return full_scans
+
     def update_data(self, table_name: str, attribute_name: str, attribute_value: str, item_id: int):
         """
         Updates a specific attribute in a row of the specified table.
@@ -487,8 +1142,7 @@ class Database:
         db.update_data("employees", "age", "35", 1)
         ```
         """
-        self.cur.execute(f"UPDATE {table_name} set {attribute_name} = {attribute_value} where id = {item_id}")
-        self.conn.commit()
+        self._execute(f"UPDATE {table_name} set {attribute_name} = {attribute_value} where id = {item_id}", commit=True)
 
     def update_table(self, table_name: str, update_dict, where_dict):
         """
@@ -503,8 +1157,278 @@ class Database:
         sql = f"UPDATE '{table_name}' SET {update_str} WHERE {where_str}"
         print(sql)
         values = tuple(update_dict.values()) + tuple(where_dict.values())
-        self.cur.execute(sql, values)
-        self.conn.commit()
+        self._execute(sql, values, commit=True)
+
+    def delete_rows(self, table_name: str, where_dict):
+        """
+        Deletes the rows of the specified table matching all given key-value pairs.
+
+        :param table_name: The name of the table.
+        :param where_dict: A dictionary of key-value pairs that determine which rows to delete.
+        :return: The number of deleted rows.
+        :rtype: int
+        """
+        where_str = ' AND '.join([f'"{key}" = ?' for key in where_dict.keys()])
+        self._execute(f"DELETE FROM '{table_name}' WHERE {where_str}", tuple(where_dict.values()), commit=True)
+        return self.cur.rowcount
+
+    def execute(self, query: str, params=(), many: bool=False):
+        """
+        Executes a writing statement (e.g. INSERT ... SELECT, UPDATE with a subquery) and commits it.
+        Cached results of the written tables are dropped.
+
+        :param query: The SQL statement with ? placeholders.
+        :type query: str
+        :param params: Values of the placeholders, or a sequence of rows with many=True.
+        :param many: Execute the statement once per row of params (executemany).
+        :type many: bool
+        :return: The number of changed rows.
+        :rtype: int
+
+        Example usage:
+        ```python
+        db.execute("UPDATE employees SET salary = salary * ? WHERE department = ?", (1.05, "sales"))
+        ```
+        """
+        self._execute(query, params, fetch=None, many=many, commit=True)
+        return self.cur.rowcount
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the statements executed in the block (execute, insert, delete_rows, ...) in one transaction.
+        It is committed at the end of the block and rolled back when the block raises, so readers never see a part of the changes.
+
+        Example usage:
+        ```python
+        with db.transaction():
+            db.execute("DELETE FROM employees WHERE department = ?", ("sales",))
+            db.execute("INSERT INTO employees (name, department) VALUES (?, ?)", ("Anna", "sales"))
+        ```
+        """
+        if not self._transaction_depth:
+            self.conn.commit()
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self.conn.rollback()
+            raise
+        self._transaction_depth -= 1
+        if not self._transaction_depth:
+            self.conn.commit()
+
+    def add_column(self, table_name: str, column_definition: str):
+        """
+        Adds a column to an existing table.
+
+        :param table_name: The name of the table.
+        :type table_name: str
+        :param column_definition: The name of the new column and optionally its type, e.g. "'age' INTEGER".
+        :type column_definition: str
+        :return: None
+        :rtype: None
+        """
+        self._execute(f"ALTER TABLE '{table_name}' ADD COLUMN {column_definition}", commit=True)
+
+    def create_trigger(self, trigger_name: str, table_name: str, event: str, *statements):
+        """
+        Creates a FOR EACH ROW trigger on the specified table if it doesn't exist yet.
+
+        Tables written by the trigger are remembered, so writes to table_name also drop cached results of those tables.
+
+        :param trigger_name: The name of the trigger.
+        :type trigger_name: str
+        :param table_name: The name of the table the trigger is attached to.
+        :type table_name: str
+        :param event: When the trigger fires, e.g. "AFTER INSERT" or "AFTER UPDATE OF price, amount".
+        :type event: str
+        :param statements: SQL statements of the trigger body, which can refer to NEW and OLD rows.
+        :type statements: str
+        :return: The name of the trigger.
+        :rtype: str
+
+        Example usage:
+        ```python
+        db.create_trigger("employees_log_insert", "employees", "AFTER INSERT",
+                          "INSERT INTO employees_log (employee_id, action) VALUES (NEW.id, 'insert')")
+        ```
+        """
+        body = " ".join([f"{statement.strip().rstrip(';')};" for statement in statements])
+        self._execute(f"""CREATE TRIGGER IF NOT EXISTS "{trigger_name}" {event} ON '{table_name}' FOR EACH ROW BEGIN {body} END""", commit=True)
+        targets = self.trigger_targets.setdefault(table_name, set())
+        for statement in statements:
+            targets.update(table for table in QueryStatistics.tables_of(statement) if table != "<none>")
+        return trigger_name
+
+    def _execute(self, query: str, params=(), fetch: str="all", many: bool=False, commit: bool=False):
+        """
+        Executes a statement on the cursor of this object and records it when instrumentation is enabled.
+
+        :param fetch: "all" returns fetchall(), "one" returns fetchone(), None returns nothing. Statements without a result set return None.
+        :param many: Use executemany with params being a sequence of rows.
+        :param commit: Commit the transaction after the statement.
+        """
+        start = time.perf_counter()
+        if many:
+            self.cur.executemany(query, params)
+        else:
+            self.cur.execute(query, params)
+        if self.cur.description is None:
+            result = None
+            rows = self.cur.rowcount
+        elif fetch == "all":
+            result = self.cur.fetchall()
+            rows = len(result)
+        elif fetch == "one":
+            result = self.cur.fetchone()
+            rows = 0 if result is None else 1
+        else:
+            result = None
+            rows = self.cur.rowcount
+        if commit and not self._transaction_depth:
+            self.conn.commit()
+        self._record(query, start, rows)
+        if result is None and not QueryStatistics.is_read(query):
+            self._invalidate_cache(QueryStatistics.tables_of(query))
+        return result
+
+    def _invalidate_cache(self, tables: list):
+        tables = list(tables) + [target for table in tables for target in self.trigger_targets.get(table, ())]
+        for table in tables:
+            self.table_versions[table] = self.table_versions.get(table, 0) + 1
+        if self.query_cache is not None:
+            self.query_cache.invalidate(tables)
+            self.query_cache.data_version = self._data_version()
+
+    def table_version(self, table_name: str):
+        """
+        Returns a value which changes whenever the table is written through this object (also by triggers created with create_trigger)
+        or the data base file is changed by another connection.
+
+        :param table_name: The name of the table.
+        :type table_name: str
+        :return: A tuple (number of writes through this object, PRAGMA data_version).
+        :rtype: tuple
+        """
+        return self.table_versions.get(table_name, 0), self._data_version()
+
+    def get_data_version(self):
+        """
+        Returns PRAGMA data_version of the connection. The value changes when another connection commits changes to the data base file.
+
+        :return: The data version.
+        :rtype: int
+        """
+        return self._data_version()
+
+    def _data_version(self):
+        if not self.attached_schemas:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+        #Commits of other connections to attached files change the results of queries too
+        return tuple(self.conn.execute(f'PRAGMA "{schema}".data_version').fetchone()[0] for schema in ["main", *self.attached_schemas])
+
+    def _check_data_version(self):
+        data_version = self._data_version()
+        if data_version != self.query_cache.data_version:
+            self.query_cache.clear()
+            self.query_cache.data_version = data_version
+
+    def enable_cache(self, max_entries: int=256):
+        """
+        Serves repeated read_sql queries (get_table_df, get_table_df_with_conditions) from memory.
+
+        Results are keyed by normalized query and parameters. Writes made through this object drop the results of the written tables,
+        changes committed by other connections (PRAGMA data_version) drop the whole cache.
+        Cached DataFrames are returned as copies, so callers can modify them.
+
+        :param max_entries: The maximum number of cached results, least recently used ones are dropped first.
+        :type max_entries: int
+        :return: The cache object.
+        :rtype: QueryResultCache
+        """
+        self.query_cache = QueryResultCache(max_entries)
+        self.query_cache.data_version = self._data_version()
+        return self.query_cache
+
+    def disable_cache(self):
+        """
+        Stops caching query results and drops the cached ones.
+        """
+        self.query_cache = None
+
+    def _record(self, query: str, start: float, rows: int, is_read: bool=None):
+        if Database.tracer is not None:
+            Database.tracer.count("db_statements")
+            Database.tracer.count("db_rows", rows if rows and rows > 0 else 0)
+        statistics = Database.statistics
+        if statistics is None:
+            return
+        duration = time.perf_counter() - start
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        caller = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}" if frame else "<unknown>"
+        statistics.record(query, duration, rows, caller, is_read)
+
+    @classmethod
+    def enable_instrumentation(cls, slow_query_threshold: float=0.1):
+        """
+        Starts recording duration, rows returned and caller of every statement executed by any Database object.
+
+        :param slow_query_threshold: Statements slower than this number of seconds are kept in the slow query log.
+        :type slow_query_threshold: float
+        :return: The statistics object which collects the records.
+        :rtype: QueryStatistics
+
+        Example usage:
+        ```python
+        Database.enable_instrumentation(slow_query_threshold=0.05)
+        ...
+        Database.print_query_summary()
+        ```
+        """
+        cls.statistics = QueryStatistics(slow_query_threshold)
+        return cls.statistics
+
+    @classmethod
+    def disable_instrumentation(cls):
+        """
+        Stops recording statements and returns the collected statistics.
+        """
+        statistics, cls.statistics = cls.statistics, None
+        return statistics
+
+    @classmethod
+    def enable_low_memory_mode(cls, float_dtype: str="float32", memory_budget_mb: float=None, chunk_rows: int=50_000):
+        """
+        Sets the settings of typed reads (read_typed) of every Database object.
+
+        :param float_dtype: The dtype of numeric columns, "float32" or "float64".
+        :param memory_budget_mb: The most memory of typed frames alive at once, None - no limit.
+        :param chunk_rows: The number of rows fetched and converted at once.
+        :return: The settings.
+        :rtype: LowMemoryMode
+        """
+        cls.low_memory = LowMemoryMode(float_dtype, memory_budget_mb, chunk_rows)
+        return cls.low_memory
+
+    @classmethod
+    def disable_low_memory_mode(cls):
+        stopped, cls.low_memory = cls.low_memory, None
+        return stopped
+
+    @classmethod
+    def print_query_summary(cls, top: int=10):
+        """
+        Prints per-table read/write counters, the most expensive callers and the slow query log.
+        """
+        if cls.statistics is None:
+            print("Instrumentation is disabled.")
+        else:
+            print(cls.statistics.summary(top))
 
     def __del__(self):
         self.conn.close()
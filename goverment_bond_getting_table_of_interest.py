@@ -16,6 +16,8 @@ This Python script serves module for  retrieves data from a specified URL, proce
 
 - Printing Status: A confirmation message is displayed, indicating the successful update of the government bond interest table.
 
+- Importing the module does nothing - the workbook is downloaded when update_goverment_bond_interest_table() is called.
+
 [###############100%###############] Successfully updated the government bond interest table
 
 Note:
@@ -49,117 +51,59 @@ Note:
 
 
 import sqlite3 as sql
-import pandas as pd
 import csv
-import requests
 from datetime import date, timedelta, datetime
+from lazy_import import lazy_module
+import tracing
 
+pd = lazy_module("pandas")
+requests = lazy_module("requests")
 
-con = sql.connect("invest_tracker_data_base")
 
 #csv_url = 'https://api.dane.gov.pl/resources/44360,sprzedaz-obligacji-detalicznych/file'
 csv_url = 'https://www.gov.pl/attachment/428159cf-4d04-4bf2-975e-fd79d6b8f621'
 #csv_url = 'https://api.dane.gov.pl/media/resources/20230117/Dane_dotyczace_obligacji_detalicznych.xls'
 
-
-s = requests.get(csv_url).content
-xl = pd.ExcelFile(s)
-
-
-edo = xl.parse('EDO')
-dict_name = {'Seria':'seria',
-             'Oprocentowanie':'oprocentowanie_1rok',
-             'Unnamed: 10':'oprocentowanie_2rok',
-             'Unnamed: 11':'oprocentowanie_3rok',
-             'Unnamed: 12':'oprocentowanie_4rok',
-             'Unnamed: 13':'oprocentowanie_5rok',
-             'Unnamed: 14':'oprocentowanie_6rok',
-             'Unnamed: 15':'oprocentowanie_7rok',
-             'Unnamed: 16':'oprocentowanie_8rok',
-             'Unnamed: 17':'oprocentowanie_9rok',
-             'Unnamed: 18':'oprocentowanie_10rok',}
-edo = edo.rename(columns= dict_name)
-edo = edo.drop(['Kod ISIN', 'Data wykupu', 'Początek sprzedaży',
-                'Koniec sprzedaży', 'Cena emisyjna', 'Cena zamiany',
-                'Sprzedaż łączna \n(mln zł)', 'w tym zamiana (mln zł)', 'Odsetki (zł)'], 
-                axis='columns')
-edo = edo.drop(0, axis='index')
-edo.reset_index()
-edo = edo.set_index('seria')
-edo.to_sql('EDO', con, schema=None, if_exists='replace', index=True, index_label='seria', chunksize=None, dtype=None, method=None)
-con.commit()
-
-
-coi = xl.parse('COI')
-dict_name = {'Seria':'seria',
-             'Oprocentowanie':'oprocentowanie_1rok',
-             'Unnamed: 10':'oprocentowanie_2rok',
-             'Unnamed: 11':'oprocentowanie_3rok',
-             'Unnamed: 12':'oprocentowanie_4rok'}
-coi = coi.rename(columns= dict_name)
-coi = coi.drop(['Kod ISIN', 'Data wykupu', 'Początek sprzedaży',
-                'Koniec sprzedaży', 'Cena emisyjna', 'Cena zamiany',
-                'Sprzedaż łączna \n(mln zł)', 'w tym zamiana (mln zł)',
-                'Odsetki (zł)', 'Unnamed: 14', 'Unnamed: 15', 'Unnamed: 16'], 
-                axis='columns')
-coi = coi.drop(0, axis='index')
-coi.reset_index()
-coi = coi.set_index('seria')
-coi.to_sql('COI', con, schema=None, if_exists='replace', index=True, index_label='seria', chunksize=None, dtype=None, method=None)
-con.commit()
-
-
-ros = xl.parse('ROS')
-dict_name = {'Seria':'seria',
-             'Oprocentowanie':'oprocentowanie_1rok',
-             'Unnamed: 10':'oprocentowanie_2rok',
-             'Unnamed: 11':'oprocentowanie_3rok',
-             'Unnamed: 12':'oprocentowanie_4rok',
-             'Unnamed: 13':'oprocentowanie_5rok',
-             'Unnamed: 14':'oprocentowanie_6rok'}
-ros = ros.rename(columns= dict_name)
-ros = ros.drop(['Kod ISIN', 'Data wykupu', 'Początek sprzedaży',
-                'Koniec sprzedaży', 'Cena emisyjna', 'Cena zamiany',
-                'Sprzedaż łączna \n(mln zł)', 'w tym zamiana (mln zł)', 'Odsetki (zł)'], 
-                axis='columns')
-ros = ros.drop(0, axis='index')
-ros.reset_index()
-ros = ros.set_index('seria')
-ros.to_sql('ROS', con, schema=None, if_exists='replace', index=True, index_label='seria', chunksize=None, dtype=None, method=None)
-con.commit()
-
-
-rod = xl.parse('ROD')
-dict_name = {'Seria':'seria',
-             'Oprocentowanie':'oprocentowanie_1rok',
-             'Unnamed: 10':'oprocentowanie_2rok',
-             'Unnamed: 11':'oprocentowanie_3rok',
-             'Unnamed: 12':'oprocentowanie_4rok',
-             'Unnamed: 13':'oprocentowanie_5rok',
-             'Unnamed: 14':'oprocentowanie_6rok',
-             'Unnamed: 15':'oprocentowanie_7rok',
-             'Unnamed: 16':'oprocentowanie_8rok',
-             'Unnamed: 17':'oprocentowanie_9rok',
-             'Unnamed: 18':'oprocentowanie_10rok',
-             'Unnamed: 19':'oprocentowanie_11rok',
-             'Unnamed: 20':'oprocentowanie_12rok'}
-rod = rod.rename(columns= dict_name)
-rod = rod.drop(['Kod ISIN', 'Data wykupu', 'Początek sprzedaży',
-                'Koniec sprzedaży', 'Cena emisyjna', 'Cena zamiany',
-                'Sprzedaż łączna \n(mln zł)', 'w tym zamiana (mln zł)', 'Odsetki (zł)'], 
-                axis='columns')
-rod = rod.drop(0, axis='index')
-rod.reset_index()
-rod = rod.set_index('seria')
-rod.to_sql('ROD', con, schema=None, if_exists='replace', index=True, index_label='seria', chunksize=None, dtype=None, method=None)
-con.commit()
-
-print("[###############100%###############] Successfully updated the goverment bond interest table")
-
-
-
-
-
-
-
-
+columns_to_drop = ['Kod ISIN', 'Data wykupu', 'Początek sprzedaży',
+                   'Koniec sprzedaży', 'Cena emisyjna', 'Cena zamiany',
+                   'Sprzedaż łączna \n(mln zł)', 'w tym zamiana (mln zł)', 'Odsetki (zł)']
+
+#{sheet name: (number of years of interest, additional columns to drop)}
+bond_sheets = {'EDO': (10, []),
+               'COI': (4, ['Unnamed: 14', 'Unnamed: 15', 'Unnamed: 16']),
+               'ROS': (6, []),
+               'ROD': (12, [])}
+
+
+def download_goverment_bond_workbook(url: str=csv_url):
+    tracing.count("http_calls")
+    s = requests.get(url).content
+    return pd.ExcelFile(s)
+
+def parse_bond_sheet(xl, sheet_name: str, years: int, additional_columns_to_drop: list=list()):
+    df = xl.parse(sheet_name)
+    dict_name = {'Seria':'seria',
+                 'Oprocentowanie':'oprocentowanie_1rok'}
+    for year in range(2, years + 1):
+        dict_name[f'Unnamed: {year + 8}'] = f'oprocentowanie_{year}rok'
+    df = df.rename(columns= dict_name)
+    df = df.drop(columns_to_drop + additional_columns_to_drop, axis='columns')
+    df = df.drop(0, axis='index')
+    df = df.set_index('seria')
+    return df
+
+def update_goverment_bond_interest_table(name_of_db: str="invest_tracker_data_base", xl=None):
+    if xl is None:
+        xl = download_goverment_bond_workbook()
+    con = sql.connect(name_of_db)
+    for sheet_name, (years, additional_columns_to_drop) in bond_sheets.items():
+        df = parse_bond_sheet(xl, sheet_name, years, additional_columns_to_drop)
+        df.to_sql(sheet_name, con, schema=None, if_exists='replace', index=True, index_label='seria', chunksize=None, dtype=None, method=None)
+        con.commit()
+    con.close()
+
+    print("[###############100%###############] Successfully updated the goverment bond interest table")
+
+
+if __name__ == "__main__":
+    update_goverment_bond_interest_table()
@@ -0,0 +1,181 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Instrument registry
+
+Facts about instruments are kept in one place instead of being derived again by every module:
+- Kind of an instrument: asset class ("bond", "cash", "security"), pricing provider ("gov.pl", "yahoo" or None) and bond series
+  ('EDO', 'COI', 'ROS', 'ROD' - the interest tables of goverment_bond_getting_table_of_interest).
+  classify(ticker) works without any data base and caches its result, is_bond / is_cash / has_market_prices are dictionary lookups.
+- INSTRUMENTS table: ticker, currency, asset_class, provider, bond_series, first_purchase, last_purchase of every instrument of the Transactions table.
+  Triggers on Transactions keep it up to date after every insert, update and delete, whoever makes the change.
+- InstrumentRegistry: the INSTRUMENTS table in memory. Lookups are dictionary reads, the table is read again only after it was written
+  (Database.table_version), so currencies and purchase dates are not queried per call.
+
+Classes:
+- Instrument: One row of the INSTRUMENTS table.
+- InstrumentRegistry: Instruments of a data base cached in memory.
+    - get(self, ticker: str): Instrument or None.
+    - currency_of(self, ticker: str): Currency of the instrument.
+    - tickers(self, asset_class: str): Tickers of all instruments, or of one asset class.
+
+Functions:
+- classify(ticker: str): Tuple (asset_class, provider, bond_series) of a ticker.
+- is_bond(ticker: str), is_cash(ticker: str), has_market_prices(ticker: str), bond_series_of(ticker: str): Kind of a ticker.
+- install_instrument_registry(db): Creates the INSTRUMENTS table (filled from Transactions) and its triggers.
+- get_registry(db): InstrumentRegistry of the data base, created on the first call.
+"""
+
+
+
+from goverment_bond_getting_table_of_interest import bond_sheets
+
+bond_series = tuple(bond_sheets)    #Prefixes of bond tickers, one interest table each
+cash_ticker = "CASH"
+
+_classes = {}   #Cache of classify() {ticker: (asset_class, provider, bond_series)}
+registry = None     #InstrumentRegistry returned by get_registry()
+
+
+def classify(ticker: str):
+    """
+    Returns (asset_class, provider, bond_series) of a ticker: ("bond", "gov.pl", 'EDO'), ("cash", None, None) or ("security", "yahoo", None).
+    An empty ticker is (None, None, None).
+    """
+    kind = _classes.get(ticker)
+    if kind is None:
+        if not ticker:
+            kind = (None, None, None)
+        elif ticker == cash_ticker:
+            kind = ("cash", None, None)
+        elif ticker[:3] in bond_series:
+            kind = ("bond", "gov.pl", ticker[:3])
+        else:
+            kind = ("security", "yahoo", None)
+        _classes[ticker] = kind
+    return kind
+
+def is_bond(ticker: str):
+    return classify(ticker)[0] == "bond"
+
+def is_cash(ticker: str):
+    return classify(ticker)[0] == "cash"
+
+def has_market_prices(ticker: str):
+    """
+    True for instruments with close prices downloaded from Yahoo Finance (a table of the ticker in the data base).
+    """
+    return classify(ticker)[1] == "yahoo"
+
+def bond_series_of(ticker: str):
+    return classify(ticker)[2]
+
+
+class Instrument:
+
+    __slots__ = ("ticker", "currency", "asset_class", "provider", "bond_series", "first_purchase", "last_purchase")
+
+    def __init__(self, ticker: str, currency: str=None, first_purchase: str=None, last_purchase: str=None):
+        self.ticker = ticker
+        self.currency = currency
+        self.asset_class, self.provider, self.bond_series = classify(ticker)
+        self.first_purchase = first_purchase
+        self.last_purchase = last_purchase
+
+    def __repr__(self):
+        return (f"Instrument('{self.ticker}', currency='{self.currency}', asset_class='{self.asset_class}', provider='{self.provider}', "
+                f"first_purchase='{self.first_purchase}', last_purchase='{self.last_purchase}')")
+
+
+def _classify_sql(column: str):
+    #classify() as SQL expressions of a column, for the triggers
+    bonds = ", ".join(f"'{series}'" for series in bond_series)
+    asset_class = f"CASE WHEN {column} = '{cash_ticker}' THEN 'cash' WHEN substr({column}, 1, 3) IN ({bonds}) THEN 'bond' ELSE 'security' END"
+    provider = f"CASE WHEN {column} = '{cash_ticker}' THEN NULL WHEN substr({column}, 1, 3) IN ({bonds}) THEN 'gov.pl' ELSE 'yahoo' END"
+    series = f"CASE WHEN substr({column}, 1, 3) IN ({bonds}) AND {column} != '{cash_ticker}' THEN substr({column}, 1, 3) END"
+    return asset_class, provider, series
+
+def install_instrument_registry(db):
+    """
+    Creates the INSTRUMENTS table filled from the Transactions table (if it doesn't exist) and the triggers of Transactions which keep it up to date.
+    """
+    if not db.check_table_exists("INSTRUMENTS"):
+        db.create_table("INSTRUMENTS", "ticker PRIMARY KEY", "currency", "asset_class", "provider", "bond_series", "first_purchase", "last_purchase")
+        df = db.read_sql("""SELECT yahoo_ticker, MAX(currency) AS currency, MIN(date_of_purchase) AS first_purchase, MAX(date_of_purchase) AS last_purchase
+                            FROM Transactions WHERE COALESCE(yahoo_ticker, '') != '' GROUP BY yahoo_ticker""")
+        rows = [(row.yahoo_ticker, row.currency, *classify(row.yahoo_ticker), row.first_purchase, row.last_purchase) for row in df.itertuples(index=False)]
+        if len(rows) == 1:
+            db.insert("INSTRUMENTS", rows[0])
+        elif rows:
+            db.insert("INSTRUMENTS", *rows)
+
+    def add_purchase(row: str):
+        asset_class, provider, series = _classify_sql(f"{row}.yahoo_ticker")
+        return (f"""INSERT OR IGNORE INTO INSTRUMENTS (ticker, currency, asset_class, provider, bond_series, first_purchase, last_purchase)
+                    SELECT {row}.yahoo_ticker, {row}.currency, {asset_class}, {provider}, {series}, {row}.date_of_purchase, {row}.date_of_purchase
+                    WHERE COALESCE({row}.yahoo_ticker, '') != ''""",
+                f"""UPDATE INSTRUMENTS SET first_purchase = MIN(first_purchase, {row}.date_of_purchase), last_purchase = MAX(last_purchase, {row}.date_of_purchase)
+                    WHERE ticker = {row}.yahoo_ticker""")
+
+    def remove_purchase(row: str):
+        return (f"""UPDATE INSTRUMENTS SET first_purchase = (SELECT MIN(date_of_purchase) FROM Transactions WHERE yahoo_ticker = {row}.yahoo_ticker),
+                                           last_purchase = (SELECT MAX(date_of_purchase) FROM Transactions WHERE yahoo_ticker = {row}.yahoo_ticker)
+                    WHERE ticker = {row}.yahoo_ticker""",
+                f"DELETE FROM INSTRUMENTS WHERE ticker = {row}.yahoo_ticker AND first_purchase IS NULL")
+
+    db.create_trigger("Transactions_instruments_after_insert", "Transactions", "AFTER INSERT", *add_purchase("NEW"))
+    db.create_trigger("Transactions_instruments_after_delete", "Transactions", "AFTER DELETE", *remove_purchase("OLD"))
+    db.create_trigger("Transactions_instruments_after_update", "Transactions", "AFTER UPDATE OF yahoo_ticker, date_of_purchase, currency",
+                      *remove_purchase("OLD"), *add_purchase("NEW"),
+                      "UPDATE INSTRUMENTS SET currency = NEW.currency WHERE ticker = NEW.yahoo_ticker")
+
+def get_registry(db):
+    """
+    Returns the InstrumentRegistry of the data base, a new one when the data base is another than on the previous call.
+    """
+    global registry
+    if registry is None or registry.db is not db:
+        registry = InstrumentRegistry(db)
+    return registry
+
+
+class InstrumentRegistry:
+
+    def __init__(self, db):
+        self.db = db
+        self.instruments: dict = {}     #{ticker: Instrument}
+        self.version = None             #Database.table_version("INSTRUMENTS") of the loaded instruments
+
+    def reload(self):
+        if not self.db.check_table_exists("INSTRUMENTS"):
+            install_instrument_registry(self.db)
+        self.version = self.db.table_version("INSTRUMENTS")
+        df = self.db.read_sql("SELECT ticker, currency, first_purchase, last_purchase FROM INSTRUMENTS")
+        self.instruments = {row.ticker: Instrument(row.ticker, row.currency, row.first_purchase, row.last_purchase) for row in df.itertuples(index=False)}
+
+    def _current(self):
+        if self.version != self.db.table_version("INSTRUMENTS"):
+            self.reload()
+        return self.instruments
+
+    def get(self, ticker: str):
+        return self._current().get(ticker)
+
+    def currency_of(self, ticker: str):
+        """
+        Returns the currency of an instrument, PLN for cash and bonds which are not in the registry, None for an unknown security.
+        """
+        instrument = self.get(ticker)
+        if instrument is not None and instrument.currency:
+            return instrument.currency
+        return "PLN" if classify(ticker)[0] in ("cash", "bond") else None
+
+    def tickers(self, asset_class: str=None):
+        return [ticker for ticker, instrument in self._current().items() if asset_class is None or instrument.asset_class == asset_class]
+
+    def __contains__(self, ticker: str):
+        return ticker in self._current()
+
+    def __len__(self):
+        return len(self._current())
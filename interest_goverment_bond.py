@@ -1,8 +1,28 @@
 import sqlite3 as sql
-import pandas as pd
 from datetime import date, timedelta, datetime
+from lazy_import import lazy_module
 
-conn = sql.connect("invest_tracker_data_base")
+import money
+import instruments
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+conn = None   #Connection opened on the first call of get_connection() or by connect()
+
+def get_connection(name_of_db: str="invest_tracker_data_base"):
+    global conn
+    if conn is None:
+        conn = sql.connect(name_of_db)
+    return conn
+
+def connect(name_of_db: str):
+    """
+    Connects the module to the given data base, replacing the connection opened before (e.g. in a worker valuing another data base).
+    """
+    global conn
+    conn = sql.connect(name_of_db)
+    return conn
 
 """
     Note:
@@ -22,40 +42,60 @@ conn = sql.connect("invest_tracker_data_base")
 
     Note:
     - This is module wich is part of Invest Tracker aplication, if you want use it separately you need make changes!
-    - The function uses an SQLite connection (conn) and assumes the existence of a 'Transactions' table with a 'date_of_purchase' column.
+    - The function uses the given SQLite connection or the one of the module (conn, opened on first use by get_connection() or by connect()) and assumes the existence of a 'Transactions' table with a 'date_of_purchase' column.
+    - The date of the first purchase is read with an index seek on Transactions (yahoo_ticker, date_of_purchase).
     - Bond interest rates and details are retrieved from the specified table ('EDO', 'COI', 'ROS', 'ROD').
+    - The value is calculated in integer grosze with exact half to even rounding (money module), get_bond_values calculates many dates at once.
 """
 
-def get_current_bond_value(ticker: str, date_param: str= str(date.today())):
-    if ticker[:3] in ['EDO', 'COI', 'ROS', 'ROD']:
-        table_name = ticker[:3]
-        data_interest = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-        data_transactions = pd.read_sql("SELECT * FROM Transactions", conn)
-        date_of_buy = list(data_transactions.loc[data_transactions.yahoo_ticker == ticker]['date_of_purchase'])
-        date_of_buy = date_of_buy[0]
-        date_of_buy = datetime.strptime(date_of_buy, "%Y-%m-%d").date()
-        date_param = datetime.strptime(date_param, "%Y-%m-%d").date()
-        delta = date_param - date_of_buy
-        years = delta.days // 365
-        days = delta.days - years*365
-        if years >= 0:
-            k=100  #Prize of 1 unit of bond
-            for i in range(1, years+1):
-                interest = float(data_interest.loc[data_interest['seria'] == ticker][f'oprocentowanie_{i}rok'])
-                k= k*(1 + interest)
-                k = float("{:.2f}".format(k))
-            if days != 0:
-                interest = float(data_interest.loc[data_interest['seria'] == ticker][f'oprocentowanie_{years+1}rok'])
-                k= k*(1+interest*days/365)
-                k = float("{:.2f}".format(k))
-        else:
-            k = None
-
+def get_current_bond_value(ticker: str, date_param: str= str(date.today()), conn=None):
+    if instruments.is_bond(ticker):
+        k = get_bond_values(ticker, [date_param], conn)[0]
         currency = 'PLN'
-        last_market_price = k
+        last_market_price = None if np.isnan(k) else float(k)
 
     return  last_market_price, currency
 
+def get_bond_values(ticker: str, dates, conn=None):
+    """
+    Returns the value of one unit of a bond on every date as a numpy array of floats (PLN), NaN before the first purchase
+    or when the interest of a year is unknown.
+
+    The value is calculated in integer grosze (money.MoneyArray): every full year the unit is capitalized with the interest of the year
+    and rounded to grosze, part of a year adds interest * days / 365. The interest table and the first purchase are read once for all dates.
+    They are read with conn, the connection of the module by default.
+    """
+    table_name = instruments.bond_series_of(ticker)
+    conn = conn if conn is not None else get_connection()
+    data_interest = pd.read_sql(f"SELECT * FROM {table_name} WHERE seria == ?", conn, params=(ticker,))
+    date_of_buy = conn.execute("SELECT MIN(date_of_purchase) FROM Transactions WHERE yahoo_ticker == ?", (ticker,)).fetchone()[0]
+    days_held = (pd.to_datetime(pd.Series(list(dates))).to_numpy().astype("datetime64[D]") - np.datetime64(date_of_buy, "D")).astype(np.int64)
+    years = days_held // 365
+    days = days_held - years * 365
+
+    interests = data_interest.iloc[0] if len(data_interest) else pd.Series(dtype=float)
+    max_year = max(int(years.max(initial=0)), 0)
+    #Interest of year y + 1 in millionths (NaN when unknown) and value of 1 unit in grosze at the beginning of year y + 1 (-1 when unknown)
+    rates_of_year = np.array([pd.to_numeric(interests.get(f'oprocentowanie_{year}rok'), errors='coerce') for year in range(1, max_year + 2)], dtype=np.float64)
+    rates_of_year = np.rint(rates_of_year * 10 ** money.default_rate_scale)
+    rate_denominator = 10 ** money.default_rate_scale
+    values_at_year = np.full(max_year + 1, -1, dtype=np.int64)
+    k = money.Money(100_00)      #Prize of 1 unit of bond
+    for year in range(max_year + 1):
+        values_at_year[year] = k.minor
+        if np.isnan(rates_of_year[year]):
+            break
+        k = k.multiply(rate_denominator + int(rates_of_year[year]), rate_denominator)
+
+    held_years = np.where(years >= 0, years, 0)
+    start_values = values_at_year[held_years]
+    rates = rates_of_year[held_years]
+    known = (years >= 0) & (start_values >= 0) & ((days == 0) | ~np.isnan(rates))
+    rates = np.where(known & (days != 0), rates, 0).astype(np.int64)
+    values = money.MoneyArray(np.where(known, start_values, 0)).multiply(365 * rate_denominator + rates * days, 365 * rate_denominator)
+
+    return np.where(known, values.to_floats(), np.nan)
+
 if __name__ == "__main__":
     last_market_price, currency = get_current_bond_value('EDO0132')
     print(f"Obligacje EDO0132. Aktualna wartość: {last_market_price}")
\ No newline at end of file
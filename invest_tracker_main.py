@@ -13,13 +13,10 @@ The script, along with additional modules, serves the following purposes:
 7) Presenting basic charts.
 
 Modules:
-- `csv`: Module for reading and writing CSV files.
 - `sqlite3`: Module for interacting with SQLite database.
-- `matplotlib.pyplot`: Library for creating static, animated, and interactive visualizations.
-- `plotly.express`: High-level interface for creating interactive plots.
-- `pandas`: Data manipulation library.
+- `plotly.express`: High-level interface for creating interactive plots (imported on first use by `chart_rendering`).
+- `pandas`: Data manipulation library (imported on first use).
 - `datetime`: Module for working with dates and times.
-- `decimal`: Module for decimal floating-point arithmetic.
 - `os`: Module for interacting with the operating system.
 
 Own Modules:
@@ -28,13 +25,34 @@ Own Modules:
 - `goverment_bond_getting_table_of_interest`: Module for fetching government bond interest rates tables.
 - `interest_goverment_bond`: Module for calculating interest on government bonds.
 - `yahoo_finance_api`: Module for fetching financial data from Yahoo Finance.
+- `lazy_import`: Module for importing heavy libraries on first use.
+- `instruments`: Module with the INSTRUMENTS registry (currency, asset class, pricing provider, bond series, purchase dates) cached in memory.
+- `money`: Module for fixed-point money arithmetic on integer minor units (single amounts and numpy arrays).
+- `chart_rendering`: Module for building charts and writing them to files without a browser.
+- `snapshot_export`: Module for writing the valuation history as partitioned Parquet / Arrow IPC snapshots (requires `pyarrow`).
+- `tracing`: Module recording nested spans of the stages of main() (wall and CPU time, peak RSS, rows, HTTP calls, statements) as Chrome trace JSON.
+- `cross_rates`: Module deriving every currency pair from NBP PLN mids as one dates x currencies x currencies array, cached per date range.
+- `transaction_ingestion`: Module for streaming import of many CSV statements in date order (external merge sort), skipping rows imported before.
+- `pipeline`: Module running the stages of main() as a dependency graph, independent stages concurrently and unchanged stages skipped.
+- `sharding`: Module keeping every account in its own SQLite file with the shared market data attached, valued in parallel with a consolidated cross-account view.
+
+Importing this module does no I/O - the data base is connected by get_database() and initialized by initialize_database() when main() runs with a changed CSV file.
+
+Change tracking: triggers on the Transactions table record every inserted, updated or deleted transaction in DIRTY_SLICES as
+(account, instrument, from date). The next valuation (Account.historical_values_for_investmens_on) recalculates only these slices
+of the historical values and the account balance and total cost from the earliest changed date (Account.recalculate_dirty_slices).
 
 Classes:
 - `Account`: Represents an investment account with functionalities for updating, visualizing, and managing transactions.
 - `Transaction`: Represents a financial transaction with functionalities for importing from CSV, sorting, and calculating transaction values.
 
 Functions:
+- `get_database()`: Returns the connection to the data base, connecting on the first call.
+- `initialize_database(db)`: Drops and recreates the Accounts and Transactions tables.
+- `install_change_tracking(db)`: Creates the DIRTY_SLICES table and the triggers marking slices changed by transactions.
+- `install_position_tracking(db)`: Creates the POSITIONS table and the triggers keeping units, total costs and account balances up to date.
 - `main()`: Main function that initializes the application, creates accounts, imports transactions, checks exchange rates, updates balances, and visualizes investment performance.
+  The stages are run by pipeline.Pipeline, a part of them with only / start_from (`python pipeline.py --only fx_sync`, `--from historical_values`).
 
 Usage:
 1. Import the required modules.
@@ -65,12 +83,7 @@ Usage:
 
 
 
-import csv
 import sqlite3
-import matplotlib.pyplot as plt
-plt.style.use('seaborn')
-import plotly.express as px
-import pandas as pd
 from datetime import date, datetime, timedelta
 import os
 import os.path
@@ -79,42 +92,147 @@ import data_base
 import nbp_api as nbp
 import goverment_bond_getting_table_of_interest
 import interest_goverment_bond as bond_interest
-from decimal import *
-getcontext().prec = 15
 import yahoo_finance_api as yfin
+import money
+import instruments
+import chart_rendering
+import snapshot_export
+import transaction_ingestion
+import cross_rates
+import tracing
+from lazy_import import lazy_module
+
+#Heavy libraries are imported on first use, importing this module does no I/O
+pd = lazy_module("pandas")
+
+
+
+db = None   #Connection to the data base, opened by get_database()
+
+def get_database(database_name: str="invest_tracker_data_base", timeout: float=5.0):
+    """
+    Returns the connection to the data base, connecting on the first call.
+    """
+    global db
+    if db is None:
+        db = data_base.Database(database_name, timeout=timeout)
+        db.enable_cache()
+        #Indexes for account, ticker and date filters over the transactions ledger
+        db.declare_index("Transactions", "account_id", "yahoo_ticker", "date_of_purchase")
+        db.declare_index("Transactions", "yahoo_ticker", "date_of_purchase")
+        db.declare_index("Transactions", "account_id", "type_of_transaction_value", "total_cost")    #Covers the GROUP BY of the investment view
+        db.declare_index("EXCHANGE_RATE_TABLE", "Date")
+        if db.check_table_exists("Transactions"):
+            install_change_tracking(db)
+            instruments.install_instrument_registry(db)
+            if db.check_table_exists("Accounts"):
+                install_position_tracking(db)
+            transaction_ingestion.install_import_tracking(db)
+    return db
+
+def initialize_database(db):
+    """
+    Drops and recreates the Accounts and Transactions tables, with the tables filled by their triggers (DIRTY_SLICES, INSTRUMENTS, POSITIONS, IMPORTED_TRANSACTIONS).
+    """
+    if db.check_table_exists("Accounts"):
+        db.drop_table("Accounts")
+    db.create_table("Accounts", "id INTEGER PRIMARY KEY AUTOINCREMENT", "name", "balance REAL", "currency")
 
-
-
-#Initialiaze data base 
-db = data_base.Database("invest_tracker_data_base")
-
-if db.check_table_exists("Accounts"):
-    db.drop_table("Accounts")
-db.create_table("Accounts", "id INTEGER PRIMARY KEY AUTOINCREMENT", "name", "balance REAL", "currency")
-
-if db.check_table_exists("Transactions"):
-    db.drop_table("Transactions")
-
-db.create_table("Transactions", "id INTEGER PRIMARY KEY AUTOINCREMENT",
-                                "account_id INTEGER",
-                                "date_of_purchase",
-                                "operation_ticker",
-                                "type_of_transaction_value",
-                                "currency",
-                                "number_of_units INTEGER",
-                                "price_of_one_unit REAL",
-                                "commission REAL",
-                                "yahoo_ticker",
-                                "tax REAL",
-                                "total_cost REAL",
-                                "total_number_of_units_after_transaction INTEGER",
-                                "account_balance_after_operation REAL",
-                                "type_of_investment",
-                                "FOREIGN KEY(account_id) REFERENCES Accounts(id)") 
+    if db.check_table_exists("Transactions"):
+        db.drop_table("Transactions")
+
+    db.create_table("Transactions", "id INTEGER PRIMARY KEY AUTOINCREMENT",
+                                    "account_id INTEGER",
+                                    "date_of_purchase",
+                                    "operation_ticker",
+                                    "type_of_transaction_value",
+                                    "currency",
+                                    "number_of_units INTEGER",
+                                    "price_of_one_unit REAL",
+                                    "commission REAL",
+                                    "yahoo_ticker",
+                                    "tax REAL",
+                                    "total_cost REAL",
+                                    "total_number_of_units_after_transaction INTEGER",
+                                    "account_balance_after_operation REAL",
+                                    "type_of_investment",
+                                    "FOREIGN KEY(account_id) REFERENCES Accounts(id)") 
+
+    if db.check_table_exists("DIRTY_SLICES"):
+        db.drop_table("DIRTY_SLICES")
+    install_change_tracking(db)
+    if db.check_table_exists("INSTRUMENTS"):
+        db.drop_table("INSTRUMENTS")
+    instruments.install_instrument_registry(db)
+    if db.check_table_exists("POSITIONS"):
+        db.drop_table("POSITIONS")
+    install_position_tracking(db)
+    if db.check_table_exists("IMPORTED_TRANSACTIONS"):
+        db.drop_table("IMPORTED_TRANSACTIONS")
+    transaction_ingestion.install_import_tracking(db)
+
+def install_change_tracking(db):
+    """
+    Creates the DIRTY_SLICES table and the triggers of the Transactions table which fill it.
+
+    A slice is an instrument of an account from a date on. Changes of the same slice keep the earliest date.
+    Updates of the columns calculated by the application (total cost, units after transaction, ...) don't mark slices.
+    """
+    if not db.check_table_exists("DIRTY_SLICES"):
+        db.create_table("DIRTY_SLICES", "account_id INTEGER", "yahoo_ticker", "from_date", "PRIMARY KEY (account_id, yahoo_ticker)")
+
+    def mark_slice(row: str):
+        return (f"INSERT OR IGNORE INTO DIRTY_SLICES (account_id, yahoo_ticker, from_date) VALUES ({row}.account_id, COALESCE({row}.yahoo_ticker, ''), {row}.date_of_purchase)",
+                f"UPDATE DIRTY_SLICES SET from_date = MIN(from_date, {row}.date_of_purchase) WHERE account_id = {row}.account_id AND yahoo_ticker = COALESCE({row}.yahoo_ticker, '')")
+
+    db.create_trigger("Transactions_mark_dirty_after_insert", "Transactions", "AFTER INSERT", *mark_slice("NEW"))
+    db.create_trigger("Transactions_mark_dirty_after_delete", "Transactions", "AFTER DELETE", *mark_slice("OLD"))
+    db.create_trigger("Transactions_mark_dirty_after_update", "Transactions",
+                      "AFTER UPDATE OF account_id, date_of_purchase, yahoo_ticker, currency, number_of_units, price_of_one_unit, commission",
+                      *mark_slice("OLD"), *mark_slice("NEW"))
+
+def install_position_tracking(db):
+    """
+    Creates the POSITIONS table (units and total cost of every type of every account), fills it from Transactions if it is new,
+    and the triggers of the Transactions table which keep POSITIONS and the balance column of the Accounts table up to date.
+
+    The balance of an account is the sum of total costs of its transactions (money invested, with commissions, in PLN).
+    """
+    if not db.check_table_exists("POSITIONS"):
+        db.create_table("POSITIONS", "account_id INTEGER", "type_of_transaction_value", "number_of_units INTEGER", "total_cost REAL",
+                        "number_of_transactions INTEGER", "PRIMARY KEY (account_id, type_of_transaction_value)")
+        db.execute("""INSERT INTO POSITIONS (account_id, type_of_transaction_value, number_of_units, total_cost, number_of_transactions)
+                      SELECT account_id, type_of_transaction_value, SUM(COALESCE(number_of_units, 0)), SUM(COALESCE(total_cost, 0)), COUNT(*)
+                      FROM Transactions WHERE type_of_transaction_value IS NOT NULL GROUP BY account_id, type_of_transaction_value""")
+    db.execute("""UPDATE Accounts SET balance = (SELECT COALESCE(SUM(total_cost), 0) FROM POSITIONS WHERE POSITIONS.account_id = Accounts.id)""")
+
+    def add_row(row: str):
+        return (f"""INSERT INTO POSITIONS (account_id, type_of_transaction_value, number_of_units, total_cost, number_of_transactions)
+                    SELECT {row}.account_id, {row}.type_of_transaction_value, COALESCE({row}.number_of_units, 0), COALESCE({row}.total_cost, 0), 1
+                    WHERE {row}.type_of_transaction_value IS NOT NULL
+                    ON CONFLICT(account_id, type_of_transaction_value) DO UPDATE SET number_of_units = number_of_units + excluded.number_of_units,
+                                                                                    total_cost = total_cost + excluded.total_cost,
+                                                                                    number_of_transactions = number_of_transactions + 1""",
+                f"UPDATE Accounts SET balance = COALESCE(balance, 0) + COALESCE({row}.total_cost, 0) WHERE id = {row}.account_id")
+
+    def remove_row(row: str):
+        return (f"""UPDATE POSITIONS SET number_of_units = number_of_units - COALESCE({row}.number_of_units, 0),
+                                         total_cost = total_cost - COALESCE({row}.total_cost, 0),
+                                         number_of_transactions = number_of_transactions - 1
+                    WHERE account_id = {row}.account_id AND type_of_transaction_value = {row}.type_of_transaction_value""",
+                f"DELETE FROM POSITIONS WHERE account_id = {row}.account_id AND type_of_transaction_value = {row}.type_of_transaction_value AND number_of_transactions <= 0",
+                f"UPDATE Accounts SET balance = COALESCE(balance, 0) - COALESCE({row}.total_cost, 0) WHERE id = {row}.account_id")
+
+    db.create_trigger("Transactions_positions_after_insert", "Transactions", "AFTER INSERT", *add_row("NEW"))
+    db.create_trigger("Transactions_positions_after_delete", "Transactions", "AFTER DELETE", *remove_row("OLD"))
+    db.create_trigger("Transactions_positions_after_update", "Transactions", "AFTER UPDATE OF account_id, type_of_transaction_value, number_of_units, total_cost",
+                      *remove_row("OLD"), *add_row("NEW"))
 
 
 
 class Account:
+
+    market_data = None  #Shared MarketData, when set the market data is read from it instead of the data base and network
     
     def __init__(self, name: str = '', currency: str= "PLN", account_id: int=None):
 
@@ -124,18 +242,39 @@ class Account:
         self.balance = 0.00 
         self.main_currency = currency
 
-        #Add account to data base
-        db.insert_row("Accounts", (account_id, self.name, str(self.balance), self.main_currency))
-        
-        #get id from data base    
-        if account_id == None:
-            self.id = int(db.get_last_row_value("Accounts", "id"))
-        else:
-            self.id = account_id
+        #Add account to data base and get id from data base
+        db = get_database()
+        self.id = int(db.insert_row("Accounts", (account_id, self.name, str(self.balance), self.main_currency)))
 
     def __str__(self):
         return f'Konto o nazwie {self.name} oraz id: {self.id}'
 
+    @classmethod
+    def from_database(cls, account_id: int, db=None):
+        """
+        Returns the Account stored in the Accounts table without inserting a new row.
+        """
+        if db is None:
+            db = get_database()
+        df_account = db.get_table_df_with_conditions("Accounts", "id", "name", "balance", "currency", id = f"{account_id}")
+        account = cls.__new__(cls)
+        account.name = df_account.loc[0, "name"]
+        account.transactions = {}
+        account.balance = df_account.loc[0, "balance"]
+        account.main_currency = df_account.loc[0, "currency"]
+        account.id = int(account_id)
+        return account
+
+    def get_last_market_price_of(self, ticker: str):
+        if self.market_data is not None and self.market_data.last_market_price_of(ticker) is not None:
+            return self.market_data.last_market_price_of(ticker)
+        return yfin.get_last_market_price(ticker)
+
+    def get_current_exchange_rate_of(self, currency: str):
+        if self.market_data is not None and self.market_data.current_exchange_rate_of(currency) is not None:
+            return self.market_data.current_exchange_rate_of(currency)
+        return nbp.get_exchange_rate(currency)
+
     @property
     def id(self):
         return self.__id
@@ -153,48 +292,133 @@ class Account:
         self._balance = balance
 
     def actual_balance(self):
-        Transaction_df = pd.read_sql("SELECT * FROM Transactions", db.conn)
-        Transaction_df.set_index('id', inplace = True)
+        """
+        Returns the balance of the account (sum of total costs of its transactions), kept in the Accounts table by the triggers of Transactions.
+        """
+        db = get_database()
+        self.balance = db.get_value("SELECT balance FROM Accounts WHERE id = ?", (self.id,), default=0.0)
+        return self.balance
+
+    def get_positions_df(self, db=None):
+        """
+        Returns a DataFrame (type_of_transaction_value, number_of_units, total_cost) of the account from the POSITIONS table.
+        """
+        if db is None:
+            db = get_database()
+        return db.read_sql("SELECT type_of_transaction_value, number_of_units, total_cost FROM POSITIONS WHERE account_id = ?", (self.id,))
     
-    def figure_plot_for_account(self):
-        Transaction_df = db.get_table_df(f"INVESTMENT_VIEW_ACCOUNT_{self.id}", 'type_of_transaction_value', 'current_value')
-        
-        fig  = px.bar(Transaction_df, x='type_of_transaction_value', y='current_value')
-        fig.show()
-        fig = px.pie(Transaction_df, values='current_value', names='type_of_transaction_value')
-        fig.show()
-
-        Historical_value_df = db.get_table_df(f"ACCOUNT_{self.id}_HISTORICAL_VALUE", "Date", "account_balance", "total_cost")
-        Historical_value_df["total_cost"] = Historical_value_df["total_cost"].fillna(method='ffill')
-        fig = px.line(Historical_value_df, x="Date", y=Historical_value_df.columns, title='Historical balance')
-        fig.show()
+    def historical_balance_in(self, currency: str=None, db=None):
+        """
+        Returns a DataFrame indexed by Date with account_balance and total_cost of ACCOUNT_{id}_HISTORICAL_VALUE
+        converted from PLN to currency (the main currency of the account by default) with the rates of every day.
+        """
+        if db is None:
+            db = get_database()
+        currency = currency or self.main_currency or "PLN"
+        df = snapshot_export.read_account_history(db, self.id)
+        df["Date"] = df["Date"].astype(str).str[:10]
+        df = df.drop_duplicates(subset=["Date"]).set_index("Date")
+        df["total_cost"] = pd.to_numeric(df["total_cost"], errors='coerce').ffill()
+        if currency == "PLN" or df.empty:
+            return df
+        rates = cross_rates.get_cross_rates(db, [currency], df.index[0], df.index[-1]).rates_for("PLN", currency, df.index)
+        return df.apply(lambda column: pd.to_numeric(column, errors='coerce') * rates)
+
+    def figure_plot_for_account(self, headless: bool=False, output_dir: str="charts", formats: tuple=("html",), target_points: int=chart_rendering.default_target_points):
+        """
+        Shows charts of the account in a browser or, with headless=True, writes them to files in output_dir (html, png or json).
+        Long historical series are downsampled to target_points points.
+        """
+        db = get_database()
+        if headless:
+            return chart_rendering.render_account_charts(db, self.id, output_dir, formats, target_points)
+
+        for fig in chart_rendering.build_account_figures(db, self.id, target_points).values():
+            fig.show()
+
+    def create_investment_view(self, db):
+        """
+        Creates INVESTMENT_VIEW_ACCOUNT_{id} keyed by type_of_transaction_value. A view written by an older version
+        (a pandas table with an index column) is dropped first.
+        """
+        table_name = f"INVESTMENT_VIEW_ACCOUNT_{self.id}"
+        if db.check_table_exists(table_name):
+            if "index" not in db.get_column_names(table_name):
+                return table_name
+            db.drop_table(table_name)
+        db.create_table(table_name, "type_of_transaction_value PRIMARY KEY", "currency", "yahoo_ticker",
+                        "total_number_of_units_after_transaction REAL", "type_of_investment",
+                        "last_market_price REAL", "current_currency_rate REAL", "current_value REAL", "total_cost REAL")
+        return table_name
+
+    def refresh_investment_view_positions(self, db):
+        """
+        Updates units and total cost of every type of the account in INVESTMENT_VIEW_ACCOUNT_{id} with one INSERT ... SELECT.
+        Units and total cost are sums over the transactions of the type (a GROUP BY over the (account_id, type_of_transaction_value, ...) index),
+        so they don't depend on the order of the transactions (a backdated transaction has the highest id, not the latest position) and
+        equal the POSITIONS table of the triggers. Currency, ticker and type of investment are the same in every transaction of a type.
+        Only rows which changed are written, types without transactions are removed.
+        Returns the number of written rows.
+        """
+        table_name = self.create_investment_view(db)
+        changed = db.execute(f"""INSERT INTO "{table_name}" (type_of_transaction_value, currency, yahoo_ticker, total_number_of_units_after_transaction, type_of_investment, total_cost)
+                                SELECT last.type_of_transaction_value, last.currency, last.yahoo_ticker, grouped.number_of_units, last.type_of_investment, grouped.total_cost
+                                FROM (SELECT SUM(COALESCE(number_of_units, 0)) AS number_of_units, SUM(COALESCE(total_cost, 0)) AS total_cost, MAX(id) AS last_id
+                                      FROM Transactions WHERE account_id = ? AND type_of_transaction_value IS NOT NULL GROUP BY type_of_transaction_value) AS grouped
+                                JOIN Transactions AS last ON last.id = grouped.last_id
+                                WHERE true
+                                ON CONFLICT(type_of_transaction_value) DO UPDATE SET
+                                    yahoo_ticker = excluded.yahoo_ticker,
+                                    total_number_of_units_after_transaction = excluded.total_number_of_units_after_transaction,
+                                    type_of_investment = excluded.type_of_investment,
+                                    total_cost = excluded.total_cost,
+                                    current_value = excluded.total_number_of_units_after_transaction * last_market_price * current_currency_rate
+                                WHERE total_number_of_units_after_transaction IS NOT excluded.total_number_of_units_after_transaction
+                                   OR total_cost IS NOT excluded.total_cost
+                                   OR yahoo_ticker IS NOT excluded.yahoo_ticker
+                                   OR type_of_investment IS NOT excluded.type_of_investment""", (self.id,))
+        changed += db.execute(f"""DELETE FROM "{table_name}" WHERE type_of_transaction_value NOT IN
+                                 (SELECT type_of_transaction_value FROM Transactions WHERE account_id = ? AND type_of_transaction_value IS NOT NULL)""", (self.id,))
+        return changed
+
+    def refresh_investment_view_prices(self, db, tickers: list=None):
+        """
+        Updates last market price, exchange rate and current value in INVESTMENT_VIEW_ACCOUNT_{id}.
+        The price is taken once per ticker and the rate once per currency, all rows are written with one executemany.
+        """
+        table_name = self.create_investment_view(db)
+        if tickers is None:
+            tickers = [row[0] for row in db.read_sql(f'SELECT DISTINCT yahoo_ticker FROM "{table_name}"').itertuples(index=False)]
+        rates = {}
+        rows = []
+        for ticker in tickers:
+            last_market_price, currency = self.get_last_market_price_of(ticker)
+            if currency not in rates:
+                rates[currency] = self.get_current_exchange_rate_of(currency)
+            rows.append((last_market_price, currency, rates[currency], last_market_price, rates[currency], ticker))
+        if rows:
+            db.execute(f"""UPDATE "{table_name}" SET last_market_price = ?, currency = ?, current_currency_rate = ?,
+                                                    current_value = total_number_of_units_after_transaction * ? * ?
+                           WHERE yahoo_ticker = ?""", rows, many=True)
+        return len(rows)
 
     def investment_view_by_type(self):
-
-        Transaction_df = db.get_table_df_with_conditions("Transactions", "type_of_transaction_value", "currency", "yahoo_ticker", "total_number_of_units_after_transaction", "total_cost", "type_of_investment", account_id = f"{self.id}")
-
-        Transaction_total_cost_df = Transaction_df.groupby(["type_of_transaction_value"])["total_cost"].sum()
-        Transaction_df = Transaction_df.drop(columns="total_cost")
-        Transaction_df = Transaction_df.drop_duplicates(subset=["type_of_transaction_value"], keep="last")
-
-        Transaction_df[["last_market_price", "currency"]] = Transaction_df.apply(lambda x: yfin.get_last_market_price(x["yahoo_ticker"]), axis = 1 , result_type='expand')
-        Transaction_df["current_currency_rate"] = Transaction_df["currency"].apply(nbp.get_exchange_rate)
-        
-        Transaction_df["current_value"] = Transaction_df["total_number_of_units_after_transaction"] * Transaction_df["last_market_price"] * Transaction_df["current_currency_rate"]
-        
-        Transaction_df = pd.merge(Transaction_df, Transaction_total_cost_df, on= "type_of_transaction_value", how="left")
-        
-        Transaction_df.to_sql(f"INVESTMENT_VIEW_ACCOUNT_{self.id}", db.conn, if_exists="replace")
+        """
+        Brings INVESTMENT_VIEW_ACCOUNT_{id} up to date: positions from the transactions, then prices and exchange rates.
+        """
+        db = get_database()
+        self.refresh_investment_view_positions(db)
+        self.refresh_investment_view_prices(db)
 
     def prepare_table_for_historical_value(self, db):
 
-        df_tickers = db.get_table_df_with_conditions("Transactions", "yahoo_ticker", account_id = "1")
+        df_tickers = db.get_table_df_with_conditions("Transactions", "yahoo_ticker", account_id = f"{self.id}")
         df_tickers = df_tickers.drop_duplicates()
         tickers_list = list(df_tickers["yahoo_ticker"])
         table_name = f"ACCOUNT_{self.id}_HISTORICAL_VALUE"
 
         if db.check_table_exists(table_name):
-            
+            self.add_missing_ticker_columns(table_name, tickers_list, db)
             last_row = db.get_last_row_value(table_name)
             last_date = last_row[0]
             last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
@@ -211,8 +435,7 @@ class Account:
                 Historical_value_df = db.get_table_df(f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
                 Historical_value_df[[f"{ticker}_number_of_units" for ticker in tickers_list]] = Historical_value_df[[f"{ticker}_number_of_units" for ticker in tickers_list]].fillna(method='ffill')
                 Historical_value_df = Historical_value_df.set_index("Date")
-                Historical_value_df.to_sql(f"ACCOUNT_{self.id}_HISTORICAL_VALUE", db.conn, if_exists="replace")
-                db.conn.commit()
+                db.write_df(Historical_value_df, f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
 
             else: 
                 print(f"Dane w tabeli {table_name} są aktualne.")
@@ -223,23 +446,32 @@ class Account:
                                         f"""{','.join([f"'{ticker}_number_of_units' INTEGER, '{ticker}_value' REAL" for ticker in tickers_list])}""")
 
             df = db.get_table_df(table_name)
-            start_date = db.get_first_row_value("Transactions", "date_of_purchase")
+            start_date = db.read_sql("SELECT MIN(date_of_purchase) FROM Transactions WHERE account_id == ?", (self.id,)).iloc[0, 0]
             df.Date = pd.date_range(start=start_date, end=date.today(), freq="D")
             df = df.assign(Date =df.Date.dt.date)
             df = df.set_index("Date")
-            df.to_sql(f"{table_name}", db.conn, if_exists="replace")
+            db.write_df(df, f"{table_name}")
             
             df_transactions = db.get_table_df("Transactions", "date_of_purchase", "yahoo_ticker", "total_number_of_units_after_transaction", sort_col= "date_of_purchase", sort_order="ASC", where_condition= f"account_id == {self.id}")
             df_transactions.apply(self.update_historical_information_of_number_of_units, axis=1)
             Historical_value_df = db.get_table_df(f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
             Historical_value_df = Historical_value_df.fillna(method='ffill')
             Historical_value_df = Historical_value_df.set_index("Date")
-            Historical_value_df.to_sql(f"ACCOUNT_{self.id}_HISTORICAL_VALUE", db.conn, if_exists="replace")
-            db.conn.commit()
+            db.write_df(Historical_value_df, f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
             last_date = datetime.strptime(start_date, "%Y-%m-%d").date()
         return last_date
 
-    def update_historical_information_of_number_of_units(self, item, db= db):
+    @staticmethod
+    def add_missing_ticker_columns(table_name: str, tickers_list: list, db):
+        column_names = db.get_column_names(table_name)
+        for ticker in tickers_list:
+            if f"{ticker}_number_of_units" not in column_names:
+                db.add_column(table_name, f"'{ticker}_number_of_units' INTEGER")
+                db.add_column(table_name, f"'{ticker}_value' REAL")
+
+    def update_historical_information_of_number_of_units(self, item, db=None):
+        if db is None:
+            db = get_database()
         table_name = f"ACCOUNT_{self.id}_HISTORICAL_VALUE"
         total_number_of_units = item["total_number_of_units_after_transaction"]
         date_of_purchase = item["date_of_purchase"]
@@ -248,90 +480,100 @@ class Account:
         return True
 
     def get_currency_of(self, ticker_name: str, db):
-        currency_df = db.get_table_df_with_conditions(f'INVESTMENT_VIEW_ACCOUNT_{self.id}', "currency", yahoo_ticker = f"{ticker_name}")
-        currency = currency_df.loc[0,"currency"]
-        return currency
+        return instruments.get_registry(db).currency_of(ticker_name)
 
     def get_exchange_rates_df_for(self, ticker: str, start_date: str, db):
         currency = self.get_currency_of(ticker_name = ticker, db=db)
         if currency == "PLN":
             end_date = str(date.today())
-            dates = pd.date_range(start_date, end_date, freq='D')
-            dates_str = dates.strftime("%Y-%m-%d")
-            df_exchange_rates = pd.DataFrame({'Date': dates_str, 'PLN_PLN': 1.0})
-            df_exchange_rates = df_exchange_rates.set_index("Date")
+            dates = data_base.date_ordinals(pd.date_range(start_date, end_date, freq='D').to_numpy())
+            df_exchange_rates = data_base.typed_frame(pd.DataFrame({'PLN_PLN': 1.0}, index=pd.Index(dates, name="Date")))
+        elif self.market_data is not None and self.market_data.exchange_rates_for(currency, start_date) is not None:
+            df_exchange_rates = self.market_data.exchange_rates_for(currency, start_date)
         else:    
-            df_exchange_rates = db.get_table_df_with_conditions('EXCHANGE_RATE_TABLE', "Date", f"{currency}_PLN", Date = f">=__{start_date}")
-            df_exchange_rates = df_exchange_rates.drop_duplicates(subset=['Date'])
-            df_exchange_rates = df_exchange_rates.set_index("Date")
+            df_exchange_rates = db.read_typed(f"""SELECT Date, "{currency}_PLN" FROM EXCHANGE_RATE_TABLE WHERE Date >= ?""", (str(start_date),), index="Date")
+            df_exchange_rates = df_exchange_rates.loc[~df_exchange_rates.index.duplicated()]
         return df_exchange_rates
 
     def get_number_of_units_df_for(self, ticker: str, start_date: str, db):
-        column_name = f""" "{ticker}_number_of_units" """
-        df_number_of_units = db.get_table_df_with_conditions("ACCOUNT_1_HISTORICAL_VALUE", "Date", column_name, Date = f'>=__{start_date}')
-        df_number_of_units = df_number_of_units.drop_duplicates(subset=['Date'])
-        df_number_of_units = df_number_of_units.set_index("Date")
+        df_number_of_units = db.read_typed(f"""SELECT Date, "{ticker}_number_of_units" FROM 'ACCOUNT_{self.id}_HISTORICAL_VALUE' WHERE Date >= ?""",
+                                           (str(start_date),), index="Date")
+        df_number_of_units = df_number_of_units.loc[~df_number_of_units.index.duplicated()]
         return df_number_of_units
 
     def get_historical_prize_df_for(self, ticker: str, start_date: str, db):
-        table_name = f" '{ticker}' "
-        df_close_prize = db.get_table_df_with_conditions(table_name, "Date", "Close", Date = f'>=__{start_date}')
-        df_close_prize = df_close_prize.drop_duplicates(subset=['Date'])
-        df_close_prize = df_close_prize.set_index("Date")
+        if self.market_data is not None and self.market_data.prices_for(ticker, start_date) is not None:
+            return self.market_data.prices_for(ticker, start_date)
+        df_close_prize = db.read_typed(f"SELECT Date, Close FROM '{ticker}' WHERE Date >= ?", (str(start_date),), index="Date")
+        df_close_prize = df_close_prize.loc[~df_close_prize.index.duplicated()]
         return df_close_prize
 
     def create_historical_value_df_for(self, ticker: str, currency: str, df_number_of_units,  df_close_prize, df_exchange_rates):
-        result_df = pd.concat([df_number_of_units, df_close_prize, df_exchange_rates], axis=1)
-        result_df[f"{ticker}_number_of_units"]= pd.to_numeric(result_df[f"{ticker}_number_of_units"], errors='coerce')
-        result_df["Close"]= pd.to_numeric(result_df["Close"], errors='coerce')
-        result_df[f"{currency}_PLN"]= pd.to_numeric(result_df[f"{currency}_PLN"], errors='coerce')
+        """
+        Returns units and '{ticker}_value' indexed by text dates. Inputs are typed frames indexed by day ordinals (Database.read_typed),
+        frames of the shared market data are converted once by data_base.typed_frame.
+        """
+        frames = [data_base.typed_frame(df) for df in (df_number_of_units, df_close_prize, df_exchange_rates)]
+        result_df = pd.concat(frames, axis=1)
         column_name = f"{ticker}_value"
         result_df[column_name] = result_df[f"{ticker}_number_of_units"]*result_df["Close"]*result_df[f"{currency}_PLN"]
         result_df = result_df.drop(columns=["Close", f"{currency}_PLN"])
+        result_df.index = data_base.dates_of_ordinals(result_df.index)   #Dates of the ACCOUNT_{id}_HISTORICAL_VALUE table
         return result_df 
 
     def append_historical_value_to(self, df_to_append, db):
         df_historical_datas = db.get_table_df(f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
         df_historical_datas = df_historical_datas.set_index("Date")
         result_df_to_append = df_historical_datas.combine_first(df_to_append)
-        result_df_to_append.to_sql(f"ACCOUNT_{self.id}_HISTORICAL_VALUE", db.conn, if_exists="replace")
+        db.write_df(result_df_to_append, f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
         return True
 
     def calculate_historical_value_for_ticker_and_append_to_db(self, ticker: str, db, start_date: str=None):
+        with tracing.span("historical_value", "ticker", ticker=ticker, start_date=start_date):
+            result_df = self.get_historical_value_df_for(ticker = ticker, db = db, start_date = start_date)
+            if result_df is None:
+                return False
+            self.append_historical_value_to(df_to_append = result_df, db=db)
+            tracing.count("rows", len(result_df))
+        return True
 
-        if ticker not in ['','CASH'] and (ticker[:3] not in ['EDO', 'COI', 'ROS', 'ROD']):
+    def get_historical_value_df_for(self, ticker: str, db, start_date: str=None):
+        """
+        Returns a DataFrame indexed by Date with the '{ticker}_value' column from start_date on, or None for an unknown ticker.
+        """
+        if instruments.has_market_prices(ticker):
             currency = self.get_currency_of(ticker_name = ticker, db=db)
             df_exchange_rates = self.get_exchange_rates_df_for(ticker = ticker, start_date = start_date, db=db)
             df_number_of_units = self.get_number_of_units_df_for(ticker = ticker, start_date = start_date, db=db)
             df_close_prize = self.get_historical_prize_df_for(ticker = ticker, start_date = start_date, db=db)
             result_df = self.create_historical_value_df_for(ticker = ticker, currency = currency, df_number_of_units = df_number_of_units,  df_close_prize = df_close_prize, df_exchange_rates = df_exchange_rates)
-            self.append_historical_value_to(df_to_append = result_df, db=db)
-            return True
+            return result_df
 
-        elif ticker[:3] in ['EDO', 'COI', 'ROS', 'ROD']:
+        elif instruments.is_bond(ticker):
             bond_ticker = ticker
             df = db.get_table_df_with_conditions(f'ACCOUNT_{self.id}_HISTORICAL_VALUE', "Date", f"{bond_ticker}_number_of_units, {bond_ticker}_value", Date = f">=__{start_date}")
-            df[['prize_of_one_unit','currency']] = df.apply(lambda x:  pd.Series(bond_interest.get_current_bond_value(bond_ticker, x.Date)), axis = 1)
-            df = df.drop(columns = ['currency'])
+            if self.market_data is not None and self.market_data.bond_values_for(bond_ticker) is not None:
+                df['prize_of_one_unit'] = df["Date"].map(self.market_data.bond_values_for(bond_ticker))
+            else:
+                df['prize_of_one_unit'] = bond_interest.get_bond_values(bond_ticker, df["Date"], db.conn)
             df[f'{bond_ticker}_number_of_units'] = pd.to_numeric(df[f'{bond_ticker}_number_of_units'], errors='coerce')
             df[f'{bond_ticker}_value'] = df[f'{bond_ticker}_number_of_units'] * df['prize_of_one_unit']
             df = df.drop(columns=["prize_of_one_unit", f'{bond_ticker}_number_of_units'])
             df = df.set_index("Date")
-            print(df)
-            self.append_historical_value_to(df_to_append = df, db=db)
-            return True
+            return df
 
-        elif ticker == "CASH":
-            df_historical_datas = db.get_table_df(f'ACCOUNT_{self.id}_HISTORICAL_VALUE')
-            df_historical_datas = df_historical_datas.set_index("Date")
-            df_historical_datas["CASH_value"] = df_historical_datas["CASH_number_of_units"]
-            df_historical_datas.to_sql(f"ACCOUNT_{self.id}_HISTORICAL_VALUE", db.conn, if_exists="replace")
-            return True
+        elif instruments.is_cash(ticker):
+            df = db.get_table_df_with_conditions(f'ACCOUNT_{self.id}_HISTORICAL_VALUE', "Date", "CASH_number_of_units", Date = f">=__{start_date}")
+            df = df.set_index("Date")
+            df["CASH_value"] = pd.to_numeric(df["CASH_number_of_units"], errors='coerce')
+            return df[["CASH_value"]]
 
         else:
-            return False 
+            return None
 
-    def calculate_historical_balance_and_append_to_db(self, db= db):
+    def calculate_historical_balance_and_append_to_db(self, db=None):
+        if db is None:
+            db = get_database()
         
         df_tickers = db.get_table_df('Transactions', "yahoo_ticker", where_condition= f" account_id == {self.id}")
         
@@ -339,19 +581,36 @@ class Account:
         tickers_list = list(df_tickers["yahoo_ticker"])
         table_name = f"ACCOUNT_{self.id}_HISTORICAL_VALUE"
         tickers_string = ','.join([f""" "{ticker}_value" """  for ticker in tickers_list])
-        df_historical_datas = db.get_table_df(table_name, "Date", tickers_string)
-        df_historical_datas[df_historical_datas.columns[1:]] = df_historical_datas[df_historical_datas.columns[1:]].apply(pd.to_numeric, errors='coerce')
-        df_historical_datas = df_historical_datas.fillna(method="ffill")
-        df_historical_datas = df_historical_datas.fillna(0)
-        df_historical_datas["account_balance"] = df_historical_datas.apply(lambda x: sum(x[1:]), axis=1)
-        result_df = df_historical_datas[["Date", "account_balance"]]
-        result_df = result_df.set_index("Date")
+        df_historical_datas = db.read_typed(f"SELECT Date, {tickers_string} FROM '{table_name}'", index="Date")
+        result_df = pd.DataFrame({"account_balance": self.sum_of_values(df_historical_datas).to_numpy()},
+                                 index=data_base.dates_of_ordinals(df_historical_datas.index))
         self.append_historical_value_to(df_to_append = result_df, db=db)
+
+    @staticmethod
+    def sum_of_values(df_values):
+        """
+        Returns the daily sum of '{ticker}_value' columns, the last known value of an instrument is used on days without a price.
+        Values are rounded to grosze and summed as integers.
+        """
+        if not all(pd.api.types.is_float_dtype(dtype) for dtype in df_values.dtypes):     #Typed frames (Database.read_typed) are numeric already
+            df_values = df_values.apply(pd.to_numeric, errors='coerce')
+        df_values = df_values.ffill()
+        df_values = df_values.fillna(0)
+        balance = money.MoneyArray.from_floats(df_values.to_numpy()).sum(axis=1)    #Exact sum of values rounded to grosze
+        return pd.Series(balance.to_floats(), index=df_values.index)
         
-    def historical_values_for_investmens_on(self, db= db):
+    def historical_values_for_investmens_on(self, db=None, sync_prices: bool=True):
+        """
+        Appends the values of the instruments of the account to ACCOUNT_{id}_HISTORICAL_VALUE and recalculates its dirty slices.
+        Close prices are downloaded first, unless sync_prices is False (the pipeline synchronizes them in its price_sync stage).
+        """
+        if db is None:
+            db = get_database()
         
+        table_exists = db.check_table_exists(f"ACCOUNT_{self.id}_HISTORICAL_VALUE")
         start_date = self.prepare_table_for_historical_value(db= db)
-        self.update_historical_data_for_tickers()
+        if self.market_data is None and sync_prices:    #Shared market data is synchronized by its owner
+            self.update_historical_data_for_tickers(db=db)
         if start_date < date.today():
             print("Aktualizujemy tabele z danymi historycznymi")
             start_date = str(start_date)
@@ -360,14 +619,127 @@ class Account:
             df.apply(lambda x: self.calculate_historical_value_for_ticker_and_append_to_db(ticker= x, db=db, start_date= start_date)) 
         else:
             print("Dane historyczne aktualne, nie obliczamy danych historycznych")
+
+        if table_exists:
+            self.recalculate_dirty_slices(db=db)
+        else:
+            self.clear_dirty_slices(db=db)    #The table has just been calculated from all transactions
+
+    def get_dirty_slices(self, db):
+        """
+        Returns a DataFrame (yahoo_ticker, from_date) of instruments of the account changed by transactions since the last valuation.
+        """
+        if not db.check_table_exists("DIRTY_SLICES"):
+            return pd.DataFrame(columns=["yahoo_ticker", "from_date"])
+        return db.read_sql("SELECT yahoo_ticker, from_date FROM DIRTY_SLICES WHERE account_id == ? ORDER BY from_date", (self.id,))
+
+    def clear_dirty_slices(self, db, df_dirty=None):
+        """
+        Removes recalculated slices. Slices marked again with an earlier date in the meantime are kept.
+        """
+        if not db.check_table_exists("DIRTY_SLICES"):
+            return
+        if df_dirty is None:
+            db.delete_rows("DIRTY_SLICES", {"account_id": self.id})
+            return
+        for ticker, from_date in zip(df_dirty["yahoo_ticker"], df_dirty["from_date"]):
+            db.delete_rows("DIRTY_SLICES", {"account_id": self.id, "yahoo_ticker": ticker, "from_date": from_date})
+
+    def recalculate_units_after_transactions(self, ticker: str, from_date: str, db):
+        """
+        Recalculates total_number_of_units_after_transaction of the transactions of a ticker made on from_date or later.
+
+        :return: Series of the number of units after the last transaction of every day, indexed by date of purchase.
+        """
+        df_transactions = db.read_sql("SELECT id, date_of_purchase, number_of_units, total_number_of_units_after_transaction FROM Transactions WHERE account_id == ? AND yahoo_ticker == ? ORDER BY date_of_purchase, id", (self.id, ticker))
+        df_transactions["total"] = pd.to_numeric(df_transactions["number_of_units"], errors='coerce').fillna(0).cumsum()
+        df_changed = df_transactions.loc[(df_transactions["date_of_purchase"] >= from_date) & (df_transactions["total"] != df_transactions["total_number_of_units_after_transaction"])]
+        for transaction_id, total in zip(df_changed["id"], df_changed["total"]):
+            db.update_data(table_name="Transactions", attribute_name= "total_number_of_units_after_transaction", attribute_value= total, item_id= int(transaction_id))
+        return df_transactions.drop_duplicates(subset=["date_of_purchase"], keep="last").set_index("date_of_purchase")["total"]
+
+    @tracing.traced("recalculate_dirty_slices")
+    def recalculate_dirty_slices(self, db=None):
+        """
+        Recalculates the historical values changed by inserted, updated or deleted transactions of the account.
+
+        For every dirty instrument the number of units and the value are recalculated from its from_date on,
+        then the account balance and the total cost from the earliest from_date on. Other instruments and earlier dates are not touched.
+        A change older than the first day of the historical table rebuilds the whole table.
+        The investment view (investment_view_by_type) should be up to date, it gives currencies of new instruments.
+
+        :return: The list of recalculated tickers.
+        :rtype: list
+        """
+        if db is None:
+            db = get_database()
+        table_name = f"ACCOUNT_{self.id}_HISTORICAL_VALUE"
+        df_dirty = self.get_dirty_slices(db)
+        df_dirty = df_dirty.loc[df_dirty["yahoo_ticker"] != '']
+        if df_dirty.empty:
+            return []
+        first_day = db.get_value(f'SELECT MIN(Date) FROM "{table_name}"') if db.check_table_exists(table_name) else None
+        if first_day is None or df_dirty["from_date"].min() < str(first_day)[:10]:
+            print(f"Zmiany transakcji sprzed pierwszego dnia tabeli {table_name}, przeliczamy całą tabelę")
+            #The full calculation reads units after every transaction, they are brought up to date first
+            for ticker, from_date in zip(df_dirty["yahoo_ticker"], df_dirty["from_date"]):
+                self.recalculate_units_after_transactions(ticker, from_date, db)
+            if db.check_table_exists(table_name):
+                db.drop_table(table_name)
+            self.historical_values_for_investmens_on(db=db, sync_prices=False)    #Prices were synchronized before the dirty slices
+            self.calculate_historical_balance_and_append_to_db(db=db)
+            self.calculate_historical_total_cost_for(db=db)
+            return list(df_dirty["yahoo_ticker"])
+
+        print(f"Przeliczamy zmienione transakcjami instrumenty: {dict(zip(df_dirty['yahoo_ticker'], df_dirty['from_date']))}")
+        self.add_missing_ticker_columns(table_name, list(df_dirty["yahoo_ticker"]), db)
+        df_history = db.get_table_df(table_name).set_index("Date")
+
+        #Number of units of dirty instruments
+        held_tickers = []
+        for ticker, from_date in zip(df_dirty["yahoo_ticker"], df_dirty["from_date"]):
+            units = self.recalculate_units_after_transactions(ticker, from_date, db)
+            if not units.empty:
+                held_tickers.append(ticker)
+            in_slice = df_history.index >= from_date
+            daily_units = units.reindex(units.index.union(df_history.index)).ffill().reindex(df_history.index)
+            df_history.loc[in_slice, f"{ticker}_number_of_units"] = daily_units[in_slice].fillna(0)
+        db.write_df(df_history, table_name)
+
+        #Values of dirty instruments
+        for ticker, from_date in zip(df_dirty["yahoo_ticker"], df_dirty["from_date"]):
+            in_slice = df_history.index >= from_date
+            if ticker not in held_tickers:     #All transactions of the instrument were deleted
+                df_history.loc[in_slice, f"{ticker}_value"] = 0.0
+                continue
+            df_value = self.get_historical_value_df_for(ticker = ticker, db = db, start_date = from_date)
+            if df_value is not None:
+                df_history.loc[in_slice, f"{ticker}_value"] = pd.to_numeric(df_value[f"{ticker}_value"], errors='coerce').reindex(df_history.index[in_slice]).to_numpy()
+
+        #Account balance and total cost
+        first_date = df_dirty["from_date"].min()
+        in_slice = df_history.index >= first_date
+        value_columns = [column for column in df_history.columns if column.endswith("_value")]
+        df_history.loc[in_slice, "account_balance"] = self.sum_of_values(df_history[value_columns])[in_slice]
+        if "total_cost" in df_history.columns:
+            df_total_cost = self.get_historical_total_cost_df_for(db = db)
+            df_history.loc[in_slice, "total_cost"] = df_total_cost["total_cost"].reindex(df_history.index[in_slice]).to_numpy()
+        db.write_df(df_history, table_name)
+        self.clear_dirty_slices(db, df_dirty)
+        print(f"[###############100%###############] Recalculated {len(df_dirty)} instruments of account {self.id} from {first_date}")
+        return list(df_dirty["yahoo_ticker"])
     
-    def update_historical_data_for_tickers(self):
+    def update_historical_data_for_tickers(self, db=None):
+        if db is None:
+            db = get_database()
         df = db.get_table_df(f"INVESTMENT_VIEW_ACCOUNT_{self.id}", "yahoo_ticker")
         df = df["yahoo_ticker"].loc[df["yahoo_ticker"] != '']
         df.apply(lambda x: yfin.download_historical_data(ticker= x,
-                         name_of_db="invest_tracker_data_base"))   
+                         name_of_db= db.name))
 
-    def get_dates_of_purchases_df_for(self, db= db):
+    def get_dates_of_purchases_df_for(self, db=None):
+        if db is None:
+            db = get_database()
         df_transactions_dates = db.get_table_df_with_conditions('Transactions', "date_of_purchase", account_id = f"{self.id}")
         df_transactions_dates = df_transactions_dates.drop_duplicates()
         df_transactions_dates = df_transactions_dates.rename(columns = {"date_of_purchase": "Date"}) 
@@ -380,13 +752,21 @@ class Account:
         total_cost_for_date = df_subset["total_cost"].sum()
         return total_cost_for_date
     
-    def calculate_historical_total_cost_for(self, db= db):
+    def get_historical_total_cost_df_for(self, db):
+        """
+        Returns a DataFrame indexed by dates of purchases with the 'total_cost' column - cost of all transactions made up to the date.
+        """
         df_transactions = db.get_table_df_with_conditions('Transactions', "date_of_purchase", "total_cost", account_id = f"{self.id}")
         
         df_transactions_dates = self.get_dates_of_purchases_df_for(db = db)
         df_transactions_dates['total_cost'] = df_transactions_dates.apply(lambda x: self.calculate_total_cost_to_date(x["Date"], df_transactions), axis=1)
         df_transactions_dates = df_transactions_dates.set_index("Date")
-        df_historical_total_cost = df_transactions_dates
+        return df_transactions_dates
+
+    def calculate_historical_total_cost_for(self, db=None):
+        if db is None:
+            db = get_database()
+        df_historical_total_cost = self.get_historical_total_cost_df_for(db = db)
         self.append_historical_value_to(df_to_append = df_historical_total_cost, db = db)
         return True
 
@@ -418,16 +798,18 @@ class Transaction:
 
         #Actions to execute    
         #Add transaction to data base
-        db.insert("Transactions", (None, self.account_id, self.date_of_purchase, self.operation_ticker, self.type_of_transaction_value, self.currency, self.number_of_units, str(self.price_of_one_unit), str(self.commission), self.yahoo_ticker, None, None, None, None, self.type_of_investment))
-       
-        #Get id from database
-        self.id = db.get_last_id(table_name = "Transactions")
+        #Get id from database (rowid of the inserted row)
+        db = get_database()
+        self.id = db.insert("Transactions", (None, self.account_id, self.date_of_purchase, self.operation_ticker, self.type_of_transaction_value, self.currency, self.number_of_units, str(self.price_of_one_unit), str(self.commission), self.yahoo_ticker, None, None, None, None, self.type_of_investment))
 
         self.transaction_value = self.calculate_transaction_value()
         db.update_data(table_name="Transactions", attribute_name= "total_cost", attribute_value= self.transaction_value, item_id= self.id)
 
+        #Units and balance after the transaction are kept by the triggers of POSITIONS and Accounts
         self.total_number_of_units_after_transaction = self.get_total_number_of_units()
-        db.update_data(table_name="Transactions", attribute_name= "total_number_of_units_after_transaction", attribute_value= self.total_number_of_units_after_transaction, item_id= self.id)        
+        self.account_balance_after_operation = db.get_value("SELECT balance FROM Accounts WHERE id = ?", (self.account_id,))
+        db.execute("UPDATE Transactions SET total_number_of_units_after_transaction = ?, account_balance_after_operation = ? WHERE id = ?",
+                   (int(self.total_number_of_units_after_transaction), self.account_balance_after_operation, self.id))
 
     @property
     def id(self):
@@ -454,17 +836,52 @@ class Transaction:
         self._commission = commission
 
     def calculate_transaction_value(self):
-        if self.currency != "PLN":
-            rate = nbp.get_exchange_rate(self.currency,self.date_of_purchase)
+        return self.transaction_value_of(self.currency, self.date_of_purchase, self.number_of_units, self.price_of_one_unit, self.commission)
+
+    @staticmethod
+    def transaction_value_of(currency: str, date_of_purchase: str, number_of_units: int, price_of_one_unit: float, commission: float):
+        if currency != "PLN":
+            rate = nbp.get_exchange_rate(currency, date_of_purchase)
         else:
             rate = 1
-        transaction_value = self.number_of_units * self.price_of_one_unit * rate + self.commission
+        transaction_value = number_of_units * price_of_one_unit * rate + commission
         return transaction_value  #Calculated with commission
 
+    @classmethod
+    def update_transaction(cls, transaction_id: int, **changes):
+        """
+        Changes columns of a stored transaction and recalculates its total cost.
+
+        The triggers of the Transactions table mark the changed instrument as dirty, the next valuation recalculates it.
+
+        Example usage:
+        ```python
+        Transaction.update_transaction(12, number_of_units=15, price_of_one_unit=101.5)
+        ```
+        """
+        db = get_database()
+        db.update_table("Transactions", changes, {"id": transaction_id})
+        df_transaction = db.read_sql("SELECT currency, date_of_purchase, number_of_units, price_of_one_unit, commission FROM Transactions WHERE id == ?", (transaction_id,))
+        transaction = df_transaction.iloc[0]
+        transaction_value = cls.transaction_value_of(transaction["currency"], transaction["date_of_purchase"], int(transaction["number_of_units"]),
+                                                     float(transaction["price_of_one_unit"]), float(transaction["commission"]))
+        db.update_data(table_name="Transactions", attribute_name= "total_cost", attribute_value= transaction_value, item_id= transaction_id)
+
+    @classmethod
+    def delete_transaction(cls, transaction_id: int):
+        """
+        Deletes a stored transaction. The triggers of the Transactions table mark its instrument as dirty.
+        """
+        db = get_database()
+        return db.delete_rows("Transactions", {"id": transaction_id})
+
     def get_total_number_of_units(self):
-        Transaction_df = pd.read_sql("SELECT * FROM Transactions", db.conn)
-        total = Transaction_df[ (Transaction_df["account_id"] == self.account_id)  &  (Transaction_df["type_of_transaction_value"] == self.type_of_transaction_value)].number_of_units.sum()
-        return total
+        """
+        Returns units of the type in the account after all stored transactions, a primary key lookup in the POSITIONS table.
+        """
+        db = get_database()
+        return db.get_value("SELECT number_of_units FROM POSITIONS WHERE account_id = ? AND type_of_transaction_value = ?",
+                            (self.account_id, self.type_of_transaction_value), default=0)
 
     def __repr__(self):
         #repr_string = f"Transaction('{self.id}', '{self.account_id}', '{self.date_of_purchase}', '{self.operation_ticker}', '{self.type_of_transaction_value}', '{self.currency}', '{self.number_of_units}', '{self.price_of_one_unit}', '{self.price_of_one_unit}', '{self.commission}', '{self.transaction_value}', '{self.account_balance_after_the_operation}', '{self.number_of_units_after_transaction}')"
@@ -473,59 +890,75 @@ class Transaction:
         return f"Transaction id: '{self.id}' "
 
     @classmethod
-    def import_transactions_from_csv(cls):
-        with open('transakcje.csv', 'r', encoding="utf-8") as file:
-            reader = csv.DictReader(file, delimiter=';')
-            
-            for transaction in reader:
-                Transaction(account_id = int(transaction['account_id']), 
-                            date_of_purchase = transaction['date_of_purchase'], 
-                            operation_ticker = transaction['operation_ticker'], 
-                            type_of_transaction_value = transaction['type_of_transaction_value'], 
-                            currency = transaction['currency'], 
-                            number_of_units = int(transaction['number_of_units']), 
-                            price_of_one_unit = float(transaction['price_of_one_unit']), 
-                            commission = float(transaction['commission']),
-                            yahoo_ticker = transaction['yahoo_ticker'],
-                            type_of_investment = transaction['type_of_investment'])
+    def import_transactions_from_csv(cls, URL: str='transakcje.csv', chunk_rows: int=transaction_ingestion.default_chunk_rows, workers: int=None):
+        """
+        Imports transactions of a CSV file, or of a list of files, in date order. Rows imported before are skipped.
+        Returns the number of imported transactions.
+        """
+        return transaction_ingestion.ingest_csv_files(get_database(), URL, chunk_rows, workers)
     
     @classmethod
-    def sorting_transactions_csv_by_date(cls, URL):
-        df = pd.read_csv(URL,
-                         sep=";",
-                         encoding="utf-8")
-        df = df.sort_values(by=["date_of_purchase"])
-        df.to_csv(URL, index=False, sep=";", encoding="utf-8")
-
-
-
-def main():
-    
-    db = data_base.Database("invest_tracker_data_base")
-
-    if db.check_table_exists("Accounts"):
-        db.drop_table("Accounts")
-    db.create_table("Accounts", "id INTEGER PRIMARY KEY AUTOINCREMENT", "name", "balance REAL", "currency")
-
-    account1 = Account("Porfel Długoterminowy")
-
-    Transaction.import_transactions_from_csv()
-
-    nbp.check_nbp_api_for_new_exchange_rates(["USD", "GBP", "EUR"])
-
-    account1.actual_balance()
-    
-    account1.investment_view_by_type()
-    
-    account1.update_historical_data_for_tickers()
-
-    account1.historical_values_for_investmens_on(db=db)
-
-    account1.calculate_historical_balance_and_append_to_db(db =db)
-
-    account1.calculate_historical_total_cost_for(db=db)
-
-    account1.figure_plot_for_account()
+    def sorting_transactions_csv_by_date(cls, URL, chunk_rows: int=transaction_ingestion.default_chunk_rows):
+        transaction_ingestion.sort_csv_by_date(URL, chunk_rows=chunk_rows)
+
+
+def hot_queries_for(account_id: int, tickers: list=list()):
+    """
+    Returns the queries run for every ticker of an account, in the form accepted by Database.check_query_plans.
+    """
+    queries = {
+        "transactions_of_account": ("SELECT yahoo_ticker, total_number_of_units_after_transaction, total_cost FROM Transactions WHERE account_id == ?", (account_id,)),
+        "transactions_of_account_by_date": ("SELECT date_of_purchase, yahoo_ticker, total_number_of_units_after_transaction FROM Transactions WHERE account_id == ? ORDER BY date_of_purchase ASC", (account_id,)),
+        "units_of_instrument": ("SELECT SUM(number_of_units) FROM Transactions WHERE account_id == ? AND yahoo_ticker == ?", (account_id, "")),
+        "investment_view_positions": ("SELECT type_of_transaction_value, SUM(total_cost), MAX(id) FROM Transactions WHERE account_id == ? GROUP BY type_of_transaction_value", (account_id,)),
+        "first_purchase_of_bond": ("SELECT MIN(date_of_purchase) FROM Transactions WHERE yahoo_ticker == ?", ("",)),
+        "exchange_rates_from_date": ("SELECT * FROM EXCHANGE_RATE_TABLE WHERE Date >= ?", ("",)),
+        "last_exchange_rate_date": ("SELECT MAX(Date) FROM EXCHANGE_RATE_TABLE", ()),
+    }
+    for ticker in tickers:
+        queries[f"prices_of_{ticker}_from_date"] = (f"SELECT Date, Close FROM '{ticker}' WHERE Date >= ?", ("",))
+    return queries
+
+def check_schema(db, account_id: int=1):
+    """
+    Checks EXPLAIN QUERY PLAN of the hot queries and reports the ones that fall back to a full table scan.
+    Tables which don't exist yet are skipped.
+    """
+    tickers = list(db.get_table_df("Transactions", "yahoo_ticker")["yahoo_ticker"].drop_duplicates())
+    queries = {}
+    for query_name, (query, params) in hot_queries_for(account_id, tickers).items():
+        try:
+            db.explain_query_plan(query, params)
+        except sqlite3.OperationalError:
+            continue
+        queries[query_name] = (query, params)
+    full_scans = db.check_query_plans(queries)
+    if not full_scans:
+        print("All hot queries use indexes.")
+    return full_scans
+
+
+def main(trace_path: str="invest_tracker_trace.json", database_name: str="invest_tracker_data_base", only: list=None, start_from: str=None,
+         force: bool=False, workers: int=4):
+    """
+    Runs the stages of the pipeline (pipeline.create_default_pipeline), independent ones concurrently and unchanged ones skipped.
+    A part of the pipeline is run with only (names of stages) or start_from (a stage and every stage after it).
+    """
+    import pipeline     #pipeline imports this module
+
+    #Record duration, rows and caller of every statement, summary is printed at the end
+    data_base.Database.enable_instrumentation(slow_query_threshold=0.1)
+    #Record every stage as a span, the trace is saved as Chrome trace JSON at the end
+    tracing.enable_tracing()
+
+    try:
+        db = pipeline.tracker.get_database(database_name)
+        db.set_journal_mode("WAL")
+        pipeline.create_default_pipeline(database_name).run(db, only, start_from, force, workers)
+    finally:
+        data_base.Database.print_query_summary()
+        tracing.print_summary()
+        tracing.export_chrome_trace(trace_path)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Lazy import of heavy libraries
+
+Importing pandas, plotly, yfinance or requests takes most of the start time of the application, even when the code path which needs them never runs.
+`lazy_module` returns a placeholder which imports the real module on the first attribute access, so modules can keep the usual
+
+    pd = lazy_module("pandas")
+    ...
+    pd.DataFrame(...)
+
+form without paying the import cost at start.
+
+Functions:
+- lazy_module(name: str, on_import=None) -> LazyModule: Returns a placeholder of the module `name`. `on_import` is called with the module right after it is imported.
+"""
+
+
+
+import importlib
+
+
+class LazyModule:
+
+    def __init__(self, name: str, on_import=None):
+        self.__dict__["_name"] = name
+        self.__dict__["_on_import"] = on_import
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+            if self.__dict__["_on_import"] is not None:
+                self.__dict__["_on_import"](module)
+        return module
+
+    def __getattr__(self, attribute_name: str):
+        return getattr(self._load(), attribute_name)
+
+    def __setattr__(self, attribute_name: str, value):
+        setattr(self._load(), attribute_name, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_module(name: str, on_import=None):
+    return LazyModule(name, on_import)
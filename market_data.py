@@ -0,0 +1,105 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Market data shared by accounts
+
+The valuation of every account reads the same exchange rates, historical prices and government bond values.
+MarketData loads them from the data base once, so many accounts (also in other processes - the object can be pickled) can be valued without reading them again.
+With a MarketMatrixCache the exchange rates and close prices are not loaded at all - they are read from the memory-mapped matrices of the cache,
+which every worker process maps on its own.
+
+Classes:
+- MarketData: Exchange rates, close prices, last market prices and bond values for a set of tickers.
+    - load(cls, db, tickers: list, currencies: list, start_date: str, matrix_cache): Loads the market data from the data base.
+    - exchange_rates_for(self, currency: str, start_date: str): DataFrame indexed by Date with the '{currency}_PLN' column.
+    - prices_for(self, ticker: str, start_date: str): DataFrame indexed by Date with the 'Close' column.
+    - bond_values_for(self, ticker: str): Series of the value of one bond unit indexed by Date.
+    - last_market_price_of(self, ticker: str): Tuple (last market price, currency).
+    - current_exchange_rate_of(self, currency: str): Current '{currency}_PLN' rate.
+"""
+
+
+
+from datetime import date
+from lazy_import import lazy_module
+
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+import interest_goverment_bond as bond_interest
+import instruments
+
+pd = lazy_module("pandas")
+
+class MarketData:
+
+    def __init__(self, exchange_rates=None, prices: dict=None, bond_values: dict=None, last_market_prices: dict=None, current_exchange_rates: dict=None, matrix_cache=None):
+        self.exchange_rates = exchange_rates                        #DataFrame indexed by Date with '{currency}_PLN' columns
+        self.prices: dict = prices or {}                            #{ticker: DataFrame indexed by Date with 'Close' column}
+        self.bond_values: dict = bond_values or {}                  #{bond ticker: Series of value of one unit indexed by Date}
+        self.last_market_prices: dict = last_market_prices or {}    #{ticker: (last market price, currency)}
+        self.current_exchange_rates: dict = current_exchange_rates or {}    #{currency: rate}
+        self.matrix_cache = matrix_cache                            #MarketMatrixCache serving exchange rates and close prices, or None
+
+    @classmethod
+    def load(cls, db, tickers: list, currencies: list, start_date: str, matrix_cache=None):
+        """
+        Loads exchange rates, close prices, bond values, last market prices and current exchange rates of the given tickers and currencies.
+
+        Tickers and currencies are expected to be already synchronized with NBP, Yahoo and gov.pl.
+        When matrix_cache is given, only the new rows of exchange rates and close prices are appended to it instead of loading them.
+        """
+        tickers = [ticker for ticker in dict.fromkeys(tickers) if ticker]
+        currencies = [currency for currency in dict.fromkeys(currencies) if currency != "PLN"]
+        if matrix_cache is not None:
+            matrix_cache.update(db, [ticker for ticker in tickers if instruments.has_market_prices(ticker)], currencies)
+
+        exchange_rates = None
+        if currencies and matrix_cache is None and db.check_table_exists("EXCHANGE_RATE_TABLE"):
+            stored = set(db.get_column_names("EXCHANGE_RATE_TABLE"))
+            exchange_rates = db.get_table_df("EXCHANGE_RATE_TABLE", "Date", *[f"{currency}_PLN" for currency in currencies if f"{currency}_PLN" in stored])
+            exchange_rates = exchange_rates.drop_duplicates(subset=['Date'])
+            exchange_rates = exchange_rates.set_index("Date")
+
+        prices = {}
+        bond_values = {}
+        last_market_prices = {}
+        today = date.today()
+        for ticker in tickers:
+            if instruments.is_bond(ticker):
+                dates = pd.date_range(start_date, today, freq='D').strftime("%Y-%m-%d")
+                bond_values[ticker] = pd.Series(bond_interest.get_bond_values(ticker, dates, db.conn), index=dates)
+            elif instruments.has_market_prices(ticker) and matrix_cache is None and db.check_table_exists(ticker):
+                df_close_prize = db.get_table_df(ticker, "Date", "Close")
+                df_close_prize = df_close_prize.drop_duplicates(subset=['Date'])
+                prices[ticker] = df_close_prize.set_index("Date")
+            last_market_prices[ticker] = yfin.get_last_market_price(ticker)
+
+        current_exchange_rates = {currency: nbp.get_exchange_rate(currency) for currency in currencies}
+        current_exchange_rates["PLN"] = 1.00
+        return cls(exchange_rates, prices, bond_values, last_market_prices, current_exchange_rates, matrix_cache)
+
+    def exchange_rates_for(self, currency: str, start_date: str):
+        if self.matrix_cache is not None:
+            return self.matrix_cache.exchange_rates_for(currency, start_date)
+        column_name = f"{currency}_PLN"
+        if self.exchange_rates is None or column_name not in self.exchange_rates.columns:
+            return None
+        return self.exchange_rates.loc[self.exchange_rates.index >= start_date, [column_name]]
+
+    def prices_for(self, ticker: str, start_date: str):
+        if self.matrix_cache is not None:
+            return self.matrix_cache.prices_for(ticker, start_date)
+        if ticker not in self.prices:
+            return None
+        df_close_prize = self.prices[ticker]
+        return df_close_prize.loc[df_close_prize.index >= start_date]
+
+    def bond_values_for(self, ticker: str):
+        return self.bond_values.get(ticker)
+
+    def last_market_price_of(self, ticker: str):
+        return self.last_market_prices.get(ticker)
+
+    def current_exchange_rate_of(self, currency: str):
+        return self.current_exchange_rates.get(currency)
@@ -0,0 +1,274 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Memory-mapped price and exchange rate matrices
+
+Close prices and exchange rates are kept on disk as two dense float64 matrices with one row per calendar day, in the directory
+'{database_name}_matrix_cache' of the data base they are read from:
+
+    prices.{generation}.f64     dates x tickers     (Close)
+    prices.json                 header index: data base, data file, first date, number of rows, columns, last date, row count
+                                and sum of the quotations of every column
+    fx.{generation}.f64         dates x currencies  ({currency}_PLN)
+    fx.json
+
+Row i of a matrix is the day start_date + i, so a date is found without any search, and days without a quotation are NaN.
+The matrices are opened with numpy.memmap - a run (or any number of worker processes) maps the same file and reads it without parsing or copying.
+After a synchronization only the rows newer than the last date of every column are read from SQLite and appended to the file.
+A new ticker or currency, a header of another data base or quotations rewritten in SQLite (the row count or the sum up to the last date
+of a column changed, e.g. EXCHANGE_RATE_TABLE downloaded again) rebuild the matrix. It is written to a new data file and the header
+naming it is swapped in with one os.replace, so readers never see a partial matrix or a header of another file.
+
+Functions:
+- matrix_cache_directory_of(database_name: str): The cache directory of a data base.
+
+Classes:
+- MarketMatrixCache: Price and exchange rate matrices of a data base.
+    - update(self, db, tickers: list, currencies: list): Appends new rows from the data base, rebuilds a matrix when columns are added.
+    - matrix(self, name: str): Tuple (dates, columns, memory-mapped matrix) of "prices" or "fx".
+    - prices_for(self, ticker: str, start_date: str): DataFrame indexed by Date with the 'Close' column.
+    - exchange_rates_for(self, currency: str, start_date: str): DataFrame indexed by Date with the '{currency}_PLN' column.
+"""
+
+
+
+import glob
+import json
+import math
+import os
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+header_version = 2
+
+
+def matrix_cache_directory_of(database_name: str):
+    return f"{database_name}_matrix_cache"
+
+
+class MarketMatrixCache:
+
+    def __init__(self, database_name: str="invest_tracker_data_base", directory: str=None):
+        self.directory = directory or matrix_cache_directory_of(database_name)
+        self._opened = {}    #{matrix name: (header modification time, header, memmap)}
+
+    def __getstate__(self):
+        #Workers map the files themselves, memory maps are not pickled
+        return {"directory": self.directory, "_opened": {}}
+
+    def _path(self, name: str, extension: str):
+        return os.path.join(self.directory, f"{name}.{extension}")
+
+    def read_header(self, name: str):
+        path = self._path(name, "json")
+        if not os.path.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as file:
+            header = json.load(file)
+        return header if header.get("version") == header_version else None
+
+    def _write_header(self, name: str, header: dict):
+        path = self._path(name, "json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(header, file, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+    def _data_path(self, header: dict):
+        return os.path.join(self.directory, header["data_file"])
+
+    @staticmethod
+    def _database_of(db):
+        return os.path.abspath(db.name)
+
+    @staticmethod
+    def _day_number(day):
+        return int(np.datetime64(str(day)[:10], "D").astype(np.int64))
+
+    @staticmethod
+    def _is_stored(db, name: str, column: str):
+        if name == "prices":
+            return db.check_table_exists(column)
+        return db.check_table_exists("EXCHANGE_RATE_TABLE") and f"{column}_PLN" in db.get_column_names("EXCHANGE_RATE_TABLE")
+
+    @staticmethod
+    def _read_column(db, name: str, column: str, since: str=None):
+        """
+        Returns a Series of the quotations of one column newer than since, indexed by day number.
+        """
+        if name == "prices":
+            query, value_column = f"""SELECT Date, Close FROM "{column}" """, "Close"
+        else:
+            query, value_column = f"""SELECT Date, "{column}_PLN" FROM 'EXCHANGE_RATE_TABLE' """, f"{column}_PLN"
+        params = ()
+        if since is not None:
+            query += "WHERE Date > ? "
+            params = (since,)
+        df = db.read_sql(query + "ORDER BY Date", params)
+        df = df.drop_duplicates(subset=["Date"])
+        values = pd.to_numeric(df[value_column], errors='coerce')
+        days = np.array(df["Date"].astype(str).str[:10], dtype="datetime64[D]").astype(np.int64)
+        return pd.Series(values.to_numpy(dtype=np.float64), index=days).dropna()
+
+    @staticmethod
+    def _checksum(db, name: str, column: str, last_date: str):
+        """
+        Returns [number of quotations, their sum] of a column up to last_date. A different value shows that SQLite rows already in the matrix were rewritten.
+        """
+        if last_date is None:
+            return [0, 0.0]
+        if name == "prices":
+            query = f"""SELECT COUNT(Close), TOTAL(Close) FROM "{column}" WHERE substr(Date, 1, 10) <= ?"""
+        else:
+            query = f"""SELECT COUNT("{column}_PLN"), TOTAL("{column}_PLN") FROM 'EXCHANGE_RATE_TABLE' WHERE substr(Date, 1, 10) <= ?"""
+        count, total = db.read_sql(query, (last_date,)).iloc[0]
+        return [int(count), float(total)]
+
+    def _is_unchanged(self, db, name: str, column: str, header: dict):
+        checksum = self._checksum(db, name, column, header["last_dates"][column])
+        stored_count, stored_total = header["checksums"][column]
+        return checksum[0] == stored_count and math.isclose(checksum[1], stored_total, rel_tol=1e-12, abs_tol=1e-9)
+
+    def _remove_stale_data_files(self, name: str, data_file: str):
+        for path in glob.glob(self._path(name, "*.f64")):
+            if os.path.basename(path) != data_file:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass    #Still mapped by a reader (Windows), removed by the next rebuild
+
+    def _rebuild(self, db, name: str, columns: list, generation: int):
+        columns_data = {column: self._read_column(db, name, column) for column in columns}
+        days = [series.index for series in columns_data.values() if len(series)]
+        first_day = min(int(index.min()) for index in days) if days else self._day_number(pd.Timestamp.today().date())
+        last_day = max(int(index.max()) for index in days) if days else first_day
+        rows = last_day - first_day + 1
+
+        #A new file of the next generation, the header still names the previous one until it is replaced
+        data_file = f"{name}.{generation}.f64"
+        matrix = np.memmap(os.path.join(self.directory, data_file), dtype=np.float64, mode="w+", shape=(rows, max(len(columns), 1)))
+        matrix[:] = np.nan
+        last_dates = {}
+        for position, (column, series) in enumerate(columns_data.items()):
+            matrix[series.index.to_numpy() - first_day, position] = series.to_numpy()
+            last_dates[column] = str(np.datetime64(int(series.index.max()), "D")) if len(series) else None
+        matrix.flush()
+        del matrix
+        self._write_header(name, {"version": header_version,
+                                  "database": self._database_of(db),
+                                  "generation": generation,
+                                  "data_file": data_file,
+                                  "start_date": str(np.datetime64(first_day, "D")),
+                                  "rows": rows,
+                                  "columns": columns,
+                                  "last_dates": last_dates,
+                                  "checksums": {column: self._checksum(db, name, column, last_dates[column]) for column in columns}})
+        self._remove_stale_data_files(name, data_file)
+        return rows * len(columns)
+
+    def _append(self, db, name: str, header: dict):
+        first_day = self._day_number(header["start_date"])
+        columns = header["columns"]
+        stored = [column for column in columns if self._is_stored(db, name, column)]   #Columns no longer in the data base are kept as they are
+        if not all(self._is_unchanged(db, name, column, header) for column in stored):
+            return None     #Quotations already in the matrix were rewritten in SQLite, the matrix has to be rebuilt
+        new_data = {column: self._read_column(db, name, column, header["last_dates"][column]) for column in stored}
+        new_data = {column: series for column, series in new_data.items() if len(series)}
+        if not new_data:
+            return 0
+        if min(int(series.index.min()) for series in new_data.values()) < first_day:
+            return None     #Quotations older than the first row, the matrix has to be rebuilt
+
+        rows = max(header["rows"], max(int(series.index.max()) for series in new_data.values()) - first_day + 1)
+        path = self._data_path(header)
+        if rows > header["rows"]:
+            with open(path, "ab") as file:
+                file.write(np.full((rows - header["rows"]) * len(columns), np.nan, dtype=np.float64).tobytes())
+        matrix = np.memmap(path, dtype=np.float64, mode="r+", shape=(rows, len(columns)))
+        for column, series in new_data.items():
+            matrix[series.index.to_numpy() - first_day, columns.index(column)] = series.to_numpy()
+            header["last_dates"][column] = str(np.datetime64(int(series.index.max()), "D"))
+            header["checksums"][column] = self._checksum(db, name, column, header["last_dates"][column])
+        matrix.flush()
+        del matrix
+        header["rows"] = rows
+        self._write_header(name, header)
+        return sum(len(series) for series in new_data.values())
+
+    def update(self, db, tickers: list, currencies: list):
+        """
+        Brings the matrices up to date with the data base.
+
+        Only quotations newer than the last date of every column are read. Tickers or currencies missing in a matrix, a matrix of another
+        data base or quotations rewritten in the data base rebuild it.
+
+        :param tickers: Tickers with a table of close prices in the data base.
+        :param currencies: Currencies of the fx matrix. Currencies without a '{currency}_PLN' column in EXCHANGE_RATE_TABLE are reported and left out.
+        :return: A dictionary {matrix name: number of new quotations}.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fx_columns = [currency for currency in dict.fromkeys(currencies) if currency != "PLN"]
+        missing = [currency for currency in fx_columns if not self._is_stored(db, "fx", currency)]
+        if missing:
+            print(f"No exchange rates of {missing} in EXCHANGE_RATE_TABLE, they are left out of the fx matrix.")
+        wanted = {"prices": [ticker for ticker in dict.fromkeys(tickers) if db.check_table_exists(ticker)],
+                  "fx": [currency for currency in fx_columns if currency not in missing]}
+        updated = {}
+        for name, columns in wanted.items():
+            header = self.read_header(name)
+            generation = header["generation"] + 1 if header is not None else 1
+            if header is not None and header["database"] != self._database_of(db):
+                print(f"The {name} matrix of '{self.directory}' was built from '{header['database']}', it is rebuilt from '{db.name}'.")
+                header = None
+            if header is not None and os.path.isfile(self._data_path(header)) and set(columns) <= set(header["columns"]):
+                new_quotations = self._append(db, name, header)
+                if new_quotations is not None:
+                    updated[name] = new_quotations
+                    continue
+            previous_columns = [column for column in header["columns"] if self._is_stored(db, name, column)] if header is not None else []
+            updated[name] = self._rebuild(db, name, list(dict.fromkeys(previous_columns + columns)), generation)
+        print(f"[###############100%###############] Market matrix cache updated: {updated}")
+        return updated
+
+    def matrix(self, name: str):
+        """
+        Returns (dates, columns, matrix) of "prices" or "fx".
+
+        dates is a numpy datetime64[D] array of the rows, matrix a read-only memmap of shape (len(dates), len(columns)).
+        When the header changed since the last call, the file is mapped again.
+
+        :rtype: tuple
+        """
+        header_path = self._path(name, "json")
+        if not os.path.isfile(header_path):
+            return None
+        modified = os.stat(header_path).st_mtime_ns
+        if name not in self._opened or self._opened[name][0] != modified:
+            header = self.read_header(name)
+            if header is None:
+                return None
+            matrix = np.memmap(self._data_path(header), dtype=np.float64, mode="r", shape=(header["rows"], max(len(header["columns"]), 1)))
+            self._opened[name] = (modified, header, matrix)
+        header, matrix = self._opened[name][1:]
+        dates = np.datetime64(header["start_date"], "D") + np.arange(header["rows"])
+        return dates, header["columns"], matrix
+
+    def _column_df(self, name: str, column: str, value_column: str, start_date: str):
+        opened = self.matrix(name)
+        if opened is None or column not in opened[1]:
+            return None
+        dates, columns, matrix = opened
+        first_row = max(self._day_number(start_date) - int(dates[0].astype(np.int64)), 0) if len(dates) else 0
+        values = matrix[first_row:, columns.index(column)]
+        quoted = ~np.isnan(values)
+        df = pd.DataFrame({value_column: values[quoted]}, index=pd.Index(dates[first_row:][quoted].astype(str), name="Date"))
+        return df
+
+    def prices_for(self, ticker: str, start_date: str):
+        return self._column_df("prices", ticker, "Close", start_date)
+
+    def exchange_rates_for(self, currency: str, start_date: str):
+        return self._column_df("fx", currency, f"{currency}_PLN", start_date)
@@ -0,0 +1,227 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Fixed-point money
+
+Amounts are kept as integer minor units with an explicit scale (number of decimal places): 1234.56 PLN is Money(123456, 2, "PLN").
+Adding and subtracting minor units is exact. Multiplying by a rate is done on integers too - the rate is turned into an integer
+of rate_scale decimal places and the product is rounded back to the scale once, half to even (like the default rounding of Decimal).
+MoneyArray does the same for whole numpy int64 arrays, so a valuation doesn't round every element through Decimal or a string.
+
+int64 holds about 9.2e18 minor units. Multiplication by a rate needs minor units * rate * 10**rate_scale to fit,
+which for scale 2 and rate_scale 6 is any amount below about 10 billion at a rate below 10.
+
+Classes:
+- Money: A single amount of a currency.
+- MoneyArray: Amounts of one currency and scale in a numpy int64 array.
+
+Functions:
+- round_half_even_div(numerator, denominator): Integer division rounded half to even, for ints and int64 arrays.
+- to_minor(value: float, scale: int): Rounds a float to minor units.
+"""
+
+
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+
+default_rate_scale = 6      #Rates (exchange rates, interest) are multiplied as integers of millionths
+
+
+def round_half_even_div(numerator, denominator: int):
+    """
+    Returns numerator / denominator rounded half to even. Works for Python ints and numpy int64 arrays, denominator must be positive.
+    """
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    round_up = (twice > denominator) | ((twice == denominator) & (quotient % 2 == 1))
+    return quotient + round_up
+
+def to_minor(value: float, scale: int=2):
+    """
+    Rounds a float to an integer of minor units (half to even).
+    """
+    return int(round(value * 10 ** scale))
+
+
+class Money:
+
+    __slots__ = ("minor", "scale", "currency")
+
+    def __init__(self, minor: int, scale: int=2, currency: str="PLN"):
+        self.minor = int(minor)
+        self.scale = scale
+        self.currency = currency
+
+    @classmethod
+    def from_float(cls, value: float, scale: int=2, currency: str="PLN"):
+        return cls(to_minor(value, scale), scale, currency)
+
+    @classmethod
+    def parse(cls, text: str, scale: int=2, currency: str="PLN"):
+        """
+        Reads an amount written with a dot or a comma, e.g. "1234,567", without going through a float.
+        """
+        text = str(text).strip().replace(",", ".")
+        sign = -1 if text.startswith("-") else 1
+        whole, _, fraction = text.lstrip("+-").partition(".")
+        digits = len(fraction)
+        minor = int(whole or "0") * 10 ** digits + int(fraction or "0")
+        if digits > scale:
+            minor = round_half_even_div(minor, 10 ** (digits - scale))
+        else:
+            minor *= 10 ** (scale - digits)
+        return cls(sign * minor, scale, currency)
+
+    def rescale(self, scale: int):
+        if scale >= self.scale:
+            return Money(self.minor * 10 ** (scale - self.scale), scale, self.currency)
+        return Money(round_half_even_div(self.minor, 10 ** (self.scale - scale)), scale, self.currency)
+
+    def multiply(self, numerator: int, denominator: int=1):
+        """
+        Returns the amount multiplied by the exact fraction numerator / denominator, rounded to the scale.
+        """
+        return Money(round_half_even_div(self.minor * numerator, denominator), self.scale, self.currency)
+
+    def multiply_by_rate(self, rate: float, rate_scale: int=default_rate_scale):
+        return self.multiply(to_minor(rate, rate_scale), 10 ** rate_scale)
+
+    def _aligned(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Can't combine {self.currency} and {other.currency} amounts.")
+        scale = max(self.scale, other.scale)
+        return self.rescale(scale), other.rescale(scale)
+
+    def __add__(self, other):
+        first, second = self._aligned(other)
+        return Money(first.minor + second.minor, first.scale, self.currency)
+
+    def __sub__(self, other):
+        first, second = self._aligned(other)
+        return Money(first.minor - second.minor, first.scale, self.currency)
+
+    def __neg__(self):
+        return Money(-self.minor, self.scale, self.currency)
+
+    def __mul__(self, factor):
+        if isinstance(factor, int):
+            return Money(self.minor * factor, self.scale, self.currency)
+        return self.multiply_by_rate(factor)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            return False
+        first, second = self._aligned(other)
+        return first.minor == second.minor
+
+    def __lt__(self, other):
+        first, second = self._aligned(other)
+        return first.minor < second.minor
+
+    def __hash__(self):
+        minor, scale = self.minor, self.scale
+        while scale > 0 and minor % 10 == 0:
+            minor, scale = minor // 10, scale - 1
+        return hash((minor, scale, self.currency))
+
+    def __float__(self):
+        return self.minor / 10 ** self.scale
+
+    def __str__(self):
+        sign = "-" if self.minor < 0 else ""
+        whole, fraction = divmod(abs(self.minor), 10 ** self.scale)
+        return f"{sign}{whole}.{fraction:0{self.scale}d} {self.currency}" if self.scale else f"{sign}{whole} {self.currency}"
+
+    def __repr__(self):
+        return f"Money({self.minor}, {self.scale}, '{self.currency}')"
+
+
+class MoneyArray:
+
+    __slots__ = ("minor", "scale", "currency")
+
+    def __init__(self, minor, scale: int=2, currency: str="PLN"):
+        self.minor = np.asarray(minor, dtype=np.int64)
+        self.scale = scale
+        self.currency = currency
+
+    @classmethod
+    def from_floats(cls, values, scale: int=2, currency: str="PLN"):
+        """
+        Rounds floats to minor units (half to even). Values must be finite, NaN should be filled before.
+        """
+        return cls(np.rint(np.asarray(values, dtype=np.float64) * 10 ** scale).astype(np.int64), scale, currency)
+
+    def to_floats(self):
+        return self.minor / 10 ** self.scale
+
+    def rescale(self, scale: int):
+        if scale >= self.scale:
+            return MoneyArray(self.minor * 10 ** (scale - self.scale), scale, self.currency)
+        return MoneyArray(round_half_even_div(self.minor, 10 ** (self.scale - scale)), scale, self.currency)
+
+    def multiply(self, numerator, denominator: int=1):
+        """
+        Multiplies every amount by the exact fraction numerator / denominator (numerator can be an int64 array), rounded to the scale.
+        """
+        return MoneyArray(round_half_even_div(self.minor * np.asarray(numerator, dtype=np.int64), denominator), self.scale, self.currency)
+
+    def multiply_by_rates(self, rates, rate_scale: int=default_rate_scale, currency: str=None):
+        """
+        Multiplies every amount by a rate (float or array of floats), e.g. converts to another currency with exchange rates.
+        """
+        rates_minor = np.rint(np.asarray(rates, dtype=np.float64) * 10 ** rate_scale).astype(np.int64)
+        result = self.multiply(rates_minor, 10 ** rate_scale)
+        result.currency = currency or self.currency
+        return result
+
+    def _aligned(self, other):
+        if isinstance(other, Money):
+            other = MoneyArray(np.int64(other.minor), other.scale, other.currency)
+        if other.currency != self.currency:
+            raise ValueError(f"Can't combine {self.currency} and {other.currency} amounts.")
+        scale = max(self.scale, other.scale)
+        return self.rescale(scale), other.rescale(scale)
+
+    def __add__(self, other):
+        first, second = self._aligned(other)
+        return MoneyArray(first.minor + second.minor, first.scale, self.currency)
+
+    def __sub__(self, other):
+        first, second = self._aligned(other)
+        return MoneyArray(first.minor - second.minor, first.scale, self.currency)
+
+    def __neg__(self):
+        return MoneyArray(-self.minor, self.scale, self.currency)
+
+    def sum(self, axis: int=None):
+        """
+        Exact sum of amounts. Returns Money, or MoneyArray when summing along an axis of a 2D array.
+        """
+        total = self.minor.sum(axis=axis)
+        if axis is None:
+            return Money(int(total), self.scale, self.currency)
+        return MoneyArray(total, self.scale, self.currency)
+
+    def cumsum(self, axis: int=None):
+        return MoneyArray(self.minor.cumsum(axis=axis), self.scale, self.currency)
+
+    def __len__(self):
+        return len(self.minor)
+
+    def __getitem__(self, position):
+        if np.ndim(self.minor[position]) == 0:
+            return Money(int(self.minor[position]), self.scale, self.currency)
+        return MoneyArray(self.minor[position], self.scale, self.currency)
+
+    def __repr__(self):
+        return f"MoneyArray({self.minor!r}, {self.scale}, '{self.currency}')"
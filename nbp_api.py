@@ -1,18 +1,23 @@
-from requests import get
-from datetime import date, timedelta, datetime
-import pandas as pd
+from datetime import date, time, timedelta, datetime
 import sqlite3 as sql
 import data_base
+import tracing
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+requests = lazy_module("requests")
+
+nbp_publication_time = time(12, 15)     #NBP publishes table A of exchange rates on working days at about 12:15
+currencies_available = ("thb", "usd", "aud", "hkd", "cad",
+                        "nzd", "sgd", "eur", "huf", "chf",
+                        "gbp", "uah", "jpy", "czk", "dkk",
+                        "isk", "nok", "sek", "ron", "bgn",
+                        "try", "ils", "clp", "php", "mxn",
+                        "myr", "idr", "inr", "krw", "cny")   #Currencies of table A
 
 
 def get_exchange_rate(currency_code: str, date_param: str= str(date.today())):
     currency_code = currency_code.strip().lower()
-    currencies_available = ("thb", "usd", "aud", "hkd", "cad",
-                            "nzd", "sgd", "eur", "huf", "chf",
-                            "gbp", "uah", "jpy", "czk", "dkk",
-                            "isk", "nok", "sek", "ron", "bgn",
-                            "try", "ils", "clp", "php", "mxn",
-                            "myr", "idr", "inr", "krw", "cny")
     if currency_code == "pln":
         rate = 1.00
         return rate
@@ -48,18 +53,13 @@ def get_response_from_url(currency_code:str, date_param: str):
     prefix = "http://api.nbp.pl/api/exchangerates/rates/a"
     suffix = "?format=json"
     url = "/".join((prefix, currency_code, date_param, suffix))
-    response = get(url) #Status 2xx- wszystko ok, 3xx- przekierowanie, 404 - coś zepsuł użytkownik, 5xx- cos się stało po stronie serwera    
+    tracing.count("http_calls")
+    response = requests.get(url) #Status 2xx- wszystko ok, 3xx- przekierowanie, 404 - coś zepsuł użytkownik, 5xx- cos się stało po stronie serwera    
 
     return response
 
 def get_exchange_rates_from_date_range(currency_code: str, start_date: str, end_date: str):
     currency_code = currency_code.strip().lower()
-    currencies_available = ("thb", "usd", "aud", "hkd", "cad",
-                            "nzd", "sgd", "eur", "huf", "chf",
-                            "gbp", "uah", "jpy", "czk", "dkk",
-                            "isk", "nok", "sek", "ron", "bgn",
-                            "try", "ils", "clp", "php", "mxn",
-                            "myr", "idr", "inr", "krw", "cny")
     if currency_code not in currencies_available:
         raise AttributeError(f"Can't check '{currency_code}' rate.")
 
@@ -81,16 +81,18 @@ def get_exchange_rates_from_date_range(currency_code: str, start_date: str, end_
     df = df.set_index("Date")
     return df
 
-def get_data_frame_exchange_rates_of(list_of_currencies_codes: list=list(), start_date: str="", end_date: str=""):
-    conn = sql.connect("invest_tracker_data_base")
+def get_data_frame_exchange_rates_of(list_of_currencies_codes: list=list(), start_date: str="", end_date: str="", name_of_db: str="invest_tracker_data_base"):
+    if not list_of_currencies_codes:
+        return
+    conn = sql.connect(name_of_db)
     print(f"Uploading data from '{start_date}' to '{end_date}'", end=" ")
-    df1 = get_exchange_rates_from_date_range(list_of_currencies_codes[0],str(start_date),str(end_date))
-    df2 = get_exchange_rates_from_date_range(list_of_currencies_codes[1],str(start_date),str(end_date))
-    result = pd.concat([df1, df2], axis=1)
-    for currencies in list_of_currencies_codes[2:]:
-        df3 = get_exchange_rates_from_date_range(currencies,str(start_date),str(end_date))
-        result = pd.concat([result, df3], axis=1)
-    result.to_sql('EXCHANGE_RATE_TABLE', conn, if_exists="append")
+    with tracing.span("nbp_window", "window", start_date=str(start_date), end_date=str(end_date)):
+        #Rates of every currency joined on Date, any number of currencies
+        frames = [get_exchange_rates_from_date_range(currency, str(start_date), str(end_date)) for currency in list_of_currencies_codes]
+        result = pd.concat(frames, axis=1)
+        result.to_sql('EXCHANGE_RATE_TABLE', conn, if_exists="append")
+        tracing.count("rows", len(result))
+    conn.close()
     print("DONE")
 
 def check_valid_date_parameter(start_date: str, end_date: str):
@@ -119,8 +121,8 @@ def divide_period(start_date: str, end_date: str, period_length: int = 90):
         periods = delta_time.days // period_length
     return periods
 
-def redownload_all_exchange_rates_in_data_base_from(list_of_currencies_codes: list=list()):
-    conn = sql.connect("invest_tracker_data_base")
+def redownload_all_exchange_rates_in_data_base_from(list_of_currencies_codes: list=list(), name_of_db: str="invest_tracker_data_base"):
+    conn = sql.connect(name_of_db)
     cur = conn.cursor()
     cur.executescript("""DROP TABLE IF EXISTS 'EXCHANGE_RATE_TABLE'""")
     start_date="2002-01-02"
@@ -132,68 +134,102 @@ def redownload_all_exchange_rates_in_data_base_from(list_of_currencies_codes: li
         if start_date + single_query_dates_interval <= end_date:
             if start_date + timedelta(days = 90) == end_date:
                 single_query_dates_interval += timedelta(days = 1)
-            get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(start_date + single_query_dates_interval))    
+            get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(start_date + single_query_dates_interval), name_of_db)    
             start_date = start_date + single_query_dates_interval + timedelta(days = 1)
         else:
-            get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(end_date))     
+            get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(end_date), name_of_db)
             start_date = start_date + single_query_dates_interval
     conn.commit()
 
 
-def check_nbp_api_for_new_exchange_rates(list_of_currencies_codes: list=list()):
-    conn = sql.connect("invest_tracker_data_base")
+def last_publication_date(now: datetime=None):
+    """
+    Returns the date of the newest table A which NBP should have published at the given moment.
+
+    Table A is published on working days at about 12:15 (nbp_publication_time). Public holidays are not known,
+    a missing table is reported by the API as 404.
+    """
+    now = now or datetime.now()
+    day = now.date()
+    if day.isoweekday() > 5 or now.time() < nbp_publication_time:
+        day -= timedelta(days = 1)
+    while day.isoweekday() > 5:
+        day -= timedelta(days = 1)
+    return day
+
+def supported_currencies_of(list_of_currencies_codes: list):
+    """
+    Returns the codes of currencies published in table A (upper case, without PLN), other codes are reported and skipped.
+    """
+    supported = []
+    for currency_code in dict.fromkeys(code.strip().upper() for code in list_of_currencies_codes if code):
+        if currency_code == "PLN":
+            continue
+        if currency_code.lower() in currencies_available:
+            supported.append(currency_code)
+        else:
+            print(f"Waluta '{currency_code}' nie jest publikowana w tabeli A NBP, pomijam")
+    return supported
+
+def add_missing_currencies(list_of_currencies_codes: list=list(), name_of_db: str="invest_tracker_data_base"):
+    """
+    Adds a '{currency}_PLN' column to EXCHANGE_RATE_TABLE for every currency without one and fills it for the dates in the table,
+    so appended rows of new currencies find their columns and their history isn't empty.
+
+    :return: The codes of added currencies.
+    :rtype: list
+    """
+    conn = sql.connect(name_of_db)
     cur = conn.cursor()
-    
+    columns = [row[1] for row in cur.execute("PRAGMA table_info('EXCHANGE_RATE_TABLE')")]
+    missing = [currency_code for currency_code in supported_currencies_of(list_of_currencies_codes) if f"{currency_code}_PLN" not in columns]
+    first_date, last_date = cur.execute("SELECT MIN(Date), MAX(Date) FROM 'EXCHANGE_RATE_TABLE'").fetchone()
+    for currency_code in missing:
+        print(f"Adding '{currency_code}_PLN' to EXCHANGE_RATE_TABLE", end=" ")
+        cur.execute(f"""ALTER TABLE 'EXCHANGE_RATE_TABLE' ADD COLUMN "{currency_code}_PLN" REAL""")
+        start_date = datetime.strptime(first_date[:10], "%Y-%m-%d").date() if first_date else None
+        end_date = datetime.strptime(last_date[:10], "%Y-%m-%d").date() if last_date else None
+        while start_date is not None and start_date <= end_date:
+            window_end = min(start_date + timedelta(days = 89), end_date)
+            try:
+                df = get_exchange_rates_from_date_range(currency_code, str(start_date), str(window_end))
+                cur.executemany(f"""UPDATE 'EXCHANGE_RATE_TABLE' SET "{currency_code}_PLN" = ? WHERE Date == ?""",
+                                [(rate, day) for day, rate in df[f"{currency_code}_PLN"].items()])
+            except AttributeError:
+                pass    #No tables in the window
+            start_date = window_end + timedelta(days = 1)
+        conn.commit()
+        print("DONE")
+    conn.close()
+    return missing
+
+def check_nbp_api_for_new_exchange_rates(list_of_currencies_codes: list=list(), name_of_db: str="invest_tracker_data_base"):
+    conn = sql.connect(name_of_db)
+    cur = conn.cursor()
+    list_of_currencies_codes = supported_currencies_of(list_of_currencies_codes or ["USD", "GBP", "EUR"])
 
 
     cur.execute(f"""SELECT name FROM sqlite_master WHERE type == 'table' AND name == 'EXCHANGE_RATE_TABLE'""")
     result = cur.fetchone()
     if result == None:
-        redownload_all_exchange_rates_in_data_base_from(["USD", "GBP", "EUR"])
-    else:
-        print("cos")
+        redownload_all_exchange_rates_in_data_base_from(list_of_currencies_codes, name_of_db)
+    added = add_missing_currencies(list_of_currencies_codes, name_of_db)
 
-    cur.execute(f"SELECT Date FROM 'EXCHANGE_RATE_TABLE'")
-    last_date = cur.fetchall()[-1][0]
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_EXCHANGE_RATE_TABLE_Date ON 'EXCHANGE_RATE_TABLE' (Date)")
+    cur.execute(f"SELECT MAX(Date) FROM 'EXCHANGE_RATE_TABLE'")
+    last_date = cur.fetchone()[0]
     last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
-    date_today = date.today()
-    delta_time = date_today - last_date
-    
-    
-    if last_date != date_today and date_today.isoweekday() <= 5:
-        start_date = last_date + timedelta(days = 1)
-        time_now = datetime.now()
-        #get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(date_today))
-        #print("Daty się różnią dzisiaj jest dzień pracujący więc aktualizujemy")
-        # if time_now.hour >= 12 and time_now.minute >= 16:
-        #     get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(date_today))
-        #     print("Daty się różnią dzisiaj jest dzień pracujący więc aktualizujemy")
-        # else:
-        #     print("Za wcześnie, zaktualizujemy po 12:15")
-        try:
-            get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(date_today))
-            print("Daty się różnią dzisiaj jest dzień pracujący więc aktualizujemy")        
-        except AttributeError:
-            if time_now.hour < 12:
-                print("Za wcześnie, zaktualizujemy po 12:15")
-            elif time_now.hour == 12 and time_now.minute <= 16:
-                print("Za wcześnie, zaktualizujemy po 12:15")
-            else:
-                print("Mamy problem nie możemy zaktualizować")
-
-
-    elif date_today.isoweekday() == 6 and delta_time.days >= 2:
-        start_date = last_date + timedelta(days = 1)
-        get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(date_today))
-        print("SObota, ale data jest o dwa dni odległa, więc jedziemy z aktualizacją kursów walut")
-    elif date_today.isoweekday() == 7 and delta_time.days >= 3:
-        start_date = last_date + timedelta(days = 1)
-        get_data_frame_exchange_rates_of(list_of_currencies_codes, str(start_date), str(date_today))
-        print("Niedziela,  ale data jest o trzy dni odległa, więc jedziemy z aktualizacją kursów walut")
-    else:
-        print("Dane kursów walut są aktualne z tabelami NBP, lub jest weekend wiec odpuszczamy")    
-     
 
+    if last_date >= last_publication_date():
+        print("Dane kursów walut są aktualne z tabelami NBP")
+        return result == None or bool(added)   #True when the table has just been downloaded or got new currencies
+    try:
+        get_data_frame_exchange_rates_of(list_of_currencies_codes, str(last_date + timedelta(days = 1)), str(date.today()), name_of_db)
+    except AttributeError:
+        print("Brak nowych tabel NBP (dzień wolny od pracy?), spróbujemy ponownie po następnej publikacji")
+        return bool(added)
+    print("Zaktualizowano kursy walut z tabel NBP")
+    return True
 
 
 def main():
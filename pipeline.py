@@ -0,0 +1,360 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Pipeline runner
+
+The stages of main() declared as a dependency graph. Every stage names its inputs and outputs (resources):
+- "table:NAME" - a table of the data base, it must exist after the stage, otherwise the stage is run again,
+- "file:PATH" - a file, its fingerprint is its size and modification time,
+- "source:NAME" - an external provider, its fingerprint tells when it may have new data
+  (nbp - date of the last table A, yahoo - today, gov.pl - the week),
+- any other name - data produced by a stage (e.g. "historical_values").
+
+A stage depends on the stages producing its inputs, every resource has one producer. The runner:
+- runs independent stages concurrently: stages with their own connections (FX sync, price sync, bond table refresh) in a pool of threads,
+  stages using the shared Database object on the main thread (a sqlite3 connection can't be shared by threads),
+  so the wall time of a cold start is close to the slowest branch instead of the sum of all stages,
+- skips a stage whose inputs are unchanged since its last successful run (PIPELINE_STAGES), unless it is forced.
+  Versions of produced resources are kept in PIPELINE_RESOURCES and raised after every run which returned anything but False,
+  so a sync which brought no new data doesn't cause the valuation to run again,
+- runs a part of the graph: only the given stages (--only) or a stage and every stage after it (--from).
+  Stages which aren't selected are taken as done.
+
+When a stage fails, the stages depending on it are not run, the independent ones are, and the first error is raised at the end.
+
+Usage:
+    python pipeline.py [--database NAME] [--only STAGE [STAGE ...]] [--from STAGE] [--force] [--workers N] [--list]
+
+Classes:
+- Stage: A function with its inputs and outputs.
+- Pipeline: Stages of a dependency graph.
+    - dependencies_of(self, name: str): Names of the stages producing the inputs of a stage.
+    - select(self, only: list, start_from: str): Names of the stages of a partial run.
+    - run(self, db, only: list, start_from: str, force: bool, workers: int): Runs the stages, returns {stage: status}.
+
+Functions:
+- source_fingerprints: Fingerprints of the external providers {source: function}.
+- create_default_pipeline(database_name: str, account_name: str, csv_path: str, currencies: list): Stages of main().
+"""
+
+
+
+import argparse
+import json
+import os
+import sqlite3 as sql
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+
+import invest_tracker_main as tracker
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+import goverment_bond_getting_table_of_interest as goverment_bond
+import snapshot_export
+import tracing
+
+
+source_fingerprints = {"nbp": lambda: str(nbp.last_publication_date()),
+                       "yahoo": lambda: str(date.today()),
+                       "gov.pl": lambda: "{}-W{:02d}".format(*date.today().isocalendar()[:2])}
+
+
+class Stage:
+
+    def __init__(self, name: str, function, inputs: tuple=(), outputs: tuple=(), threaded: bool=False, always: bool=False):
+        self.name = name
+        self.function = function            #Returns False when the run changed none of the outputs
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.threaded = threaded            #The function uses only its own connections and can run in a thread of the pool
+        self.always = always                #Never skipped (e.g. charts)
+
+    def __repr__(self):
+        return f"Stage('{self.name}', inputs={self.inputs}, outputs={self.outputs})"
+
+
+class Pipeline:
+
+    def __init__(self, stages: list):
+        self.stages = {}
+        self.producers = {}     #{resource: name of the stage producing it}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Stage '{stage.name}' is declared twice.")
+            for resource in stage.outputs:
+                if resource in self.producers:
+                    raise ValueError(f"'{resource}' is produced by '{self.producers[resource]}' and '{stage.name}'.")
+                self.producers[resource] = stage.name
+            self.stages[stage.name] = stage
+        self.order = self._topological_order()
+
+    def dependencies_of(self, name: str):
+        return [self.producers[resource] for resource in dict.fromkeys(self.stages[name].inputs)
+                if resource in self.producers and self.producers[resource] != name]
+
+    def _topological_order(self):
+        order = []
+        state = {}      #{stage: "visiting" or "done"}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Cycle of stages: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dependency in self.dependencies_of(name):
+                visit(dependency, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def select(self, only: list=None, start_from: str=None):
+        """
+        Returns names of the stages of a run in topological order: the stages of only, start_from and the stages depending on it,
+        or all stages.
+        """
+        for name in list(only or []) + ([start_from] if start_from else []):
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'. Stages: {', '.join(self.order)}")
+        if only:
+            return [name for name in self.order if name in only]
+        if start_from:
+            selected = {start_from}
+            for name in self.order:
+                if any(dependency in selected for dependency in self.dependencies_of(name)):
+                    selected.add(name)
+            return [name for name in self.order if name in selected]
+        return list(self.order)
+
+    def print_plan(self):
+        for name in self.order:
+            stage = self.stages[name]
+            print(f"{name:<22} after: {', '.join(self.dependencies_of(name)) or '-':<40} {'thread' if stage.threaded else 'main thread'}")
+
+    @staticmethod
+    def install_state_tables(db):
+        db.create_table("PIPELINE_STAGES", "stage PRIMARY KEY",
+                                           "input_key",
+                                           "status",
+                                           "started",
+                                           "finished",
+                                           "duration REAL")
+        db.create_table("PIPELINE_RESOURCES", "resource PRIMARY KEY", "version INTEGER")
+
+    def fingerprint_of(self, db, resource: str):
+        kind, _, name = resource.partition(":")
+        if kind == "file":
+            if not os.path.isfile(name):
+                return None
+            stat = os.stat(name)
+            return [stat.st_size, stat.st_mtime_ns]
+        if kind == "source":
+            return source_fingerprints[name]()
+        return db.get_value("SELECT version FROM PIPELINE_RESOURCES WHERE resource == ?", (resource,), default=0)
+
+    def input_key_of(self, db, stage: Stage):
+        return json.dumps({resource: self.fingerprint_of(db, resource) for resource in stage.inputs}, sort_keys=True)
+
+    def is_up_to_date(self, db, stage: Stage, input_key: str):
+        if stage.always:
+            return False
+        recorded = db.get_value("SELECT input_key FROM PIPELINE_STAGES WHERE stage == ? AND status == 'ok'", (stage.name,))
+        if recorded != input_key:
+            return False
+        return all(db.check_table_exists(resource[len("table:"):]) for resource in stage.outputs if resource.startswith("table:"))
+
+    def record(self, db, stage: Stage, input_key: str, status: str, started: datetime, duration: float, changed: bool):
+        db.execute("""INSERT INTO PIPELINE_STAGES VALUES (?, ?, ?, ?, ?, ?)
+                      ON CONFLICT(stage) DO UPDATE SET input_key = excluded.input_key, status = excluded.status,
+                      started = excluded.started, finished = excluded.finished, duration = excluded.duration""",
+                   (stage.name, input_key, status, started.isoformat(sep=" ", timespec="seconds"),
+                    datetime.now().isoformat(sep=" ", timespec="seconds"), duration))
+        if changed and stage.outputs:
+            db.execute("""INSERT INTO PIPELINE_RESOURCES VALUES (?, 1)
+                          ON CONFLICT(resource) DO UPDATE SET version = version + 1""", [(resource,) for resource in stage.outputs], many=True)
+
+    @staticmethod
+    def _call(stage: Stage):
+        with tracing.span(stage.name, "stage"):
+            return stage.function()
+
+    def run(self, db, only: list=None, start_from: str=None, force: bool=False, workers: int=4):
+        """
+        Runs the selected stages, each one as soon as the stages producing its inputs are finished.
+
+        :param db: The Database object keeping the state of the pipeline.
+        :param only: Names of the only stages to run.
+        :param start_from: Name of the first stage, the stages depending on it are run too.
+        :param force: Run the selected stages even when their inputs are unchanged.
+        :param workers: The number of threads running threaded stages.
+        :return: A dictionary {stage: "ok", "skipped", "failed" or "not run"}.
+        :rtype: dict
+        """
+        self.install_state_tables(db)
+        pending = self.select(only, start_from)
+        selected = set(pending)
+        statuses = {}
+        errors = []
+        running = {}    #{future: (stage, input key, started, start)}
+
+        def finish(stage, input_key, started, start, result=None, error=None):
+            duration = time.perf_counter() - start
+            if error is None:
+                statuses[stage.name] = "ok"
+                self.record(db, stage, input_key, "ok", started, duration, result is not False)
+                print(f"{stage.name} finished in {duration:.2f} s" + (" (no new data)" if result is False else ""))
+            else:
+                statuses[stage.name] = "failed"
+                errors.append(error)
+                self.record(db, stage, None, "failed", started, duration, False)
+                print(f"{stage.name} failed after {duration:.2f} s: {''.join(traceback.format_exception_only(type(error), error)).strip()}")
+
+        def collect(futures):
+            for future in futures:
+                stage, input_key, started, start = running.pop(future)
+                if future.exception() is not None:
+                    finish(stage, input_key, started, start, error=future.exception())
+                else:
+                    finish(stage, input_key, started, start, future.result())
+
+        with ThreadPoolExecutor(max_workers= max(workers, 1), thread_name_prefix= "pipeline") as executor:
+            while pending or running:
+                settled = False     #A stage was skipped or not run, so other stages may be ready now
+                on_main_thread = None
+                for name in list(pending):
+                    dependencies = [dependency for dependency in self.dependencies_of(name) if dependency in selected]
+                    if any(statuses.get(dependency) in ("failed", "not run") for dependency in dependencies):
+                        statuses[name] = "not run"
+                        pending.remove(name)
+                        settled = True
+                        print(f"{name} not run, a stage before it failed")
+                        continue
+                    if not all(dependency in statuses for dependency in dependencies):
+                        continue
+                    stage = self.stages[name]
+                    input_key = self.input_key_of(db, stage)
+                    if not force and self.is_up_to_date(db, stage, input_key):
+                        statuses[name] = "skipped"
+                        pending.remove(name)
+                        settled = True
+                        print(f"{name} skipped, inputs unchanged")
+                    elif stage.threaded:
+                        pending.remove(name)
+                        running[executor.submit(self._call, stage)] = (stage, input_key, datetime.now(), time.perf_counter())
+                    elif on_main_thread is None:
+                        on_main_thread = (stage, input_key)
+                if settled:
+                    continue
+
+                if on_main_thread is not None:
+                    stage, input_key = on_main_thread
+                    pending.remove(stage.name)
+                    started, start = datetime.now(), time.perf_counter()
+                    try:
+                        result = self._call(stage)
+                    except Exception as error:
+                        finish(stage, input_key, started, start, error=error)
+                    else:
+                        finish(stage, input_key, started, start, result)
+                    collect([future for future in running if future.done()])
+                elif running:
+                    collect(wait(running, return_when=FIRST_COMPLETED)[0])
+
+        if errors:
+            raise errors[0]
+        return statuses
+
+
+def get_account(db, account_name: str):
+    """
+    Returns the first Account named account_name, the account is created when there is none.
+    """
+    account_id = db.get_value("SELECT MIN(id) FROM Accounts WHERE name == ?", (account_name,))
+    if account_id is None:
+        return tracker.Account(account_name)
+    return tracker.Account.from_database(account_id, db)
+
+def sync_prices(database_name: str):
+    #Runs in a thread of the pool, so it reads the tickers with its own connection
+    conn = sql.connect(database_name)
+    tickers = [ticker for (ticker,) in conn.execute("SELECT DISTINCT yahoo_ticker FROM Transactions") if ticker]
+    conn.close()
+    updated = [yfin.download_historical_data(ticker= ticker, name_of_db= database_name) for ticker in tickers]
+    return any(updated)
+
+def create_default_pipeline(database_name: str="invest_tracker_data_base", account_name: str="Porfel Długoterminowy",
+                            csv_path: str="transakcje.csv", currencies: list=["USD", "GBP", "EUR"]):
+    """
+    Returns the Pipeline of main(). A changed CSV file recreates the data base tables and imports all transactions, like main() did before.
+    """
+    db = tracker.get_database(database_name)
+    bond_tables = tuple(f"table:{sheet_name}" for sheet_name in goverment_bond.bond_sheets)
+
+    def initialize():
+        tracker.initialize_database(db)
+        tracker.Account(account_name)
+
+    def import_transactions():
+        return tracker.Transaction.import_transactions_from_csv(csv_path) > 0
+
+    def investment_view():
+        account = get_account(db, account_name)
+        account.actual_balance()
+        account.investment_view_by_type()
+
+    def export_snapshot():
+        if not snapshot_export.pyarrow_available():
+            return False
+        snapshot_export.export_valuation_snapshot(db, get_account(db, account_name).id)
+
+    stages = [Stage("initialize_database", initialize,
+                    inputs=(f"file:{csv_path}",), outputs=("table:Accounts",)),
+              Stage("import_transactions", import_transactions,
+                    inputs=(f"file:{csv_path}", "table:Accounts"), outputs=("table:Transactions",)),
+              Stage("bond_table", lambda: goverment_bond.update_goverment_bond_interest_table(database_name),
+                    inputs=("source:gov.pl",), outputs=bond_tables, threaded=True),
+              Stage("fx_sync", lambda: nbp.check_nbp_api_for_new_exchange_rates(currencies, name_of_db= database_name),
+                    inputs=("source:nbp",), outputs=("table:EXCHANGE_RATE_TABLE",), threaded=True),
+              Stage("price_sync", lambda: sync_prices(database_name),
+                    inputs=("source:yahoo", "table:Transactions"), outputs=("prices",), threaded=True),
+              Stage("investment_view", investment_view,
+                    inputs=("source:yahoo", "table:Transactions", "table:EXCHANGE_RATE_TABLE"), outputs=("investment_view",)),
+              Stage("historical_values", lambda: get_account(db, account_name).historical_values_for_investmens_on(db=db, sync_prices=False),
+                    inputs=("table:Transactions", "table:EXCHANGE_RATE_TABLE", "prices") + bond_tables, outputs=("historical_values",)),
+              Stage("historical_balance", lambda: get_account(db, account_name).calculate_historical_balance_and_append_to_db(db=db),
+                    inputs=("historical_values",), outputs=("historical_balance",)),
+              Stage("historical_total_cost", lambda: get_account(db, account_name).calculate_historical_total_cost_for(db=db),
+                    inputs=("table:Transactions", "historical_values"), outputs=("historical_total_cost",)),
+              Stage("snapshot_export", export_snapshot,
+                    inputs=("historical_balance", "historical_total_cost"), outputs=("snapshot",)),
+              Stage("check_schema", lambda: tracker.check_schema(db, get_account(db, account_name).id),
+                    inputs=("historical_balance", "historical_total_cost", "investment_view")),
+              Stage("charts", lambda: get_account(db, account_name).figure_plot_for_account(),
+                    inputs=("historical_balance", "historical_total_cost", "investment_view"), always=True)]
+    return Pipeline(stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the stages of Invest Tracker as a dependency graph, independent stages concurrently.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these stages.")
+    parser.add_argument("--from", dest="start_from", default=None, help="Run this stage and every stage after it.")
+    parser.add_argument("--force", action="store_true", help="Run the stages even when their inputs are unchanged.")
+    parser.add_argument("--workers", type=int, default=4, help="Threads running the synchronizations.")
+    parser.add_argument("--list", action="store_true", help="Print the stages and their dependencies and exit.")
+    args = parser.parse_args()
+
+    if args.list:
+        create_default_pipeline(args.database).print_plan()
+        return
+    tracker.main(database_name= args.database, only= args.only, start_from= args.start_from, force= args.force, workers= args.workers)
+
+
+if __name__ == "__main__":
+    main()
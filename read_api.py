@@ -0,0 +1,339 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Local read API
+
+A small asyncio HTTP/JSON server (standard library only) for dashboards and a future GUI. Requests are answered from snapshots kept in memory,
+never from SQLite or the network:
+- AccountSnapshot: the investment view (investment_view_by_type), daily balance and total cost, units and values of every instrument
+  and returns (return_analytics) of an account, read from the data base in one pass. Dates are a sorted numpy datetime64[D] array,
+  so a date range is two binary searches. Balances in other currencies use the cross rates (cross_rates) of the snapshot days.
+- Encoded responses are cached per snapshot, a repeated request is a dictionary lookup and a socket write.
+- A background task checks PRAGMA data_version of the data base every poll_interval seconds. When another process (valuation_runner, scheduler)
+  committed changes, new snapshots are built in a worker thread and swapped in at once - readers see the old or the new snapshot, never a mix.
+
+Endpoints (GET):
+    /health                                         snapshot version, build time and duration
+    /accounts                                       id, name, currency and last balance of every account
+    /accounts/{id}/summary                          rows of the investment view with total value and cost
+    /accounts/{id}/balance?start=&end=&currency=    daily account_balance and total_cost in a date range, in PLN or another currency
+    /accounts/{id}/instruments                      last number of units and value of every instrument
+    /accounts/{id}/instruments/{ticker}?start=&end= daily number of units and value of an instrument
+    /accounts/{id}/returns                          TWR and XIRR of the account and its instruments
+POST /refresh rebuilds the snapshots now.
+
+Usage:
+    python read_api.py [--database NAME] [--host 127.0.0.1] [--port 8765] [--poll-interval 5]
+
+Classes:
+- AccountSnapshot: Read-only data of one account served by the API.
+- ReadApiServer: Snapshots, background refresh, routing and the HTTP server.
+    - refresh(self): Builds new snapshots in the worker thread and swaps them in.
+    - route(self, method: str, target: str): Status and JSON body of a request.
+    - serve_forever(self): Runs the server until interrupted.
+
+Functions:
+- build_account_snapshot(db, account_id: int): Reads the snapshot of an account from the data base.
+"""
+
+
+
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import data_base
+import cross_rates
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+http_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def _float_list(values):
+    return [None if value != value else value for value in np.asarray(values, dtype=np.float64).tolist()]
+
+def _records(df):
+    return df.astype(object).where(pd.notna(df), None).to_dict(orient="records")
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class AccountSnapshot:
+
+    def __init__(self, info: dict, summary: list, dates, balance, total_cost, instruments: dict, returns: list, rates=None):
+        self.info = info                    #{id, name, currency, balance}
+        self.summary = summary              #Rows of INVESTMENT_VIEW_ACCOUNT_{id}
+        self.dates = dates                  #numpy datetime64[D], sorted
+        self.balance = balance              #numpy float64 arrays aligned with dates
+        self.total_cost = total_cost
+        self.instruments = instruments      #{ticker: (units, values)} numpy arrays aligned with dates
+        self.returns = returns              #Rows of ACCOUNT_{id}_RETURNS
+        self.rates = rates                  #CrossRateMatrix of the days of dates, or None
+
+    def date_slice(self, start: str=None, end: str=None):
+        """
+        Returns the slice of days from start to end (inclusive), found with binary searches.
+        """
+        first = 0 if not start else int(np.searchsorted(self.dates, np.datetime64(start[:10], "D"), side="left"))
+        last = len(self.dates) if not end else int(np.searchsorted(self.dates, np.datetime64(end[:10], "D"), side="right"))
+        return slice(first, last)
+
+    def date_strings(self, days: slice):
+        return np.datetime_as_string(self.dates[days], unit="D").tolist()
+
+
+def build_account_snapshot(db, account_id: int):
+    """
+    Reads the investment view, the historical value table and the returns of an account. Tables which don't exist are empty in the snapshot.
+    """
+    df_account = db.read_sql("SELECT id, name, currency, balance FROM Accounts WHERE id == ?", (account_id,))
+    info = _records(df_account)[0] if len(df_account) else {"id": account_id}
+
+    view_table = f"INVESTMENT_VIEW_ACCOUNT_{account_id}"
+    summary = _records(db.get_table_df(view_table)) if db.check_table_exists(view_table) else []
+
+    history_table = f"ACCOUNT_{account_id}_HISTORICAL_VALUE"
+    instruments = {}
+    if db.check_table_exists(history_table):
+        df_history = db.get_table_df(history_table)
+        df_history["Date"] = df_history["Date"].astype(str).str[:10]
+        df_history = df_history.drop_duplicates(subset=["Date"]).sort_values("Date")
+        dates = df_history["Date"].to_numpy().astype("datetime64[D]")
+        numeric = lambda column: pd.to_numeric(df_history[column], errors='coerce').to_numpy(dtype=np.float64) if column in df_history.columns else np.full(len(df_history), np.nan)
+        balance = numeric("account_balance")
+        total_cost = pd.Series(numeric("total_cost")).ffill().to_numpy()
+        for column in df_history.columns:
+            if column.endswith("_number_of_units"):
+                ticker = column[:-len("_number_of_units")]
+                instruments[ticker] = (numeric(column), numeric(f"{ticker}_value"))
+    else:
+        dates = np.empty(0, dtype="datetime64[D]")
+        balance = total_cost = np.empty(0)
+
+    returns_table = f"ACCOUNT_{account_id}_RETURNS"
+    returns = _records(db.get_table_df(returns_table)) if db.check_table_exists(returns_table) else []
+    rates = cross_rates.get_cross_rates(db, cross_rates.available_currencies(db), str(dates[0]), str(dates[-1])) if len(dates) else None
+    return AccountSnapshot(info, summary, dates, balance, total_cost, instruments, returns, rates)
+
+
+class ReadApiServer:
+
+    def __init__(self, database_name: str="invest_tracker_data_base", host: str="127.0.0.1", port: int=8765, poll_interval: float=5.0, cache_size: int=4096):
+        self.database_name = database_name
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.cache_size = cache_size
+        self.snapshots: dict = {}           #{account_id: AccountSnapshot}
+        self.responses = OrderedDict()      #Encoded GET responses of the current snapshots {target: (status, body)}
+        self.version = None                 #PRAGMA data_version of the current snapshots
+        self.built_at: str = None
+        self.build_time: float = None
+        #SQLite connections belong to one thread, the data base is only used in this worker thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="read_api_snapshots")
+        self._db = None
+        self._refreshing = None
+
+    def _database(self):
+        if self._db is None:
+            self._db = data_base.Database(self.database_name)
+        return self._db
+
+    def _data_version(self):
+        return self._database().get_data_version()
+
+    def _close_database(self):
+        self._db = None     #The connection is closed by Database.__del__ in the worker thread
+
+    def _build_snapshots(self):
+        start = time.perf_counter()
+        db = self._database()
+        version = db.get_data_version()
+        snapshots = {}
+        if db.check_table_exists("Accounts"):
+            for account_id in db.read_sql("SELECT id FROM Accounts ORDER BY id")["id"]:
+                snapshots[int(account_id)] = build_account_snapshot(db, int(account_id))
+        return snapshots, version, time.perf_counter() - start
+
+    async def refresh(self):
+        """
+        Builds new snapshots in the worker thread and swaps them in. Concurrent calls share one build.
+        """
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        try:
+            await asyncio.shield(self._refreshing)
+        finally:
+            if self._refreshing is not None and self._refreshing.done():
+                self._refreshing = None
+
+    async def _refresh(self):
+        snapshots, version, build_time = await asyncio.get_running_loop().run_in_executor(self.executor, self._build_snapshots)
+        self.snapshots = snapshots
+        self.responses = OrderedDict()
+        self.version = version
+        self.built_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        self.build_time = build_time
+        print(f"[###############100%###############] Read API snapshots of {len(snapshots)} accounts built in {build_time:.2f} s")
+
+    async def watch(self):
+        """
+        Rebuilds the snapshots when the data base was changed by another connection (e.g. after a synchronization or a valuation).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await loop.run_in_executor(self.executor, self._data_version) != self.version:
+                    await self.refresh()
+            except Exception as error:
+                print(f"Read API refresh failed: {error!r}")
+
+    def _account(self, account_id: str):
+        try:
+            return self.snapshots.get(int(account_id))
+        except ValueError:
+            return None
+
+    def _respond(self, path: list, query: dict):
+        #Returns (status, JSON value) of a GET request
+        argument = lambda name: query.get(name, [None])[0]
+        if path == ["health"]:
+            return 200, {"version": self.version, "built_at": self.built_at, "build_time": self.build_time, "accounts": len(self.snapshots)}
+        if path == ["accounts"]:
+            return 200, [snapshot.info for snapshot in self.snapshots.values()]
+        if len(path) < 3 or path[0] != "accounts":
+            return 404, {"error": "Unknown endpoint"}
+        snapshot = self._account(path[1])
+        if snapshot is None:
+            return 404, {"error": f"Unknown account {path[1]}"}
+        try:
+            days = snapshot.date_slice(argument("start"), argument("end"))
+        except ValueError:
+            return 400, {"error": "Dates should be written as YYYY-MM-DD"}
+
+        if path[2:] == ["summary"]:
+            total_value = sum(row.get("current_value") or 0.0 for row in snapshot.summary)
+            total_cost = sum(row.get("total_cost") or 0.0 for row in snapshot.summary)
+            return 200, {"account": snapshot.info, "total_value": total_value, "total_cost": total_cost, "positions": snapshot.summary}
+        if path[2:] == ["balance"]:
+            currency = (argument("currency") or "PLN").upper()
+            rates = 1.0
+            if currency != "PLN":
+                if snapshot.rates is None or currency not in snapshot.rates.positions:
+                    return 400, {"error": f"No exchange rates of {currency}"}
+                rates = snapshot.rates.rates_for("PLN", currency, snapshot.dates[days])
+            return 200, {"dates": snapshot.date_strings(days), "currency": currency,
+                         "account_balance": _float_list(snapshot.balance[days] * rates), "total_cost": _float_list(snapshot.total_cost[days] * rates)}
+        if path[2:] == ["instruments"]:
+            last = lambda values: _float_list(pd.Series(values).ffill().iloc[-1:])[0] if len(values) else None
+            return 200, [{"ticker": ticker, "number_of_units": last(units), "value": last(values)} for ticker, (units, values) in snapshot.instruments.items()]
+        if len(path) == 4 and path[2] == "instruments":
+            if path[3] not in snapshot.instruments:
+                return 404, {"error": f"Unknown instrument {path[3]}"}
+            units, values = snapshot.instruments[path[3]]
+            return 200, {"ticker": path[3], "dates": snapshot.date_strings(days), "number_of_units": _float_list(units[days]), "value": _float_list(values[days])}
+        if path[2:] == ["returns"]:
+            return 200, snapshot.returns
+        return 404, {"error": "Unknown endpoint"}
+
+    def route(self, method: str, target: str):
+        """
+        Returns (status, encoded JSON body) of a request. GET responses are cached until the snapshots change.
+        """
+        if method != "GET":
+            return 405, _encode({"error": f"Method {method} not allowed"})
+        key = target
+        cached = self.responses.get(key)
+        if cached is not None:
+            self.responses.move_to_end(key)
+            return cached
+        url = urlsplit(target)
+        path = [unquote(part) for part in url.path.split("/") if part]
+        status, value = self._respond(path, parse_qs(url.query))
+        response = (status, _encode(value))
+        if status == 200 and path != ["health"]:
+            self.responses[key] = response
+            while len(self.responses) > self.cache_size:
+                self.responses.popitem(last=False)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get("content-length", 0) or 0):
+                    await reader.readexactly(int(headers["content-length"]))
+                if len(parts) != 3:
+                    status, body = 400, _encode({"error": "Bad request line"})
+                elif parts[0] == "POST" and urlsplit(parts[1]).path.rstrip("/") == "/refresh":
+                    await self.refresh()
+                    status, body = 200, _encode({"version": self.version, "built_at": self.built_at})
+                else:
+                    status, body = self.route(parts[0], parts[1])
+                keep_alive = headers.get("connection", "").lower() != "close" and (len(parts) == 3 and parts[2] == "HTTP/1.1")
+                writer.write(f"HTTP/1.1 {status} {http_reasons.get(status, '')}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        await self.refresh()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=1024)
+        watcher = asyncio.ensure_future(self.watch())
+        print(f"Read API listening on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("Read API stopped")
+        finally:
+            self.executor.submit(self._close_database).result()
+            self.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves account summaries, balances and instrument values from in-memory snapshots.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between checks of the data base for changes.")
+    args = parser.parse_args()
+    ReadApiServer(args.database, args.host, args.port, args.poll_interval).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
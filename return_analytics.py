@@ -0,0 +1,397 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Return analytics
+
+Calculates returns of an account and of every instrument of the account from the daily valuation (ACCOUNT_{id}_HISTORICAL_VALUE)
+and the cash flows (total_cost of Transactions):
+- TWR (time-weighted return): daily returns V_t / (V_{t-1} + F_t) - 1 chained over the whole history, flows F_t are counted at the start of the day.
+  Flows don't change the return, so it measures the instruments, not the timing of purchases.
+- XIRR (money-weighted return): the annual rate r at which sum(a_j * (1 + r) ** -(t_j - t_0) / 365) = 0, where a_j are purchases (negative),
+  sales (positive) and the last value of the instrument (positive). All instruments are solved at once - the flows of all instruments
+  are kept in flat numpy arrays and every Newton step is one np.bincount over them. Instruments where Newton doesn't converge are bisected.
+- ReturnTracker keeps the state of a calculation, so a new valuation day updates the TWR in O(number of instruments)
+  and the XIRR from the previous rates, which converges in a few steps.
+
+The ACCOUNT_{id}_RETURNS table keeps the state of the tracker (TWR, XIRR, value and net invested amount of every series and the last date)
+and the state of the history on the last date (number of days, sums of account_balance and total_cost, see history_states).
+calculate_account_returns restores the tracker from the table and the flows of Transactions, reads only the history after the last date
+and adds its days with ReturnTracker.append_day. A changed history or a new instrument recalculates the whole history.
+
+The account itself is the series "ACCOUNT" - the sum of values and flows of all instruments. A purchase is valued at its cost until
+the first quotation of the instrument (account_balance counts it as 0 until then, which would show as a loss and a gain of the account).
+
+Usage:
+    python return_analytics.py [--database NAME] [--account ID]
+
+Classes:
+- ReturnTracker: TWR and XIRR of many series updated day by day.
+    - from_history(cls, dates, values, flows, columns: list): Tracker of a whole history.
+    - from_summary(cls, df_summary, last_date: str, flow_dates, flows): Tracker continuing after the day of a summary.
+    - append_day(self, date, values, flows): Adds one valuation day.
+    - summary(self): DataFrame of TWR, XIRR, value and net invested amount of every series.
+
+Functions:
+- daily_returns(values, flows): Daily time-weighted returns of every column.
+- time_weighted_returns(values, flows): Cumulated time-weighted return of every column on every day.
+- fill_unknown_values(values, flows, earlier_flows): Replaces unknown values with the previous value plus the flows of the day.
+- xirr(amounts, days, groups: numpy.ndarray, number_of_groups: int, guess): Money-weighted annual returns of many groups of flows at once.
+- load_account_flows(db, account_id: int, tickers: list): Flows of the instruments and of the account on the dates of transactions.
+- load_account_history(db, account_id: int, start_date: str): Daily values and flows of the instruments and of the account.
+- history_states(db, account_id: int, start_date: str): Number of days and sums of balance and total cost of the history up to every day.
+- is_history_unchanged(stored, date: str, df_states): Checks if the history up to a day is in the stored state.
+- calculate_account_returns(db, account_id: int): Returns of an account and its instruments, written to the ACCOUNT_{id}_RETURNS table.
+"""
+
+
+
+import argparse
+import math
+
+import invest_tracker_main as tracker
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+account_series = "ACCOUNT"     #Name of the series of the whole account
+lowest_rate = -0.999999         #XIRR is searched above -100%
+highest_rate = 1e6
+history_columns = ["history_days", "history_balance", "history_cost"]     #State of ACCOUNT_{id}_HISTORICAL_VALUE up to a day
+
+
+def daily_returns(values, flows):
+    """
+    Returns the daily time-weighted returns of every column: values[t] / (values[t - 1] + flows[t]) - 1.
+
+    Days with nothing invested at their start (value of the previous day + flows of the day equal to 0) have return 0.
+
+    :param values: numpy array (days x series) of values at the end of days, without NaN.
+    :param flows: numpy array (days x series) of flows into the series during days (purchases positive, sales negative).
+    :rtype: numpy.ndarray
+    """
+    values = np.asarray(values, dtype=np.float64)
+    flows = np.asarray(flows, dtype=np.float64)
+    previous = np.vstack([np.zeros((1,) + values.shape[1:]), values[:-1]])
+    invested = previous + flows
+    returns = np.zeros_like(values)
+    np.divide(values, invested, out=returns, where=invested != 0)
+    return np.where(invested != 0, returns - 1.0, 0.0)
+
+def time_weighted_returns(values, flows):
+    """
+    Returns the time-weighted return of every column from the first day up to every day (days x series).
+    """
+    return np.cumprod(1.0 + daily_returns(values, flows), axis=0) - 1.0
+
+def fill_unknown_values(values, flows, earlier_flows=0.0):
+    """
+    Returns values (days x series) where an unknown (NaN) value is the value of the previous day plus the flows of the day,
+    e.g. the cost of a purchase made before the first quotation of the instrument.
+    earlier_flows are the flows of every series before the first day, when only a part of the history is filled.
+    """
+    cumulated_flows = np.cumsum(np.nan_to_num(np.asarray(flows, dtype=np.float64)), axis=0) + earlier_flows
+    return pd.DataFrame(np.asarray(values, dtype=np.float64) - cumulated_flows).ffill().fillna(0.0).to_numpy() + cumulated_flows
+
+def _npv(rates, amounts, years, groups, number_of_groups: int):
+    discount = np.exp(-years * np.log1p(rates)[groups])
+    npv = np.bincount(groups, weights=amounts * discount, minlength=number_of_groups)
+    derivative = -np.bincount(groups, weights=years * amounts * discount, minlength=number_of_groups) / (1.0 + rates)
+    return npv, derivative
+
+def xirr(amounts, days, groups, number_of_groups: int=None, guess=0.1, tolerance: float=1e-10, max_iterations: int=50):
+    """
+    Returns the money-weighted annual return (XIRR) of every group of flows, NaN when a group has no solution
+    (e.g. flows of one sign only).
+
+    :param amounts: Flows of the investor: purchases negative, sales and the final value positive.
+    :param days: Dates of the flows as numbers of days (e.g. datetime64[D] cast to int).
+    :param groups: Group (instrument) number of every flow, from 0 to number_of_groups - 1.
+    :param guess: The starting rate, a float or an array with a rate per group (e.g. the result of the previous day).
+    :rtype: numpy.ndarray
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    days = np.asarray(days, dtype=np.int64)
+    groups = np.asarray(groups, dtype=np.int64)
+    if number_of_groups is None:
+        number_of_groups = int(groups.max()) + 1 if len(groups) else 0
+    rates = np.broadcast_to(np.asarray(guess, dtype=np.float64), (number_of_groups,)).copy()
+    rates = np.where(np.isfinite(rates), np.clip(rates, lowest_rate, highest_rate), 0.1)
+    if number_of_groups == 0:
+        return rates
+
+    first_day = np.full(number_of_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first_day, groups, days)
+    years = (days - first_day[groups]) / 365.0
+    has_inflow = np.bincount(groups, weights=(amounts > 0), minlength=number_of_groups) > 0
+    has_outflow = np.bincount(groups, weights=(amounts < 0), minlength=number_of_groups) > 0
+    solvable = has_inflow & has_outflow
+
+    #Newton steps for all groups at once
+    converged = ~solvable
+    for _ in range(max_iterations):
+        npv, derivative = _npv(rates, amounts, years, groups, number_of_groups)
+        step = np.zeros(number_of_groups)
+        np.divide(npv, derivative, out=step, where=(derivative != 0) & ~converged)
+        new_rates = rates - step
+        new_rates = np.where(new_rates <= lowest_rate, (rates + lowest_rate) / 2, np.minimum(new_rates, highest_rate))
+        converged |= np.abs(new_rates - rates) <= tolerance * np.maximum(1.0, np.abs(rates))
+        rates = new_rates
+        if converged.all():
+            break
+    npv, _ = _npv(rates, amounts, years, groups, number_of_groups)
+    scale = np.bincount(groups, weights=np.abs(amounts), minlength=number_of_groups)
+    failed = solvable & ~(np.isfinite(npv) & (np.abs(npv) <= 1e-7 * np.maximum(scale, 1.0)))
+
+    #Bisection of the groups where Newton failed, NaN when the NPV doesn't change sign
+    if failed.any():
+        low = np.full(number_of_groups, lowest_rate)
+        high = np.full(number_of_groups, 10.0)
+        npv_low, _ = _npv(low, amounts, years, groups, number_of_groups)
+        npv_high, _ = _npv(high, amounts, years, groups, number_of_groups)
+        bracketed = failed & (np.sign(npv_low) != np.sign(npv_high))
+        for _ in range(200):
+            middle = (low + high) / 2
+            npv_middle, _ = _npv(middle, amounts, years, groups, number_of_groups)
+            same_sign = np.sign(npv_middle) == np.sign(npv_low)
+            low = np.where(same_sign, middle, low)
+            npv_low = np.where(same_sign, npv_middle, npv_low)
+            high = np.where(same_sign, high, middle)
+        rates = np.where(bracketed, (low + high) / 2, rates)
+        solvable &= ~failed | bracketed
+    return np.where(solvable, rates, np.nan)
+
+
+class ReturnTracker:
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.growth = np.ones(size)             #Product of (1 + daily return) up to the last day
+        self.last_values = np.zeros(size)
+        self.net_invested = np.zeros(size)      #Sum of flows
+        self.last_day = None                    #Last day as a number of days (datetime64[D] as int)
+        #Flows of all series for XIRR: amount (investor's sign), day, series number
+        self.amounts = np.empty(0)
+        self.days = np.empty(0, dtype=np.int64)
+        self.groups = np.empty(0, dtype=np.int64)
+        self.rates = np.full(size, 0.1)         #XIRR of the last day
+
+    @staticmethod
+    def _day_numbers(dates):
+        return pd.to_datetime(pd.Series(list(dates))).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+    @classmethod
+    def from_history(cls, dates, values, flows, columns: list):
+        """
+        Returns a tracker of the whole history: values and flows are numpy arrays (days x series), unknown values are filled by fill_unknown_values.
+        """
+        result = cls(columns)
+        flows = np.nan_to_num(np.asarray(flows, dtype=np.float64))
+        values = fill_unknown_values(values, flows)
+        if len(values) == 0:
+            return result
+        result.growth = np.prod(1.0 + daily_returns(values, flows), axis=0)
+        result.last_values = values[-1]
+        result.net_invested = flows.sum(axis=0)
+        days = cls._day_numbers(dates)
+        result.last_day = int(days[-1])
+        day_positions, groups = np.nonzero(flows)
+        result.amounts = -flows[day_positions, groups]
+        result.days = days[day_positions]
+        result.groups = groups.astype(np.int64)
+        result.rates = result.solve_xirr(guess=0.1)
+        return result
+
+    @classmethod
+    def from_summary(cls, df_summary, last_date: str, flow_dates, flows):
+        """
+        Returns a tracker continuing after last_date: df_summary is a DataFrame of summary() on last_date, flows a numpy array
+        (days x series in the order of df_summary) of the flows up to last_date on flow_dates. The history itself isn't read.
+        """
+        result = cls(list(df_summary.index))
+        result.growth = df_summary["twr"].to_numpy(dtype=np.float64) + 1.0
+        result.last_values = df_summary["value"].to_numpy(dtype=np.float64)
+        result.net_invested = df_summary["net_invested"].to_numpy(dtype=np.float64)
+        result.last_day = int(cls._day_numbers([last_date])[0])
+        flows = np.nan_to_num(np.asarray(flows, dtype=np.float64))
+        day_positions, groups = np.nonzero(flows)
+        result.amounts = -flows[day_positions, groups]
+        result.days = cls._day_numbers(flow_dates)[day_positions] if len(day_positions) else np.empty(0, dtype=np.int64)
+        result.groups = groups.astype(np.int64)
+        rates = df_summary["xirr"].to_numpy(dtype=np.float64)
+        result.rates = np.where(np.isnan(rates), 0.1, rates)
+        return result
+
+    def solve_xirr(self, guess=None):
+        size = len(self.columns)
+        if self.last_day is None:
+            return np.full(size, np.nan)
+        #The last value is a sale of the whole position on the last day
+        amounts = np.concatenate([self.amounts, self.last_values])
+        days = np.concatenate([self.days, np.full(size, self.last_day, dtype=np.int64)])
+        groups = np.concatenate([self.groups, np.arange(size, dtype=np.int64)])
+        return xirr(amounts, days, groups, size, self.rates if guess is None else guess)
+
+    def append_day(self, date, values, flows):
+        """
+        Adds one valuation day: values at the end of the day and flows during the day, arrays in the order of columns
+        (NaN value - the value of the previous day plus the flows of the day).
+        The TWR is updated without touching earlier days, the XIRR starts from the rates of the previous day.
+        """
+        flows = np.nan_to_num(np.asarray(flows, dtype=np.float64))
+        values = np.asarray(values, dtype=np.float64)
+        values = np.where(np.isnan(values), self.last_values + flows, values)
+        invested = self.last_values + flows
+        ratio = np.ones_like(values)
+        np.divide(values, invested, out=ratio, where=invested != 0)
+        self.growth = self.growth * ratio
+        self.last_values = values
+        self.net_invested = self.net_invested + flows
+        day = int(self._day_numbers([date])[0])
+        self.last_day = day
+        groups = np.flatnonzero(flows)
+        if len(groups):
+            self.amounts = np.concatenate([self.amounts, -flows[groups]])
+            self.days = np.concatenate([self.days, np.full(len(groups), day, dtype=np.int64)])
+            self.groups = np.concatenate([self.groups, groups.astype(np.int64)])
+        rates = self.solve_xirr()
+        self.rates = np.where(np.isnan(rates), self.rates, rates)
+        return self
+
+    def summary(self):
+        """
+        Returns a DataFrame indexed by series with the columns twr, xirr (annual), value and net_invested.
+        """
+        return pd.DataFrame({"twr": self.growth - 1.0,
+                             "xirr": self.solve_xirr(),
+                             "value": self.last_values,
+                             "net_invested": self.net_invested}, index=pd.Index(self.columns, name="instrument"))
+
+
+def load_account_flows(db, account_id: int, tickers: list):
+    """
+    Returns a DataFrame indexed by the dates of the transactions of an account with the flows (total costs, purchases positive,
+    sales negative) of every ticker and the "ACCOUNT" column.
+    """
+    df_transactions = db.get_table_df_with_conditions("Transactions", "date_of_purchase", "yahoo_ticker", "total_cost", account_id = f"{account_id}")
+    df_transactions["total_cost"] = pd.to_numeric(df_transactions["total_cost"], errors='coerce').fillna(0.0)
+    df_flows = df_transactions.pivot_table(index="date_of_purchase", columns="yahoo_ticker", values="total_cost", aggfunc="sum")
+    df_flows = df_flows.reindex(columns=tickers).fillna(0.0).sort_index()
+    df_flows.index = df_flows.index.astype(str)
+    df_flows[account_series] = df_flows.sum(axis=1)
+    return df_flows
+
+def load_account_history(db, account_id: int, start_date: str=None):
+    """
+    Returns (dates, values, flows) of an account: values and flows are DataFrames indexed by Date with a column per instrument
+    and the "ACCOUNT" column. Flows are total costs of the transactions (purchases positive, sales negative),
+    unknown values are filled by fill_unknown_values.
+
+    :param start_date: Only days from start_date on are read, None - the whole history.
+    """
+    table_name = f"ACCOUNT_{account_id}_HISTORICAL_VALUE"
+    if start_date is None:
+        df_history = db.get_table_df(table_name).set_index("Date")
+    else:
+        df_history = db.read_sql(f'SELECT * FROM "{table_name}" WHERE Date >= ? ORDER BY Date', (str(start_date),)).set_index("Date")
+    df_history.index = df_history.index.astype(str)
+    tickers = [column[:-len("_value")] for column in df_history.columns if column.endswith("_value")]
+    df_values = df_history[[f"{ticker}_value" for ticker in tickers]].apply(pd.to_numeric, errors='coerce')
+    df_values.columns = tickers
+
+    df_all_flows = load_account_flows(db, account_id, tickers).drop(columns=account_series)
+    df_flows = df_all_flows.reindex(index=df_values.index).fillna(0.0)
+    #Unknown values of the first days are filled from the flows before them, like when the whole history is read
+    earlier_flows = df_all_flows.loc[df_all_flows.index.astype(str) < str(start_date)].sum().to_numpy() if start_date is not None else 0.0
+    df_values = pd.DataFrame(fill_unknown_values(df_values.to_numpy(), df_flows.to_numpy(), earlier_flows), index=df_values.index, columns=tickers)
+    df_values[account_series] = df_values.sum(axis=1)
+    df_flows[account_series] = df_flows.sum(axis=1)
+    return df_values.index, df_values, df_flows
+
+def history_states(db, account_id: int, start_date: str=None):
+    """
+    Returns a DataFrame indexed by Date with the history_columns of every day of ACCOUNT_{id}_HISTORICAL_VALUE from start_date on:
+    the number of days and the sums of account_balance and total_cost up to the day. They are summed in SQLite, only the rows
+    from start_date on are returned.
+    """
+    query = f"""SELECT * FROM (SELECT substr(Date, 1, 10) AS Date, COUNT(*) OVER running AS history_days,
+                                      TOTAL(account_balance) OVER running AS history_balance, TOTAL(total_cost) OVER running AS history_cost
+                               FROM "ACCOUNT_{account_id}_HISTORICAL_VALUE" WINDOW running AS (ORDER BY Date ROWS UNBOUNDED PRECEDING))
+                WHERE Date >= ?"""
+    return db.read_sql(query, (str(start_date or ""),)).drop_duplicates(subset=["Date"], keep="last").set_index("Date")
+
+def is_history_unchanged(stored, date: str, df_states):
+    """
+    Checks if the state of the history on date (the first row of df_states of history_states) is the stored one (a row with history_columns).
+    """
+    if df_states is None or len(df_states) == 0 or df_states.index[0] != str(date)[:10]:
+        return False
+    state = df_states.iloc[0]
+    return (int(state["history_days"]) == int(stored["history_days"])
+            and all(math.isclose(float(state[column]), float(stored[column]), rel_tol=1e-12, abs_tol=1e-6) for column in ["history_balance", "history_cost"]))
+
+def _restore_tracker(db, account_id: int, table_name: str):
+    #ReturnTracker brought up to date with the days after the last date of the table, None when the whole history has to be calculated
+    if not db.check_table_exists(table_name) or not {"last_date", *history_columns} <= set(db.get_column_names(table_name)):
+        return None
+    df_stored = db.get_table_df(table_name).set_index("instrument")
+    if len(df_stored) == 0 or pd.isna(df_stored["last_date"].iloc[0]):
+        return None
+    last_date = str(df_stored["last_date"].iloc[0])
+    df_states = history_states(db, account_id, last_date)
+    if not is_history_unchanged(df_stored.iloc[0], last_date, df_states):
+        print(f"Zmieniona historia konta {account_id}, przeliczamy zwroty od początku")
+        return None
+    dates, df_values, df_flows = load_account_history(db, account_id, last_date)
+    if list(df_values.columns) != list(df_stored.index):
+        return None     #New instruments
+    df_earlier_flows = load_account_flows(db, account_id, list(df_values.columns[:-1]))
+    df_earlier_flows = df_earlier_flows.loc[df_earlier_flows.index.str[:10] <= last_date]
+    return_tracker = ReturnTracker.from_summary(df_stored, last_date, df_earlier_flows.index, df_earlier_flows.to_numpy())
+    new_days = pd.to_datetime(pd.Index(dates)) > pd.Timestamp(last_date)
+    for date, values, flows in zip(dates[new_days], df_values.to_numpy()[new_days], df_flows.to_numpy()[new_days]):
+        return_tracker.append_day(date, values, flows)
+    print(f"Returns of account {account_id}: {int(new_days.sum())} new days")
+    return return_tracker
+
+def calculate_account_returns(db, account_id: int, write: bool=True):
+    """
+    Calculates TWR and XIRR of an account and of its instruments and writes them to the ACCOUNT_{id}_RETURNS table.
+
+    When the table has the state of an unchanged history, only the days after its last date are read and added with ReturnTracker.append_day.
+
+    :return: DataFrame indexed by instrument with the columns twr, xirr, value and net_invested.
+    :rtype: pd.DataFrame
+    """
+    table_name = f"ACCOUNT_{account_id}_RETURNS"
+    return_tracker = _restore_tracker(db, account_id, table_name)
+    if return_tracker is None:
+        dates, df_values, df_flows = load_account_history(db, account_id)
+        return_tracker = ReturnTracker.from_history(dates, df_values.to_numpy(), df_flows.to_numpy(), list(df_values.columns))
+    df_returns = return_tracker.summary()
+    if write:
+        df_state = df_returns.copy()
+        df_state["last_date"] = None
+        if return_tracker.last_day is not None:
+            last_date = str(np.datetime64(return_tracker.last_day, "D"))
+            df_states = history_states(db, account_id, last_date)
+            df_state["last_date"] = last_date
+            for column in history_columns:
+                df_state[column] = df_states[column].iloc[0]
+        db.write_df(df_state, table_name)
+    print(f"[###############100%###############] Returns of account {account_id} calculated for {len(df_returns) - 1} instruments")
+    return df_returns
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculates time-weighted and money-weighted returns of an account.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--account", type=int, default=1)
+    args = parser.parse_args()
+    db = tracker.get_database(args.database)
+    print(calculate_account_returns(db, args.account).to_string(float_format=lambda value: f"{value:.4f}"))
+
+
+if __name__ == "__main__":
+    main()
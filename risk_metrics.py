@@ -0,0 +1,277 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Rolling risk metrics
+
+Risk of an account calculated from its daily returns (return_analytics - account values adjusted for purchases and sales,
+so a purchase isn't a gain) and from the close prices of a benchmark ticker:
+- volatility: annualized standard deviation of daily returns in a rolling window.
+- sharpe: annualized mean excess return (over risk_free_rate) divided by the volatility, in the rolling window.
+- beta: covariance of the account and benchmark returns divided by the variance of the benchmark returns, in the rolling window.
+- drawdown, max_drawdown: fall of the wealth index (product of 1 + daily return) from its highest value (peak) - current and the deepest since the start.
+
+Returns are taken on working days (Monday - Friday), returns of weekends and holidays are compounded into the next working day.
+
+One engine calculates the metrics two ways, from the same window sums (sum of returns, of squares and of products):
+- RiskTracker.append updates them in O(1) when a day is added - the returns leaving the window are subtracted, the new ones added.
+- rolling_risk_metrics calculates the whole history with numpy (cumulated sums), for backfills.
+
+The ACCOUNT_{id}_RISK table keeps the daily metrics, the wealth index and its peak, so calculate_account_risk restores the tracker
+from the last window of the table, reads only the history from its last date on and appends the new days to the table.
+Every row also keeps the state of the history up to its day (number of days, sums of account_balance and total_cost). When the history
+of the last day changed (e.g. a backdated transaction), the whole table is rebuilt.
+
+Usage:
+    python risk_metrics.py [--database NAME] [--account ID] [--benchmark TICKER] [--window DAYS]
+
+Classes:
+- RiskTracker: Window sums, wealth index and metrics of the last day.
+    - append(self, account_return: float, benchmark_return: float): Adds one day, returns its metrics.
+    - from_history(cls, df_risk, window: int, ...): Tracker continuing the days of an ACCOUNT_{id}_RISK table.
+
+Functions:
+- rolling_risk_metrics(account_returns, benchmark_returns, window: int, risk_free_rate: float, periods_per_year: int): Metrics of every day.
+- load_return_series(db, account_id: int, benchmark_ticker: str, start_date: str): Working day returns of the account and of the benchmark.
+- calculate_account_risk(db, account_id: int, benchmark_ticker: str, window: int): Appends the new days to the ACCOUNT_{id}_RISK table, returns them.
+"""
+
+
+
+import argparse
+import math
+
+import invest_tracker_main as tracker
+import return_analytics
+import yahoo_finance_api as yfin
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+default_window = 63             #About three months of working days
+periods_per_year = 252          #Working days in a year
+metric_columns = ["account_return", "benchmark_return", "wealth", "peak", "drawdown", "max_drawdown", "volatility", "sharpe", "beta"]
+
+
+def _window_metrics(count, sum_a, sum_aa, sum_b, sum_bb, sum_ab, risk_free_rate: float, periods: int):
+    #Volatility, Sharpe ratio and beta from window sums, for floats and numpy arrays alike
+    count, sum_a, sum_aa, sum_b, sum_bb, sum_ab = (np.asarray(value, dtype=np.float64) for value in (count, sum_a, sum_aa, sum_b, sum_bb, sum_ab))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_a = sum_a / count
+        variance_a = (sum_aa - count * mean_a * mean_a) / (count - 1)
+        variance_a = np.where(variance_a > 0, variance_a, 0.0)
+        volatility = np.sqrt(variance_a * periods)
+        sharpe = np.where(variance_a > 0, (mean_a - risk_free_rate / periods) * periods / volatility, np.nan)
+        mean_b = sum_b / count
+        variance_b = (sum_bb - count * mean_b * mean_b) / (count - 1)
+        covariance = (sum_ab - count * mean_a * mean_b) / (count - 1)
+        beta = np.where(variance_b > 0, covariance / variance_b, np.nan)
+    return volatility, sharpe, beta
+
+def rolling_risk_metrics(account_returns, benchmark_returns=None, window: int=default_window, risk_free_rate: float=0.0, periods: int=periods_per_year):
+    """
+    Returns the metrics of every day as a DataFrame with the columns of metric_columns, indexed like account_returns.
+
+    Rolling metrics are NaN until the window is full. Beta uses the days where both returns are known.
+
+    :param account_returns: pd.Series of daily returns of the account.
+    :param benchmark_returns: pd.Series of daily returns of the benchmark with the same index, or None.
+    """
+    index = account_returns.index
+    a = pd.to_numeric(account_returns, errors='coerce').to_numpy(dtype=np.float64)
+    b = np.full(len(a), np.nan) if benchmark_returns is None else pd.to_numeric(benchmark_returns, errors='coerce').to_numpy(dtype=np.float64)
+    known_a = ~np.isnan(a)
+    a0 = np.where(known_a, a, 0.0)
+    both = known_a & ~np.isnan(b)
+    b0 = np.where(both, b, 0.0)
+    ab0 = np.where(both, a0, 0.0)
+
+    wealth = np.cumprod(1.0 + a0)
+    peak = np.maximum.accumulate(np.maximum(wealth, 1.0))
+    drawdown = wealth / peak - 1.0
+    max_drawdown = np.minimum.accumulate(drawdown)
+
+    def window_sum(values):
+        cumulated = np.concatenate([[0.0], np.cumsum(values)])
+        start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+        return cumulated[1:] - cumulated[start]
+
+    volatility, sharpe, _ = _window_metrics(window_sum(known_a), window_sum(a0), window_sum(a0 * a0), 0.0, 0.0, 0.0, risk_free_rate, periods)
+    _, _, beta = _window_metrics(window_sum(both), window_sum(ab0), window_sum(ab0 * ab0), window_sum(b0), window_sum(b0 * b0), window_sum(ab0 * b0), risk_free_rate, periods)
+    full = np.arange(1, len(a) + 1) >= window
+    return pd.DataFrame({"account_return": a,
+                         "benchmark_return": b,
+                         "wealth": wealth,
+                         "peak": peak,
+                         "drawdown": drawdown,
+                         "max_drawdown": max_drawdown,
+                         "volatility": np.where(full, volatility, np.nan),
+                         "sharpe": np.where(full, sharpe, np.nan),
+                         "beta": np.where(full, beta, np.nan)}, index=index)
+
+
+class RiskTracker:
+
+    def __init__(self, window: int=default_window, risk_free_rate: float=0.0, periods: int=periods_per_year):
+        self.window = window
+        self.risk_free_rate = risk_free_rate
+        self.periods = periods
+        self.account_window = [math.nan] * window      #Ring buffers of the last window returns
+        self.benchmark_window = [math.nan] * window
+        self.position = 0
+        self.days = 0
+        #Window sums: returns of the account (count, sum, squares) and days where both returns are known
+        self.count_a = self.sum_a = self.sum_aa = 0.0
+        self.count_ab = self.sum_pa = self.sum_pa2 = self.sum_b = self.sum_bb = self.sum_ab = 0.0
+        self.wealth = 1.0
+        self.peak = 1.0
+        self.max_drawdown = 0.0
+
+    def _add(self, a: float, b: float, sign: float):
+        if not math.isnan(a):
+            self.count_a += sign
+            self.sum_a += sign * a
+            self.sum_aa += sign * a * a
+            if not math.isnan(b):
+                self.count_ab += sign
+                self.sum_pa += sign * a
+                self.sum_pa2 += sign * a * a
+                self.sum_b += sign * b
+                self.sum_bb += sign * b * b
+                self.sum_ab += sign * a * b
+
+    def append(self, account_return: float, benchmark_return: float=math.nan):
+        """
+        Adds the returns of one day and returns the metrics of the day (dictionary with the keys of metric_columns). O(1).
+        """
+        account_return = float(account_return) if account_return is not None else math.nan
+        benchmark_return = float(benchmark_return) if benchmark_return is not None else math.nan
+        self._add(self.account_window[self.position], self.benchmark_window[self.position], -1.0)
+        self.account_window[self.position] = account_return
+        self.benchmark_window[self.position] = benchmark_return
+        self.position = (self.position + 1) % self.window
+        self._add(account_return, benchmark_return, 1.0)
+        self.days += 1
+
+        if not math.isnan(account_return):
+            self.wealth *= 1.0 + account_return
+        self.peak = max(self.peak, self.wealth)
+        drawdown = self.wealth / self.peak - 1.0
+        self.max_drawdown = min(self.max_drawdown, drawdown)
+
+        full = self.days >= self.window
+        volatility, sharpe, _ = _window_metrics(self.count_a, self.sum_a, self.sum_aa, 0.0, 0.0, 0.0, self.risk_free_rate, self.periods)
+        _, _, beta = _window_metrics(self.count_ab, self.sum_pa, self.sum_pa2, self.sum_b, self.sum_bb, self.sum_ab, self.risk_free_rate, self.periods)
+        return {"account_return": account_return,
+                "benchmark_return": benchmark_return,
+                "wealth": self.wealth,
+                "peak": self.peak,
+                "drawdown": drawdown,
+                "max_drawdown": self.max_drawdown,
+                "volatility": float(volatility) if full else math.nan,
+                "sharpe": float(sharpe) if full else math.nan,
+                "beta": float(beta) if full else math.nan}
+
+    @classmethod
+    def from_history(cls, df_risk, window: int=default_window, risk_free_rate: float=0.0, periods: int=periods_per_year):
+        """
+        Returns a tracker continuing after the last day of an ACCOUNT_{id}_RISK DataFrame. Only the last window rows are read.
+        """
+        risk_tracker = cls(window, risk_free_rate, periods)
+        if len(df_risk) == 0:
+            return risk_tracker
+        for account_return, benchmark_return in zip(df_risk["account_return"].iloc[-window:], df_risk["benchmark_return"].iloc[-window:]):
+            risk_tracker.append(account_return, benchmark_return)
+        last_row = df_risk.iloc[-1]
+        risk_tracker.days = len(df_risk)
+        risk_tracker.wealth = float(last_row["wealth"])
+        risk_tracker.peak = float(last_row["peak"])
+        risk_tracker.max_drawdown = float(last_row["max_drawdown"])
+        return risk_tracker
+
+
+def load_return_series(db, account_id: int, benchmark_ticker: str=None, start_date: str=None):
+    """
+    Returns a DataFrame indexed by working days (Date) with the columns account_return and benchmark_return (NaN without a benchmark).
+
+    :param start_date: A working day with known returns (the last day of the ACCOUNT_{id}_RISK table). Only the history from start_date on
+                       is read and the returns of the days after it are returned. None - the whole history.
+    """
+    dates, df_values, df_flows = return_analytics.load_account_history(db, account_id, start_date)
+    series = return_analytics.account_series
+    daily = return_analytics.daily_returns(df_values[[series]].to_numpy(), df_flows[[series]].to_numpy())[:, 0]
+    calendar = pd.to_datetime(pd.Index(dates))
+    if start_date is not None:
+        #start_date only gives the value the return of the next day starts from
+        after_start = calendar > pd.Timestamp(start_date)
+        daily, calendar = daily[after_start], calendar[after_start]
+    #Weekends and holidays are compounded into the next working day
+    working_days = calendar + pd.offsets.BDay(0)
+    df_returns = pd.Series(1.0 + daily, index=working_days).groupby(level=0).prod().sub(1.0).to_frame("account_return")
+    df_returns = df_returns.loc[df_returns.index <= calendar.max()]
+
+    df_returns["benchmark_return"] = np.nan
+    if benchmark_ticker:
+        if not db.check_table_exists(benchmark_ticker):
+            yfin.download_historical_data(ticker= benchmark_ticker, name_of_db= db.name)
+        if db.check_table_exists(benchmark_ticker):
+            df_close = db.get_table_df(benchmark_ticker, "Date", "Close").drop_duplicates(subset=["Date"])
+            close = pd.Series(pd.to_numeric(df_close["Close"], errors='coerce').to_numpy(), index=pd.to_datetime(df_close["Date"].astype(str).str[:10])).dropna()
+            days = df_returns.index if start_date is None else df_returns.index.union(pd.DatetimeIndex([start_date]))    #Close of start_date for the first return
+            close = close.reindex(close.index.union(days)).sort_index().ffill().reindex(days)
+            df_returns["benchmark_return"] = close.pct_change(fill_method=None).reindex(df_returns.index).to_numpy()
+    df_returns.index = df_returns.index.strftime("%Y-%m-%d")
+    df_returns.index.name = "Date"
+    return df_returns
+
+def calculate_account_risk(db, account_id: int, benchmark_ticker: str=None, window: int=default_window, risk_free_rate: float=0.0):
+    """
+    Brings the ACCOUNT_{id}_RISK table up to date: days after its last date are calculated with RiskTracker (O(1) per day)
+    from the history after that date and appended to the table.
+    The whole table is calculated with rolling_risk_metrics when it doesn't exist or the history up to its last date changed.
+
+    :return: DataFrame of the new rows of the ACCOUNT_{id}_RISK table indexed by Date (all rows after a rebuild).
+    :rtype: pd.DataFrame
+    """
+    table_name = f"ACCOUNT_{account_id}_RISK"
+    columns = metric_columns + return_analytics.history_columns
+    if db.check_table_exists(table_name) and set(columns) <= set(db.get_column_names(table_name)):
+        df_last = db.read_sql(f'SELECT * FROM "{table_name}" ORDER BY Date DESC LIMIT ?', (window,)).iloc[::-1].set_index("Date")
+        if len(df_last):
+            last_date = df_last.index[-1]
+            df_states = return_analytics.history_states(db, account_id, last_date)
+            if return_analytics.is_history_unchanged(df_last.iloc[-1], last_date, df_states):
+                df_returns = load_return_series(db, account_id, benchmark_ticker, start_date= last_date)
+                risk_tracker = RiskTracker.from_history(df_last[columns].apply(pd.to_numeric, errors='coerce'), window, risk_free_rate)
+                rows = [risk_tracker.append(account_return, benchmark_return) for account_return, benchmark_return in zip(df_returns["account_return"], df_returns["benchmark_return"])]
+                df_risk = pd.DataFrame(rows, index=df_returns.index, columns=metric_columns).join(df_states[return_analytics.history_columns])
+                if len(df_risk):
+                    db.write_df(df_risk, table_name, if_exists="append")
+                print(f"[###############100%###############] Risk of account {account_id}: {len(df_risk)} new days")
+                return df_risk
+            print(f"Zmieniona historia konta {account_id}, przeliczamy całą tabelę {table_name}")
+
+    df_returns = load_return_series(db, account_id, benchmark_ticker)
+    df_risk = rolling_risk_metrics(df_returns["account_return"], df_returns["benchmark_return"], window, risk_free_rate)
+    df_risk = df_risk.join(return_analytics.history_states(db, account_id)[return_analytics.history_columns])
+    db.write_df(df_risk, table_name)
+    print(f"[###############100%###############] Risk of account {account_id} calculated for {len(df_risk)} days")
+    return df_risk
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculates rolling volatility, drawdown, Sharpe ratio and beta of an account.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--account", type=int, default=1)
+    parser.add_argument("--benchmark", default=None, help="Ticker of the benchmark, e.g. WIG20.WA or ^GSPC.")
+    parser.add_argument("--window", type=int, default=default_window, help="Rolling window in working days.")
+    parser.add_argument("--risk-free-rate", type=float, default=0.0, help="Annual risk free rate, e.g. 0.05.")
+    args = parser.parse_args()
+    db = tracker.get_database(args.database)
+    calculate_account_risk(db, args.account, args.benchmark, args.window, args.risk_free_rate)
+    df_risk = db.read_sql(f'SELECT * FROM "ACCOUNT_{args.account}_RISK" ORDER BY Date DESC LIMIT 10').iloc[::-1].set_index("Date")
+    print(df_risk[metric_columns].to_string(float_format=lambda value: f"{value:.4f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Scheduler
+
+Keeps the data base up to date as a long-running process. Every refresh is a job with its own timetable:
+- fx_sync: exchange rates from NBP, on working days after table A is published (12:15).
+- price_sync: close prices from Yahoo Finance, on working days after the close of GPW (17:05) and of the US markets (22:00 CET).
+- bond_table: interest tables of government bonds from gov.pl, on Monday mornings.
+- valuation: valuation of all accounts (valuation_runner), every evening and after fx_sync or price_sync brought new data.
+
+- Merging: a job has at most one pending run. Triggers of a job which is already waiting are merged into that run,
+  and slots missed while the computer was asleep are run once. The valuation waits merge_window after a trigger,
+  so new exchange rates and new prices arriving together cause one valuation.
+- Retry: a failed job is retried after retry_delay, 2 * retry_delay, 4 * retry_delay, ... up to max_attempts, then it waits for its next slot.
+- JOB_RUNS: every run is recorded in the JOB_RUNS table (job, reason, start, end, duration, status, attempt, error).
+
+Usage:
+    python scheduler.py [--database NAME] [--run-now JOB [JOB ...]] [--list]
+
+Classes:
+- DailyAt: Timetable of a job - times of the day on chosen weekdays.
+- Job: A function with its timetable, jobs triggered after it brings new data and retry state.
+- Scheduler: Runs due jobs one after another, merges triggers, retries failures and records runs.
+
+Functions:
+- create_default_jobs(database_name: str, currencies: list): Jobs of FX sync, price sync, bond table refresh and valuation.
+"""
+
+
+
+import argparse
+import time
+import traceback
+from datetime import datetime, timedelta
+from datetime import time as time_of_day
+
+import invest_tracker_main as tracker
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+import goverment_bond_getting_table_of_interest as goverment_bond
+import valuation_runner
+
+
+class DailyAt:
+
+    def __init__(self, *times, weekdays: tuple=(1, 2, 3, 4, 5)):
+        self.times = sorted(times)
+        self.weekdays = tuple(weekdays)     #ISO weekdays, 1 - Monday
+
+    def next_after(self, moment: datetime):
+        """
+        Returns the first slot of the timetable later than moment.
+        """
+        day = moment.date()
+        for _ in range(8):
+            if day.isoweekday() in self.weekdays:
+                for at in self.times:
+                    slot = datetime.combine(day, at)
+                    if slot > moment:
+                        return slot
+            day += timedelta(days = 1)
+        return None
+
+    def __repr__(self):
+        return f"DailyAt({', '.join(at.strftime('%H:%M') for at in self.times)}, weekdays={self.weekdays})"
+
+
+class Job:
+
+    def __init__(self, name: str, function, timetable: DailyAt=None, triggers: tuple=(), max_attempts: int=4, retry_delay: timedelta=timedelta(minutes = 1)):
+        self.name = name
+        self.function = function            #Returns False when the run brought no new data, the triggered jobs are not run then
+        self.timetable = timetable
+        self.triggers = tuple(triggers)     #Names of jobs triggered after a run with new data
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.next_run: datetime = None
+        self.reason: str = None
+        self.attempt = 0
+
+    def schedule(self, moment: datetime, reason: str):
+        """
+        Plans a run at moment, unless an earlier run is already planned - then both are merged into the earlier one.
+        """
+        if self.next_run is None or moment < self.next_run:
+            self.next_run = moment
+            self.reason = reason
+            return True
+        return False
+
+    def schedule_next_slot(self, now: datetime):
+        self.next_run = self.timetable.next_after(now) if self.timetable else None
+        self.reason = "timetable"
+
+
+class Scheduler:
+
+    def __init__(self, db, jobs: list, merge_window: timedelta=timedelta(seconds = 60), clock=datetime.now, sleep=time.sleep):
+        self.db = db
+        self.jobs = {job.name: job for job in jobs}
+        self.merge_window = merge_window
+        self.clock = clock
+        self.sleep = sleep
+        self.db.create_table("JOB_RUNS", "id INTEGER PRIMARY KEY AUTOINCREMENT",
+                                         "job",
+                                         "reason",
+                                         "started",
+                                         "finished",
+                                         "duration REAL",
+                                         "status",
+                                         "attempt INTEGER",
+                                         "error")
+        now = self.clock()
+        for job in self.jobs.values():
+            job.schedule_next_slot(now)
+
+    def trigger(self, name: str, reason: str="manual", delay: timedelta=timedelta(0)):
+        job = self.jobs[name]
+        if job.schedule(self.clock() + delay, reason):
+            print(f"{name}: run planned at {job.next_run:%Y-%m-%d %H:%M:%S} ({reason})")
+        else:
+            print(f"{name}: trigger ({reason}) merged with the run planned at {job.next_run:%Y-%m-%d %H:%M:%S}")
+
+    def record(self, job: Job, started: datetime, finished: datetime, duration: float, status: str, error: str=None):
+        self.db.insert("JOB_RUNS", (None, job.name, job.reason, started.isoformat(sep=" ", timespec="seconds"),
+                                    finished.isoformat(sep=" ", timespec="seconds"), duration, status, job.attempt + 1, error))
+
+    def run(self, job: Job):
+        started = self.clock()
+        start = time.perf_counter()
+        print(f"[{started:%Y-%m-%d %H:%M:%S}] {job.name} started ({job.reason}, attempt {job.attempt + 1})")
+        try:
+            result = job.function()
+        except Exception as error:
+            duration = time.perf_counter() - start
+            self.record(job, started, self.clock(), duration, "failed", "".join(traceback.format_exception_only(type(error), error)).strip())
+            job.attempt += 1
+            if job.attempt < job.max_attempts:
+                job.next_run = self.clock() + job.retry_delay * 2 ** (job.attempt - 1)
+                job.reason = f"retry after {type(error).__name__}"
+                print(f"{job.name} failed: {error!r}. Retry at {job.next_run:%Y-%m-%d %H:%M:%S}")
+            else:
+                job.attempt = 0
+                job.schedule_next_slot(self.clock())
+                print(f"{job.name} failed {job.max_attempts} times: {error!r}. Next run at {job.next_run}")
+            return False
+
+        duration = time.perf_counter() - start
+        self.record(job, started, self.clock(), duration, "ok" if result is not False else "no new data")
+        job.attempt = 0
+        job.schedule_next_slot(self.clock())
+        print(f"{job.name} finished in {duration:.2f} s. Next run at {job.next_run}")
+        if result is not False:
+            for name in job.triggers:
+                self.trigger(name, f"after {job.name}", self.merge_window)
+        return True
+
+    def run_due_jobs(self):
+        """
+        Runs every job whose planned run is due, the earliest first.
+
+        :return: The number of runs.
+        """
+        runs = 0
+        while True:
+            now = self.clock()
+            due = [job for job in self.jobs.values() if job.next_run is not None and job.next_run <= now]
+            if not due:
+                return runs
+            self.run(min(due, key=lambda job: job.next_run))
+            runs += 1
+
+    def seconds_to_next_run(self, max_wait: float=60.0):
+        planned = [job.next_run for job in self.jobs.values() if job.next_run is not None]
+        if not planned:
+            return max_wait
+        return min(max(0.0, (min(planned) - self.clock()).total_seconds()), max_wait)
+
+    def print_plan(self):
+        for job in sorted(self.jobs.values(), key=lambda job: job.next_run or datetime.max):
+            print(f"{job.name:<12} next run: {job.next_run}  ({job.reason})  {job.timetable}")
+
+    def run_forever(self):
+        """
+        Runs the jobs until interrupted (Ctrl+C). The loop wakes up at least every minute, so changes of the clock are noticed.
+        """
+        self.print_plan()
+        try:
+            while True:
+                self.run_due_jobs()
+                self.sleep(self.seconds_to_next_run())
+        except KeyboardInterrupt:
+            print("Scheduler stopped")
+
+
+def get_currencies(db, currencies: list):
+    df_currencies = db.read_sql("SELECT DISTINCT currency FROM Transactions") if db.check_table_exists("Transactions") else None
+    transaction_currencies = list(df_currencies["currency"]) if df_currencies is not None else []
+    return [currency for currency in dict.fromkeys(list(currencies) + transaction_currencies) if currency and currency != "PLN"]
+
+def sync_prices(db):
+    df_tickers = db.read_sql("SELECT DISTINCT yahoo_ticker FROM Transactions")
+    updated = [yfin.download_historical_data(ticker= ticker, name_of_db= db.name) for ticker in df_tickers["yahoo_ticker"] if ticker]
+    return any(updated)
+
+def create_default_jobs(database_name: str="invest_tracker_data_base", currencies: list=["USD", "GBP", "EUR"]):
+    """
+    Returns the jobs of the scheduler: fx_sync, price_sync, bond_table and valuation.
+    """
+    db = tracker.get_database(database_name)
+    return [Job("fx_sync", lambda: nbp.check_nbp_api_for_new_exchange_rates(get_currencies(db, currencies), name_of_db= db.name),
+                DailyAt(time_of_day(12, 20), time_of_day(16, 0)), triggers=("valuation",)),
+            Job("price_sync", lambda: sync_prices(db),
+                DailyAt(time_of_day(17, 30), time_of_day(22, 30)), triggers=("valuation",)),
+            Job("bond_table", lambda: goverment_bond.update_goverment_bond_interest_table(db.name),
+                DailyAt(time_of_day(6, 0), weekdays=(1,)), triggers=("valuation",)),
+            Job("valuation", lambda: valuation_runner.run_valuation_for_all_accounts(database_name, sync=False),
+                DailyAt(time_of_day(23, 0), weekdays=(1, 2, 3, 4, 5, 6, 7)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs FX sync, price sync, bond table refresh and valuation on their timetables.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--run-now", nargs="+", default=[], help="Jobs to run right after the start (fx_sync, price_sync, bond_table, valuation).")
+    parser.add_argument("--list", action="store_true", help="Print the next runs of the jobs and exit.")
+    args = parser.parse_args()
+
+    db = tracker.get_database(args.database)
+    db.set_journal_mode("WAL")
+    scheduler = Scheduler(db, create_default_jobs(args.database))
+    if args.list:
+        scheduler.print_plan()
+        return
+    for name in args.run_now:
+        scheduler.trigger(name, "--run-now")
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Per-account shards
+
+Optional layout of the data base in which every account has its own SQLite file (shard) in the directory '{database_name}_shards':
+- account_{id}: the account (Accounts), its ledger (Transactions), the tables kept by triggers (POSITIONS, INSTRUMENTS, DIRTY_SLICES,
+  IMPORTED_TRANSACTIONS) and the derived tables (ACCOUNT_{id}_HISTORICAL_VALUE, INVESTMENT_VIEW_ACCOUNT_{id}, ACCOUNT_{id}_RETURNS, ...),
+- the shared market data (EXCHANGE_RATE_TABLE, close prices, bond interest tables) stays in the data base file, which is synchronized
+  with NBP, Yahoo Finance and gov.pl as before and attached to every shard as "market" (Database.attach_database).
+  Queries of a shard find the market tables by their names, the workers only read them,
+- consolidated: the cross-account view - CONSOLIDATED_ACCOUNTS, CONSOLIDATED_POSITIONS and CONSOLIDATED_HISTORY (daily balance and
+  total cost of every account) and the CONSOLIDATED_BALANCE view summing them per day. The rows of an account are replaced as soon as
+  its shard is valued.
+
+Writers of different accounts don't share a file, so they don't wait for each other's locks. The shards are valued by a pool of
+worker processes, the largest first, and a huge account keeps one worker busy while the others go through the rest.
+The market data is synchronized and loaded once (MarketData) and sent to every worker when it starts, like in valuation_runner.
+
+Usage:
+    python sharding.py --split                      #Copies every account of the data base to its shard (replaces existing shards)
+    python sharding.py [--workers N] [--no-sync] [--no-matrix-cache] [--low-memory] [--memory-budget-mb MB]
+
+Functions:
+- shard_path(account_id: int, directory: str): Path of the shard of an account.
+- get_shard_account_ids(directory: str): Ids of the accounts with a shard.
+- split_into_shards(database_name: str, directory: str, account_ids: list): Copies accounts of the data base to their shards.
+- open_shard(account_id: int, database_name: str, directory: str): Connects get_database() to a shard with the market data attached.
+- refresh_consolidated_view(consolidated_db, account_id: int, directory: str): Replaces the rows of an account in the consolidated view.
+- get_consolidated_balance_df(directory: str): Daily balance and total cost of all accounts.
+- run_sharded_valuation(database_name: str, directory: str, workers: int, currencies: list, sync: bool, use_matrix_cache: bool,
+                        low_memory: bool, memory_budget_mb: float): Values all shards in parallel.
+"""
+
+
+
+import argparse
+import multiprocessing
+import os
+import re
+import sqlite3 as sql
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import data_base
+import invest_tracker_main as tracker
+import interest_goverment_bond as bond_interest
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+import valuation_runner
+from market_data import MarketData
+from market_matrix_cache import MarketMatrixCache
+
+
+market_schema = "market"
+consolidated_name = "consolidated"
+_shard_name_pattern = re.compile(r"^account_(\d+)$")
+
+worker_shard_settings = None    #(database name, shard directory) of the worker process, set by initialize_shard_worker()
+
+
+def shards_directory_of(database_name: str):
+    return f"{database_name}_shards"
+
+def shard_path(account_id: int, directory: str):
+    return os.path.join(directory, f"account_{int(account_id)}")
+
+def get_shard_account_ids(directory: str):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(match.group(1)) for match in map(_shard_name_pattern.match, os.listdir(directory)) if match)
+
+def _account_tables_of(table_names: list, account_id: int):
+    pattern = re.compile(rf"(^|_)ACCOUNT_{int(account_id)}(_|$)")
+    return [table for table in table_names if pattern.search(table)]
+
+
+def split_into_shards(database_name: str="invest_tracker_data_base", directory: str=None, account_ids: list=None):
+    """
+    Copies accounts of the data base (all by default) to their shards: the Accounts row, the ledger with the same transaction ids,
+    fingerprints of imported transactions, pending dirty slices and the derived tables. The tables kept by triggers are rebuilt
+    by the triggers of the shard. Existing shards of the accounts are replaced, the data base itself is not changed.
+
+    :return: Ids of the split accounts.
+    :rtype: list
+    """
+    directory = directory or shards_directory_of(database_name)
+    os.makedirs(directory, exist_ok=True)
+    source = data_base.Database(database_name)
+    table_names = source.get_all_table_names()
+    account_ids = account_ids or valuation_runner.get_account_ids(source)
+
+    for account_id in account_ids:
+        path = shard_path(account_id, directory)
+        if os.path.isfile(path):
+            os.remove(path)
+        shard = data_base.Database(path)
+        tracker.initialize_database(shard)
+        shard.attach_database(database_name, market_schema)
+
+        columns = ", ".join(f'"{column}"' for column in shard.get_column_names("Transactions"))
+        shard.execute("INSERT INTO main.Accounts (id, name, balance, currency) SELECT id, name, 0, currency FROM market.Accounts WHERE id == ?", (account_id,))
+        shard.execute(f"INSERT INTO main.Transactions ({columns}) SELECT {columns} FROM market.Transactions WHERE account_id == ? ORDER BY id", (account_id,))
+        if "IMPORTED_TRANSACTIONS" in table_names:
+            shard.execute("""INSERT INTO main.IMPORTED_TRANSACTIONS SELECT imported.* FROM market.IMPORTED_TRANSACTIONS AS imported
+                             JOIN main.Transactions ON main.Transactions.id = imported.transaction_id""")
+
+        account_tables = _account_tables_of(table_names, account_id)
+        for table in account_tables:
+            #The same definitions, CREATE TABLE ... AS SELECT would lose the keys used by upserts of the derived tables
+            definitions = shard.read_sql("SELECT sql FROM market.sqlite_master WHERE tbl_name == ? AND sql IS NOT NULL ORDER BY type DESC", (table,))
+            for definition in definitions["sql"]:
+                shard.execute(definition)
+            shard.execute(f'INSERT INTO main."{table}" SELECT * FROM market."{table}"')
+        if f"ACCOUNT_{account_id}_HISTORICAL_VALUE" in account_tables:
+            #The copied history is as up to date as the one of the data base, the slices marked by the copied ledger are not dirty
+            shard.execute("DELETE FROM main.DIRTY_SLICES")
+            if "DIRTY_SLICES" in table_names:
+                shard.execute("INSERT INTO main.DIRTY_SLICES SELECT * FROM market.DIRTY_SLICES WHERE account_id == ?", (account_id,))
+        shard.detach_database(market_schema)
+        print(f"[###############100%###############] Account {account_id} copied to '{path}' ({len(account_tables)} derived tables)")
+    return list(account_ids)
+
+def open_shard(account_id: int, database_name: str="invest_tracker_data_base", directory: str=None):
+    """
+    Connects get_database() of invest_tracker_main to the shard of an account and attaches the data base with the market data.
+    Accounts, transactions and valuations of the process go to the shard from then on.
+    """
+    directory = directory or shards_directory_of(database_name)
+    path = shard_path(account_id, directory)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No shard of account {account_id} in '{directory}', run split_into_shards first.")
+    tracker.db = None
+    db = tracker.get_database(path, timeout=600.0)
+    db.attach_database(database_name, market_schema)
+    return db
+
+
+def _create_consolidated_tables(db):
+    db.create_table("CONSOLIDATED_ACCOUNTS", "account_id INTEGER PRIMARY KEY", "name", "currency", "balance REAL")
+    db.create_table("CONSOLIDATED_POSITIONS", "account_id INTEGER", "type_of_transaction_value", "number_of_units INTEGER", "total_cost REAL",
+                    "PRIMARY KEY (account_id, type_of_transaction_value)")
+    db.create_table("CONSOLIDATED_HISTORY", "account_id INTEGER", "Date", "account_balance REAL", "total_cost REAL", "PRIMARY KEY (account_id, Date)")
+    db.execute("""CREATE VIEW IF NOT EXISTS CONSOLIDATED_BALANCE AS
+                  SELECT Date, SUM(account_balance) AS account_balance, SUM(total_cost) AS total_cost, COUNT(*) AS accounts
+                  FROM CONSOLIDATED_HISTORY GROUP BY Date""")
+
+def refresh_consolidated_view(consolidated_db, account_id: int, directory: str):
+    """
+    Replaces the rows of an account in the consolidated tables with the ones of its shard.
+    """
+    consolidated_db.attach_database(shard_path(account_id, directory), "shard")
+    try:
+        statements = [("DELETE FROM CONSOLIDATED_ACCOUNTS WHERE account_id == ?", (account_id,)),
+                      ("DELETE FROM CONSOLIDATED_POSITIONS WHERE account_id == ?", (account_id,)),
+                      ("DELETE FROM CONSOLIDATED_HISTORY WHERE account_id == ?", (account_id,)),
+                      ("""INSERT INTO CONSOLIDATED_ACCOUNTS SELECT id, name, currency, balance FROM shard.Accounts WHERE id == ?""", (account_id,)),
+                      ("""INSERT INTO CONSOLIDATED_POSITIONS SELECT account_id, type_of_transaction_value, number_of_units, total_cost
+                          FROM shard.POSITIONS WHERE account_id == ?""", (account_id,))]
+        if consolidated_db.check_table_exists(f"ACCOUNT_{account_id}_HISTORICAL_VALUE", schema="shard"):
+            statements.append((f"""INSERT OR REPLACE INTO CONSOLIDATED_HISTORY SELECT ?, Date, account_balance, total_cost
+                                   FROM shard."ACCOUNT_{account_id}_HISTORICAL_VALUE" WHERE Date IS NOT NULL""", (account_id,)))
+        with consolidated_db.transaction():
+            for query, params in statements:
+                consolidated_db.execute(query, params)
+    finally:
+        consolidated_db.detach_database("shard")
+
+def get_consolidated_balance_df(directory: str=None):
+    """
+    Returns a DataFrame indexed by Date with the summed account_balance and total_cost of all accounts and the number of accounts.
+    """
+    directory = directory or shards_directory_of("invest_tracker_data_base")
+    db = data_base.Database(os.path.join(directory, consolidated_name))
+    _create_consolidated_tables(db)
+    return db.read_sql("SELECT * FROM CONSOLIDATED_BALANCE ORDER BY Date").set_index("Date")
+
+
+def _instruments_of_shards(directory: str, account_ids: list):
+    #Tickers, currencies and the first purchase of all shards, read with short connections of their own
+    tickers, currencies, start_dates = [], [], []
+    for account_id in account_ids:
+        conn = sql.connect(shard_path(account_id, directory))
+        tickers += [ticker for (ticker,) in conn.execute("SELECT DISTINCT yahoo_ticker FROM Transactions")]
+        currencies += [currency for (currency,) in conn.execute("SELECT DISTINCT currency FROM Transactions")]
+        start_dates += [start_date for (start_date,) in conn.execute("SELECT MIN(date_of_purchase) FROM Transactions") if start_date]
+        conn.close()
+    return [ticker for ticker in dict.fromkeys(tickers) if ticker], [currency for currency in dict.fromkeys(currencies) if currency], min(start_dates, default=None)
+
+def initialize_shard_worker(database_name: str, directory: str, market_data, low_memory: bool=False, memory_budget_mb: float=None):
+    global worker_shard_settings
+    if low_memory:
+        data_base.Database.enable_low_memory_mode("float32", memory_budget_mb)
+    bond_interest.connect(database_name)    #The bond interest tables are in the data base, shards only attach it
+    valuation_runner.worker_market_data = market_data
+    worker_shard_settings = (database_name, directory)
+
+def value_shard(account_id: int):
+    """
+    Values the account of a shard (valuation_runner.value_account), runs in a worker process.
+    """
+    database_name, directory = worker_shard_settings
+    open_shard(account_id, database_name, directory)
+    return valuation_runner.value_account(account_id)
+
+def run_sharded_valuation(database_name: str="invest_tracker_data_base", directory: str=None, workers: int=None,
+                          currencies: list=["USD", "GBP", "EUR"], sync: bool=True, use_matrix_cache: bool=True,
+                          low_memory: bool=False, memory_budget_mb: float=None):
+    """
+    Values every shard in a pool of worker processes and refreshes the consolidated view after each of them.
+    The data base is split first when the directory has no shards.
+
+    :param database_name: The data base with the market data.
+    :param directory: The directory of the shards. Defaults to '{database_name}_shards'.
+    :param workers: The number of worker processes. Defaults to the number of CPUs.
+    :param currencies: The currencies synchronized with NBP.
+    :param sync: Download new exchange rates and prices of the instruments of all shards before the valuation.
+    :param use_matrix_cache: Serve exchange rates and close prices from the memory-mapped matrix cache.
+    :param low_memory: Read typed float32 frames in the workers (Database.enable_low_memory_mode).
+    :param memory_budget_mb: The memory budget of typed frames of every worker, None - no limit.
+    :return: A dictionary {account_id: valuation time in seconds}.
+    :rtype: dict
+    """
+    directory = directory or shards_directory_of(database_name)
+    db = tracker.get_database(database_name)
+    db.set_journal_mode("WAL")
+    bond_interest.connect(database_name)
+    account_ids = get_shard_account_ids(directory) or split_into_shards(database_name, directory)
+    tickers, shard_currencies, start_date = _instruments_of_shards(directory, account_ids)
+    currencies = list(dict.fromkeys(list(currencies) + shard_currencies))
+    if sync:
+        nbp.check_nbp_api_for_new_exchange_rates([currency for currency in currencies if currency != "PLN"], name_of_db= database_name)
+        for ticker in tickers:
+            yfin.download_historical_data(ticker= ticker, name_of_db= database_name)
+    market_data = MarketData.load(db, tickers, currencies, start_date, MarketMatrixCache(database_name) if use_matrix_cache else None)
+
+    consolidated_db = data_base.Database(os.path.join(directory, consolidated_name))
+    _create_consolidated_tables(consolidated_db)
+    account_ids = sorted(account_ids, key=lambda account_id: os.path.getsize(shard_path(account_id, directory)), reverse=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(account_ids), 1))
+
+    print(f"Valuation of {len(account_ids)} shards with {workers} workers")
+    results = {}
+    with ProcessPoolExecutor(max_workers= workers,
+                             mp_context= multiprocessing.get_context("spawn"),
+                             initializer= initialize_shard_worker,
+                             initargs= (database_name, directory, market_data, low_memory, memory_budget_mb)) as executor:
+        futures = {executor.submit(value_shard, account_id): account_id for account_id in account_ids}
+        for future in as_completed(futures):
+            account_id = futures[future]
+            results[account_id] = future.result()
+            refresh_consolidated_view(consolidated_db, account_id, directory)
+            print(f"Account {account_id} valued in {results[account_id]:.2f} s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keeps every account in its own SQLite file and values the files in parallel.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--directory", default=None, help="Directory of the shards, defaults to '{database}_shards'.")
+    parser.add_argument("--split", action="store_true", help="Copy every account of the data base to its shard and exit.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, defaults to the number of CPUs.")
+    parser.add_argument("--no-sync", action="store_true", help="Don't download new exchange rates and prices.")
+    parser.add_argument("--no-matrix-cache", action="store_true", help="Load exchange rates and prices from the data base instead of the memory-mapped matrices.")
+    parser.add_argument("--low-memory", action="store_true", help="Read float32 typed frames in the workers.")
+    parser.add_argument("--memory-budget-mb", type=float, default=None, help="Memory budget of typed frames of every worker (with --low-memory).")
+    args = parser.parse_args()
+
+    if args.split:
+        split_into_shards(args.database, args.directory)
+        return
+    run_sharded_valuation(args.database, args.directory, args.workers, sync= not args.no_sync, use_matrix_cache= not args.no_matrix_cache,
+                          low_memory= args.low_memory, memory_budget_mb= args.memory_budget_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Columnar snapshot export of valuation history
+
+After every valuation run the daily history of an account is written as a columnar snapshot, partitioned by account and year:
+
+    snapshots/holdings/account_id=1/year=2023/part-0.parquet    (Date, instrument, currency, units, value, fx_rate, cost_basis)
+    snapshots/accounts/account_id=1/year=2023/part-0.parquet    (Date, account_balance, total_cost)
+
+- holdings: daily number of units, value in PLN, exchange rate to PLN of the instrument currency and cost basis (cumulated total cost) of every instrument.
+- accounts: daily balance and total cost of the account.
+
+The files are Parquet or Arrow IPC (format="arrow"). Notebooks and BI tools read them directly (e.g. pyarrow.dataset, pandas.read_parquet, DuckDB)
+with column pruning and partition filters, and Arrow IPC files are memory-mapped, so reading them copies nothing.
+load_historical_value_from_snapshot is a standalone helper for notebooks and scripts - it rebuilds the historical value of an account
+from the snapshot without going through SQLite.
+The application reads the daily balance and total cost of an account (historical balance, charts) with read_account_history: from the
+snapshot when it was exported from the current ACCOUNT_{id}_HISTORICAL_VALUE table, from SQLite otherwise. The state of the table
+(data base, number of days, last day, sums of the balance and total cost) is written to snapshots/_account_{id}.json after the export
+and compared with the table before every read, so a valuation which wasn't exported yet is read from the data base.
+Re-exporting an account replaces all its partitions, years no longer in its history are removed.
+
+Requires the optional `pyarrow` package.
+
+Functions:
+- pyarrow_available(): Checks if pyarrow is installed.
+- build_holdings_df(db, account_id: int): Daily holdings of an account in long format.
+- build_account_history_df(db, account_id: int): Daily balance and total cost of an account.
+- export_valuation_snapshot(db, account_id: int, snapshot_dir: str, file_format: str): Writes the snapshot of an account.
+- load_snapshot(table: str, snapshot_dir: str, columns: list, account_id: int, start_date: str, end_date: str, file_format: str): Reads a snapshot table as a pyarrow Table.
+- load_historical_value_from_snapshot(account_id: int, snapshot_dir: str, file_format: str): Rebuilds the ACCOUNT_{id}_HISTORICAL_VALUE DataFrame from the snapshot.
+- is_snapshot_current(db, account_id: int, snapshot_dir: str): Checks if the snapshot of an account was exported from its current history.
+- read_account_history(db, account_id: int, snapshot_dir: str): Daily balance and total cost of an account, from the snapshot when it is current.
+"""
+
+
+
+import importlib.util
+import json
+import os
+import shutil
+
+from lazy_import import lazy_module
+import instruments
+
+pd = lazy_module("pandas")
+pa = lazy_module("pyarrow")
+ds = lazy_module("pyarrow.dataset")
+
+default_snapshot_dir = "snapshots"
+file_extensions = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def pyarrow_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+def _dataset_format(file_format: str):
+    if file_format not in file_extensions:
+        raise ValueError(f"Unknown snapshot format '{file_format}'. Use 'parquet' or 'arrow'.")
+    return "ipc" if file_format == "arrow" else "parquet"
+
+def _partitioning():
+    return ds.partitioning(pa.schema([("account_id", pa.int32()), ("year", pa.int16())]), flavor="hive")
+
+def build_holdings_df(db, account_id: int):
+    """
+    Returns the daily holdings of an account in long format: Date, instrument, currency, units, value, fx_rate, cost_basis.
+    """
+    df_history = db.get_table_df(f"ACCOUNT_{account_id}_HISTORICAL_VALUE")
+    tickers = [column[:-len("_number_of_units")] for column in df_history.columns if column.endswith("_number_of_units")]
+    dates = pd.to_datetime(df_history["Date"])
+
+    frames = []
+    for ticker in tickers:
+        value_column = f"{ticker}_value"
+        frames.append(pd.DataFrame({"Date": dates,
+                                    "instrument": ticker,
+                                    "units": pd.to_numeric(df_history[f"{ticker}_number_of_units"], errors='coerce'),
+                                    "value": pd.to_numeric(df_history[value_column], errors='coerce') if value_column in df_history.columns else float("nan")}))
+    if not frames:
+        return pd.DataFrame(columns=["Date", "instrument", "currency", "units", "value", "fx_rate", "cost_basis"])
+    df_holdings = pd.concat(frames, ignore_index=True)
+
+    #Currency of instruments and exchange rates to PLN
+    df_transactions = db.get_table_df_with_conditions("Transactions", "date_of_purchase", "yahoo_ticker", "currency", "total_cost", account_id = f"{account_id}")
+    registry = instruments.get_registry(db)
+    currencies = {ticker: registry.currency_of(ticker) for ticker in tickers}
+    df_holdings["currency"] = df_holdings["instrument"].map(currencies).fillna("PLN")
+    df_holdings["fx_rate"] = 1.0
+    foreign_currencies = [currency for currency in df_holdings["currency"].unique() if currency != "PLN"]
+    if foreign_currencies and db.check_table_exists("EXCHANGE_RATE_TABLE"):
+        df_rates = db.get_table_df("EXCHANGE_RATE_TABLE", "Date", *[f"{currency}_PLN" for currency in foreign_currencies])
+        df_rates = df_rates.drop_duplicates(subset=["Date"]).set_index("Date")
+        df_rates.index = pd.to_datetime(df_rates.index)
+        df_rates = df_rates.apply(pd.to_numeric, errors='coerce').reindex(df_rates.index.union(dates.drop_duplicates())).sort_index().ffill()
+        for currency in foreign_currencies:
+            mask = df_holdings["currency"] == currency
+            df_holdings.loc[mask, "fx_rate"] = df_rates[f"{currency}_PLN"].reindex(df_holdings.loc[mask, "Date"]).to_numpy()
+
+    #Cost basis - total cost of the instrument cumulated up to the date
+    df_transactions["Date"] = pd.to_datetime(df_transactions["date_of_purchase"])
+    df_transactions["total_cost"] = pd.to_numeric(df_transactions["total_cost"], errors='coerce').fillna(0.0)
+    df_cost = df_transactions.pivot_table(index="Date", columns="yahoo_ticker", values="total_cost", aggfunc="sum").cumsum()
+    df_cost = df_cost.reindex(df_cost.index.union(dates.drop_duplicates())).sort_index().ffill().fillna(0.0)
+    df_cost = df_cost.stack().rename("cost_basis").reset_index().rename(columns={"level_0": "Date", "yahoo_ticker": "instrument"})
+    df_holdings = df_holdings.merge(df_cost, on=["Date", "instrument"], how="left")
+    df_holdings["cost_basis"] = df_holdings["cost_basis"].fillna(0.0)
+    df_holdings["instrument"] = df_holdings["instrument"].astype("category")
+    df_holdings["currency"] = df_holdings["currency"].astype("category")
+    return df_holdings[["Date", "instrument", "currency", "units", "value", "fx_rate", "cost_basis"]]
+
+def build_account_history_df(db, account_id: int):
+    """
+    Returns the daily balance and total cost of an account: Date, account_balance, total_cost.
+    """
+    df_history = db.get_table_df(f"ACCOUNT_{account_id}_HISTORICAL_VALUE", "Date", "account_balance", "total_cost")
+    df_history["Date"] = pd.to_datetime(df_history["Date"])
+    df_history["account_balance"] = pd.to_numeric(df_history["account_balance"], errors='coerce')
+    df_history["total_cost"] = pd.to_numeric(df_history["total_cost"], errors='coerce').ffill()
+    return df_history
+
+def _write_partitioned(df, account_id: int, base_dir: str, file_format: str):
+    df = df.assign(Date=pd.to_datetime(df["Date"]))     #Empty frames (an account without holdings) have object dtype
+    df = df.assign(account_id=int(account_id), year=df["Date"].dt.year.astype("int16"), Date=df["Date"].dt.date)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.cast(table.schema.set(table.schema.get_field_index("account_id"), pa.field("account_id", pa.int32())))
+    ds.write_dataset(table, base_dir,
+                     format= _dataset_format(file_format),
+                     partitioning= _partitioning(),
+                     basename_template= f"part-{{i}}.{file_extensions[file_format]}",
+                     existing_data_behavior= "delete_matching")
+    #Partitions of years no longer in the history (e.g. after deleting old transactions) are not matched by the write
+    account_dir = os.path.join(base_dir, f"account_id={int(account_id)}")
+    written_years = {f"year={year}" for year in df["year"].unique()}
+    if os.path.isdir(account_dir):
+        for entry in os.listdir(account_dir):
+            if entry.startswith("year=") and entry not in written_years:
+                shutil.rmtree(os.path.join(account_dir, entry))
+
+def export_valuation_snapshot(db, account_id: int, snapshot_dir: str=default_snapshot_dir, file_format: str="parquet"):
+    """
+    Writes the holdings and account history snapshot of an account, replacing its previous snapshot.
+
+    :return: A dictionary {snapshot table: number of rows}.
+    :rtype: dict
+    """
+    if not pyarrow_available():
+        raise ImportError("Snapshot export requires the 'pyarrow' package (pip install pyarrow).")
+    df_holdings = build_holdings_df(db, account_id)
+    df_account_history = build_account_history_df(db, account_id)
+    _write_partitioned(df_holdings, account_id, os.path.join(snapshot_dir, "holdings"), file_format)
+    _write_partitioned(df_account_history, account_id, os.path.join(snapshot_dir, "accounts"), file_format)
+    _write_state(db, account_id, snapshot_dir, file_format)
+    print(f"[###############100%###############] Snapshot of account {account_id} written to '{snapshot_dir}'")
+    return {"holdings": len(df_holdings), "accounts": len(df_account_history)}
+
+def _state_path(account_id: int, snapshot_dir: str):
+    return os.path.join(snapshot_dir, f"_account_{int(account_id)}.json")
+
+def _table_state(db, account_id: int):
+    """
+    Returns the state of ACCOUNT_{id}_HISTORICAL_VALUE compared by is_snapshot_current: data base, number of days, last day and sums
+    of the balance and total cost. A recalculation of the history changes the sums.
+    """
+    days, last_date, balance, total_cost = db.read_sql(f"""SELECT COUNT(*), MAX(Date), TOTAL(account_balance), TOTAL(total_cost)
+                                                         FROM "ACCOUNT_{int(account_id)}_HISTORICAL_VALUE" """).iloc[0]
+    return {"database": os.path.abspath(db.name), "days": int(days), "last_date": str(last_date),
+            "balance": round(float(balance), 6), "total_cost": round(float(total_cost), 6)}
+
+def _write_state(db, account_id: int, snapshot_dir: str, file_format: str):
+    path = _state_path(account_id, snapshot_dir)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump({"file_format": file_format, "table": _table_state(db, account_id)}, file, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def _read_state(account_id: int, snapshot_dir: str):
+    path = _state_path(account_id, snapshot_dir)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+def load_snapshot(table: str="holdings", snapshot_dir: str=default_snapshot_dir, columns: list=None, account_id: int=None,
+                  start_date: str=None, end_date: str=None, file_format: str="parquet"):
+    """
+    Reads a snapshot table ("holdings" or "accounts") as a pyarrow Table.
+
+    Only the requested columns and the partitions matching account_id and the date range are read.
+    Call .to_pandas() on the result for a DataFrame.
+    """
+    dataset = ds.dataset(os.path.join(snapshot_dir, table), format= _dataset_format(file_format), partitioning= _partitioning())
+    conditions = []
+    if account_id is not None:
+        conditions.append(ds.field("account_id") == int(account_id))
+    if start_date is not None:
+        conditions.append(ds.field("year") >= int(str(start_date)[:4]))
+        conditions.append(ds.field("Date") >= pd.Timestamp(start_date).date())
+    if end_date is not None:
+        conditions.append(ds.field("year") <= int(str(end_date)[:4]))
+        conditions.append(ds.field("Date") <= pd.Timestamp(end_date).date())
+    condition = None
+    for item in conditions:
+        condition = item if condition is None else condition & item
+    return dataset.to_table(columns= columns, filter= condition)
+
+def load_historical_value_from_snapshot(account_id: int, snapshot_dir: str=default_snapshot_dir, file_format: str="parquet"):
+    """
+    Rebuilds the DataFrame of the ACCOUNT_{id}_HISTORICAL_VALUE table (indexed by Date) from the snapshot.
+    """
+    df_holdings = load_snapshot("holdings", snapshot_dir, ["Date", "instrument", "units", "value"], account_id, file_format= file_format).to_pandas()
+    df_account = load_snapshot("accounts", snapshot_dir, ["Date", "account_balance", "total_cost"], account_id, file_format= file_format).to_pandas()
+    df_account["Date"] = df_account["Date"].astype(str)
+    df_account = df_account.set_index("Date").sort_index()
+    if df_holdings.empty:
+        return df_account
+    df_holdings["Date"] = df_holdings["Date"].astype(str)
+    df_wide = df_holdings.pivot_table(index="Date", columns="instrument", values=["units", "value"], aggfunc="first", observed=True, dropna=False)
+    df_wide.columns = [f"{ticker}_number_of_units" if kind == "units" else f"{ticker}_value" for kind, ticker in df_wide.columns]
+    return df_account[["account_balance"]].join(df_wide, how="left").join(df_account[["total_cost"]])
+
+def is_snapshot_current(db, account_id: int, snapshot_dir: str=default_snapshot_dir):
+    """
+    Checks if the snapshot of an account was exported from the current ACCOUNT_{id}_HISTORICAL_VALUE table of the data base.
+    """
+    state = _read_state(account_id, snapshot_dir)
+    if state is None or not pyarrow_available() or not db.check_table_exists(f"ACCOUNT_{int(account_id)}_HISTORICAL_VALUE"):
+        return False
+    return state["table"] == _table_state(db, account_id)
+
+def read_account_history(db, account_id: int, snapshot_dir: str=default_snapshot_dir):
+    """
+    Returns the daily balance and total cost of an account (Date, account_balance, total_cost) ordered by Date.
+
+    They are read from the snapshot when it is current (is_snapshot_current), otherwise from ACCOUNT_{id}_HISTORICAL_VALUE.
+    """
+    if is_snapshot_current(db, account_id, snapshot_dir):
+        file_format = _read_state(account_id, snapshot_dir)["file_format"]
+        df = load_snapshot("accounts", snapshot_dir, ["Date", "account_balance", "total_cost"], account_id, file_format= file_format).to_pandas()
+        df["Date"] = df["Date"].astype(str)
+        return df.sort_values("Date", ignore_index=True)
+    return db.read_sql(f'SELECT Date, account_balance, total_cost FROM "ACCOUNT_{int(account_id)}_HISTORICAL_VALUE" ORDER BY Date')
@@ -0,0 +1,49 @@
+"""
+Bond values read from the data base the valuation runs on.
+
+A worker of valuation_runner valuing a data base with another name than the default one has to read the bond interest tables
+and the first purchase of the bond from that data base.
+"""
+
+
+
+import os
+
+import pytest
+
+import interest_goverment_bond as bond_interest
+import invest_tracker_main as tracker
+import valuation_runner
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+
+bond = "EDO0132"
+
+
+@pytest.fixture
+def database_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database_name = str(tmp_path / "other_data_base")
+    tracker.db = None
+    db = tracker.get_database(database_name)
+    db.write_df(pd.DataFrame({"seria": [bond], "oprocentowanie_1rok": [0.10], "oprocentowanie_2rok": [0.05]}), "EDO", index=False)
+    tracker.initialize_database(db)
+    db.execute("INSERT INTO Transactions (account_id, date_of_purchase, yahoo_ticker, currency) VALUES (1, '2022-01-01', ?, 'PLN')", (bond,))
+    tracker.db = None
+    yield database_name
+    tracker.db = None
+    bond_interest.conn = None
+
+
+def test_worker_reads_bonds_of_its_data_base(database_name):
+    valuation_runner.initialize_worker(database_name, None)
+    last_market_price, currency = bond_interest.get_current_bond_value(bond, "2023-01-01")
+    assert (last_market_price, currency) == (110.0, "PLN")
+    assert not os.path.exists("invest_tracker_data_base")
+
+def test_bond_values_of_a_given_connection(database_name):
+    db = tracker.get_database(database_name)
+    values = bond_interest.get_bond_values(bond, ["2021-12-31", "2022-01-01", "2023-01-01"], db.conn)
+    assert pd.isna(values[0]) and list(values[1:]) == [100.0, 110.0]
+    assert bond_interest.conn is None
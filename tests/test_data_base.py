@@ -0,0 +1,50 @@
+"""
+Query cache and transactions of data_base.Database.
+
+Cached results of a table have to be dropped by every write to it, also when the statement names the table with its schema
+(drop_table uses main."X"), and a transaction() block which raises leaves none of its changes behind.
+"""
+
+
+
+import pytest
+
+import data_base
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = data_base.Database(str(tmp_path / "test_data_base"))
+    db.enable_cache()
+    yield db
+    db.conn.close()
+
+
+@pytest.mark.parametrize("query, table", [('DROP TABLE IF EXISTS main."SYN0000.WA"', "SYN0000.WA"),
+                                          ("SELECT * FROM main.Transactions", "Transactions"),
+                                          ('INSERT INTO market."ACCOUNT_1_HISTORICAL_VALUE" SELECT * FROM shard."X"', "ACCOUNT_1_HISTORICAL_VALUE"),
+                                          ('SELECT * FROM "SYN0000.WA"', "SYN0000.WA")])
+def test_tables_of_skips_schema(query, table):
+    assert data_base.QueryStatistics.tables_of(query)[0] == table
+
+def test_drop_table_invalidates_cached_reads(db):
+    db.create_table("H", "Date", "value REAL")
+    db.execute("INSERT INTO H VALUES (?, ?)", ("2024-01-02", 1.0))
+    assert len(db.read_sql("SELECT * FROM H")) == 1
+
+    db.drop_table("H")
+    db.create_table("H", "Date", "value REAL")
+    assert db.read_sql("SELECT * FROM H").empty
+
+def test_transaction_rolls_back_when_the_block_raises(db):
+    db.create_table("H", "Date", "value REAL")
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.execute("INSERT INTO H VALUES (?, ?)", ("2024-01-02", 1.0))
+            raise ValueError
+    assert db.read_sql("SELECT * FROM H").empty
+
+    with db.transaction():
+        db.execute("INSERT INTO H VALUES (?, ?)", ("2024-01-02", 1.0))
+        db.execute("INSERT INTO H VALUES (?, ?)", ("2024-01-03", 2.0))
+    assert len(db.read_sql("SELECT * FROM H")) == 2
@@ -0,0 +1,117 @@
+"""
+Incremental recalculation of dirty slices compared with a full rebuild.
+
+A synthetic portfolio is valued, a transaction is updated, deleted or inserted with an earlier date, and the account is valued again
+from DIRTY_SLICES. The result has to be the same as ACCOUNT_{id}_HISTORICAL_VALUE calculated from scratch, and the units
+of INVESTMENT_VIEW_ACCOUNT_{id} the same as in POSITIONS and on the last day of the history.
+Runs offline with the fake providers of the benchmarks (python -m pytest tests).
+"""
+
+
+
+from datetime import date, timedelta
+
+import pytest
+
+import cross_rates
+import instruments
+import interest_goverment_bond as bond_interest
+import invest_tracker_main as tracker
+from benchmarks.fake_providers import offline_providers
+from benchmarks.pipeline_benchmark import run_pipeline
+from benchmarks.synthetic_portfolio import SyntheticPortfolio
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+
+account_id = 1
+
+
+@pytest.fixture
+def portfolio(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cross_rates._cache.clear()
+    instruments.registry = None
+    portfolio = SyntheticPortfolio(transactions=80, instruments=4, years=1, accounts=1, currencies=2, bond_series=1)
+    run_pipeline(portfolio, trace_memory=False)
+    yield portfolio
+    tracker.db = None
+    bond_interest.conn = None
+    instruments.registry = None
+
+
+def value_account(portfolio):
+    db = tracker.get_database()
+    account = tracker.Account.from_database(account_id, db)
+    with offline_providers(portfolio):
+        account.investment_view_by_type()
+        account.historical_values_for_investmens_on(db=db)
+        account.calculate_historical_balance_and_append_to_db(db=db)
+        account.calculate_historical_total_cost_for(db=db)
+
+def read_history(db):
+    df = db.read_sql(f"SELECT * FROM ACCOUNT_{account_id}_HISTORICAL_VALUE ORDER BY Date").set_index("Date")
+    return df[sorted(df.columns)].apply(pd.to_numeric, errors='coerce')
+
+def transactions_of(db, ticker: str):
+    return db.read_sql("SELECT id, date_of_purchase FROM Transactions WHERE account_id == ? AND yahoo_ticker == ? ORDER BY date_of_purchase, id",
+                       (account_id, ticker))
+
+def market_ticker_of(portfolio):
+    return next(ticker for ticker in portfolio.instruments if ticker not in portfolio.bond_series)
+
+
+def update_transaction(portfolio, db):
+    df = transactions_of(db, market_ticker_of(portfolio))
+    tracker.Transaction.update_transaction(int(df["id"].iloc[len(df) // 2]), number_of_units=7)
+
+def update_bond_transaction(portfolio, db):
+    df = transactions_of(db, next(iter(portfolio.bond_series)))
+    tracker.Transaction.update_transaction(int(df["id"].iloc[len(df) // 2]), number_of_units=3)
+
+def delete_transaction(portfolio, db):
+    df = transactions_of(db, market_ticker_of(portfolio))
+    tracker.Transaction.delete_transaction(int(df["id"].iloc[len(df) // 2]))
+
+def insert_backdated_transaction(portfolio, db):
+    ticker = market_ticker_of(portfolio)
+    currency, type_of_investment = portfolio.instruments[ticker]
+    first_date = date.fromisoformat(transactions_of(db, ticker)["date_of_purchase"].iloc[0])
+    day = first_date + timedelta(days = 1)
+    tracker.Transaction(account_id, str(day), "BUY", ticker, currency, 11, round(portfolio.price_on(ticker, day), 2), 0, ticker, type_of_investment)
+
+def insert_transaction_before_history(portfolio, db):
+    ticker = market_ticker_of(portfolio)
+    currency, type_of_investment = portfolio.instruments[ticker]
+    first_day = date.fromisoformat(str(db.get_value(f"SELECT MIN(Date) FROM ACCOUNT_{account_id}_HISTORICAL_VALUE"))[:10])
+    day = first_day - timedelta(days = 10)
+    tracker.Transaction(account_id, str(day), "BUY", ticker, currency, 5, round(portfolio.price_on(ticker, day), 2), 0, ticker, type_of_investment)
+
+
+@pytest.mark.parametrize("change", [update_transaction, update_bond_transaction, delete_transaction, insert_backdated_transaction,
+                                    insert_transaction_before_history])
+def test_incremental_recalculation_matches_full_rebuild(portfolio, change):
+    db = tracker.get_database()
+    value_account(portfolio)
+    with offline_providers(portfolio):
+        change(portfolio, db)
+    assert db.get_value("SELECT COUNT(*) FROM DIRTY_SLICES WHERE account_id == ?", (account_id,)) > 0
+
+    value_account(portfolio)
+    assert db.get_value("SELECT COUNT(*) FROM DIRTY_SLICES WHERE account_id == ?", (account_id,)) == 0
+    incremental = read_history(db)
+    days = pd.to_datetime(incremental.index)
+    assert len(incremental) == (days.max() - days.min()).days + 1    #One row per calendar day, none left out before the old first day
+
+    db.drop_table(f"ACCOUNT_{account_id}_HISTORICAL_VALUE")
+    value_account(portfolio)    #The view is refreshed again after units of the transactions were recalculated in date order
+    rebuilt = read_history(db)
+    view = db.read_sql(f"SELECT yahoo_ticker, total_number_of_units_after_transaction FROM INVESTMENT_VIEW_ACCOUNT_{account_id}")
+    positions = db.read_sql("SELECT type_of_transaction_value, number_of_units FROM POSITIONS WHERE account_id == ?", (account_id,))
+
+    pd.testing.assert_frame_equal(incremental, rebuilt, check_dtype=False, check_exact=False, rtol=1e-9, atol=1e-6)
+    units = dict(zip(view["yahoo_ticker"], pd.to_numeric(view["total_number_of_units_after_transaction"])))
+    assert units == dict(zip(positions["type_of_transaction_value"], pd.to_numeric(positions["number_of_units"])))
+    for ticker, number_of_units in units.items():
+        if f"{ticker}_number_of_units" in rebuilt.columns:
+            assert rebuilt[f"{ticker}_number_of_units"].dropna().iloc[-1] == number_of_units
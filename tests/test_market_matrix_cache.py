@@ -0,0 +1,70 @@
+"""
+Memory-mapped matrices of market_matrix_cache compared with the data base they are read from.
+
+Quotations rewritten in SQLite (a table downloaded again) and a cache directory shared by another data base have to rebuild
+the matrix, and the header names the data file of the matrix it describes.
+"""
+
+
+
+import os
+
+import pytest
+
+import data_base
+from lazy_import import lazy_module
+from market_matrix_cache import MarketMatrixCache, matrix_cache_directory_of
+
+pd = lazy_module("pandas")
+
+ticker = "SYN0000.WA"
+
+
+def write_quotations(db, scale: float, days: int=30):
+    dates = pd.date_range("2024-01-01", periods=days).strftime("%Y-%m-%d")
+    db.write_df(pd.DataFrame({"Date": dates, "Close": [scale * (day + 1) for day in range(days)]}), ticker, index=False)
+    db.write_df(pd.DataFrame({"Date": dates, "USD_PLN": [scale * 4.0] * days}), "EXCHANGE_RATE_TABLE", index=False)
+
+@pytest.fixture
+def db(tmp_path):
+    db = data_base.Database(str(tmp_path / "market"))
+    write_quotations(db, 1.0)
+    yield db
+    db.conn.close()
+
+
+def test_rewritten_quotations_rebuild_the_matrix(db):
+    cache = MarketMatrixCache(db.name)
+    cache.update(db, [ticker], ["USD"])
+    assert cache.prices_for(ticker, "2024-01-01")["Close"].iloc[-1] == 30.0
+
+    write_quotations(db, 2.0)    #The same dates and row counts, other values
+    cache.update(db, [ticker], ["USD"])
+    assert cache.prices_for(ticker, "2024-01-01")["Close"].iloc[-1] == 60.0
+    assert (cache.exchange_rates_for("USD", "2024-01-01")["USD_PLN"] == 8.0).all()
+
+    write_quotations(db, 2.0, days=20)    #Fewer rows up to the last date of the matrix
+    cache.update(db, [ticker], ["USD"])
+    assert len(cache.prices_for(ticker, "2024-01-01")) == 20
+
+def test_data_file_is_named_in_the_header(db):
+    cache = MarketMatrixCache(db.name)
+    cache.update(db, [ticker], ["USD"])
+    first_file = cache.read_header("prices")["data_file"]
+    write_quotations(db, 2.0)
+    cache.update(db, [ticker], ["USD"])
+    header = cache.read_header("prices")
+    assert header["data_file"] != first_file
+    assert sorted(name for name in os.listdir(cache.directory) if name.startswith("prices.")) == sorted(["prices.json", header["data_file"]])
+
+def test_cache_of_another_data_base_is_rebuilt(db, tmp_path):
+    directory = matrix_cache_directory_of(db.name)
+    MarketMatrixCache(db.name).update(db, [ticker], ["USD"])
+
+    other = data_base.Database(str(tmp_path / "other"))
+    write_quotations(other, 3.0)
+    cache = MarketMatrixCache(directory=directory)
+    cache.update(other, [ticker], ["USD"])
+    assert cache.read_header("prices")["database"] == os.path.abspath(other.name)
+    assert cache.prices_for(ticker, "2024-01-01")["Close"].iloc[-1] == 90.0
+    other.conn.close()
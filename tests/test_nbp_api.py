@@ -0,0 +1,31 @@
+"""
+Exchange rates of NBP written to EXCHANGE_RATE_TABLE for any number of currencies.
+
+Runs offline with the fake providers of the benchmarks.
+"""
+
+
+
+from datetime import timedelta
+
+import pytest
+
+import data_base
+import nbp_api as nbp
+from benchmarks.fake_providers import offline_providers
+from benchmarks.synthetic_portfolio import SyntheticPortfolio
+
+
+@pytest.mark.parametrize("currencies", [["USD"], ["USD", "EUR", "GBP"]])
+def test_rates_of_every_currency_are_written(tmp_path, currencies):
+    portfolio = SyntheticPortfolio(transactions=10, instruments=2, years=1, accounts=1, currencies=2, bond_series=0)
+    name_of_db = str(tmp_path / "rates")
+    end_date = portfolio.end_date
+    start_date = end_date - timedelta(days = 14)
+    with offline_providers(portfolio):
+        nbp.get_data_frame_exchange_rates_of(currencies, str(start_date), str(end_date), name_of_db)
+    db = data_base.Database(name_of_db)
+    df = db.get_table_df("EXCHANGE_RATE_TABLE")
+    assert [f"{currency}_PLN" for currency in currencies] == [column for column in df.columns if column.endswith("_PLN")]
+    assert len(df) > 0 and df.notna().all().all()
+    db.conn.close()
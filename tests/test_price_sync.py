@@ -0,0 +1,42 @@
+"""
+Close prices downloaded for the historical values of an account.
+
+They go to the data base of the account, and the historical_values stage of the pipeline, which runs after price_sync,
+doesn't download them again.
+"""
+
+
+
+import pytest
+
+import invest_tracker_main as tracker
+import pipeline
+import yahoo_finance_api as yfin
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracker.db = None
+    downloads = []
+    monkeypatch.setattr(yfin, "download_historical_data", lambda ticker, name_of_db: downloads.append((ticker, name_of_db)))
+    yield downloads
+    tracker.db = None
+
+
+def test_prices_are_downloaded_to_the_data_base_of_the_account(downloads, tmp_path):
+    db = tracker.get_database(str(tmp_path / "other_data_base"))
+    tracker.initialize_database(db)
+    account = tracker.Account("Konto")
+    db.execute(f"CREATE TABLE INVESTMENT_VIEW_ACCOUNT_{account.id} (yahoo_ticker)")
+    db.execute(f"INSERT INTO INVESTMENT_VIEW_ACCOUNT_{account.id} VALUES ('SYN0000.WA'), ('')")
+
+    account.update_historical_data_for_tickers(db=db)
+    assert downloads == [("SYN0000.WA", db.name)]
+
+def test_historical_values_stage_doesnt_download_prices(downloads, monkeypatch):
+    synchronized = []
+    monkeypatch.setattr(tracker.Account, "historical_values_for_investmens_on", lambda self, db=None, sync_prices=True: synchronized.append(sync_prices))
+    tracker.initialize_database(tracker.get_database())
+    pipeline.create_default_pipeline().stages["historical_values"].function()
+    assert synchronized == [False]
@@ -0,0 +1,71 @@
+"""
+Incremental returns compared with a calculation over the whole history.
+
+ACCOUNT_{id}_RETURNS keeps the state of ReturnTracker, so the next calculation reads only the days after its last date and adds them
+with ReturnTracker.append_day. The result has to be the same as ReturnTracker.from_history over the whole history.
+"""
+
+
+
+import pytest
+
+import cross_rates
+import instruments
+import interest_goverment_bond as bond_interest
+import invest_tracker_main as tracker
+import return_analytics
+from benchmarks.pipeline_benchmark import run_pipeline
+from benchmarks.synthetic_portfolio import SyntheticPortfolio
+
+account_id = 1
+history_table = f"ACCOUNT_{account_id}_HISTORICAL_VALUE"
+
+
+@pytest.fixture
+def portfolio(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cross_rates._cache.clear()
+    instruments.registry = None
+    portfolio = SyntheticPortfolio(transactions=80, instruments=4, years=1, accounts=1, currencies=2, bond_series=1)
+    run_pipeline(portfolio, trace_memory=False)
+    yield portfolio
+    tracker.db = None
+    bond_interest.conn = None
+    instruments.registry = None
+
+
+def test_new_days_are_appended_to_the_stored_tracker(portfolio, monkeypatch):
+    db = tracker.get_database()
+    full = return_analytics.calculate_account_returns(db, account_id, write=False)
+
+    #Returns calculated 30 days ago, then the valuation appended the last 30 days
+    cutoff = db.read_sql(f'SELECT Date FROM "{history_table}" ORDER BY Date DESC LIMIT 1 OFFSET 30')["Date"].iloc[0]
+    db.execute(f'CREATE TABLE history_backup AS SELECT * FROM "{history_table}" WHERE Date > ?', (cutoff,))
+    db.execute(f'DELETE FROM "{history_table}" WHERE Date > ?', (cutoff,))
+    return_analytics.calculate_account_returns(db, account_id)
+    db.execute(f'INSERT INTO "{history_table}" SELECT * FROM history_backup')
+
+    start_dates, appended_days = [], []
+    load_account_history, append_day = return_analytics.load_account_history, return_analytics.ReturnTracker.append_day
+    monkeypatch.setattr(return_analytics, "load_account_history", lambda db, account_id, start_date=None: start_dates.append(start_date) or load_account_history(db, account_id, start_date))
+    monkeypatch.setattr(return_analytics.ReturnTracker, "append_day", lambda self, date, values, flows: appended_days.append(date) or append_day(self, date, values, flows))
+    incremental = return_analytics.calculate_account_returns(db, account_id)
+
+    assert start_dates == [str(cutoff)[:10]]
+    assert len(appended_days) == 30
+    assert list(incremental.index) == list(full.index)
+    for column in ["twr", "value", "net_invested"]:
+        assert incremental[column].to_numpy() == pytest.approx(full[column].to_numpy(), rel=1e-9, abs=1e-9)
+    assert incremental["xirr"].to_numpy() == pytest.approx(full["xirr"].to_numpy(), rel=1e-6, abs=1e-8, nan_ok=True)
+
+def test_changed_history_is_calculated_again(portfolio, monkeypatch):
+    db = tracker.get_database()
+    return_analytics.calculate_account_returns(db, account_id)
+    first_day = db.get_value(f'SELECT MIN(Date) FROM "{history_table}"')
+    db.execute(f'UPDATE "{history_table}" SET total_cost = total_cost + 1 WHERE Date == ?', (first_day,))
+
+    start_dates = []
+    load_account_history = return_analytics.load_account_history
+    monkeypatch.setattr(return_analytics, "load_account_history", lambda db, account_id, start_date=None: start_dates.append(start_date) or load_account_history(db, account_id, start_date))
+    return_analytics.calculate_account_returns(db, account_id)
+    assert start_dates == [None]
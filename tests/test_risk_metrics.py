@@ -0,0 +1,76 @@
+"""
+Incremental risk metrics compared with a full calculation.
+
+Days appended to ACCOUNT_{id}_RISK from the history after its last date have to give the same table as rolling_risk_metrics
+over the whole history, and a changed history rebuilds the table.
+"""
+
+
+
+import math
+
+import pytest
+
+import cross_rates
+import instruments
+import interest_goverment_bond as bond_interest
+import invest_tracker_main as tracker
+import return_analytics
+import risk_metrics
+from benchmarks.pipeline_benchmark import run_pipeline
+from benchmarks.synthetic_portfolio import SyntheticPortfolio
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+
+account_id = 1
+table_name = f"ACCOUNT_{account_id}_RISK"
+
+
+@pytest.fixture
+def portfolio(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cross_rates._cache.clear()
+    instruments.registry = None
+    portfolio = SyntheticPortfolio(transactions=80, instruments=4, years=1, accounts=1, currencies=2, bond_series=1)
+    run_pipeline(portfolio, trace_memory=False)
+    yield portfolio
+    tracker.db = None
+    bond_interest.conn = None
+    instruments.registry = None
+
+def read_risk(db):
+    return db.read_sql(f'SELECT * FROM "{table_name}" ORDER BY Date').set_index("Date")
+
+
+def test_appended_days_match_full_calculation(portfolio, monkeypatch):
+    db = tracker.get_database()
+    benchmark = next(ticker for ticker in portfolio.instruments if ticker not in portfolio.bond_series)
+    risk_metrics.calculate_account_risk(db, account_id, benchmark, window=20)
+    full = read_risk(db)
+    last_kept = full.index[-31]
+    db.execute(f'DELETE FROM "{table_name}" WHERE Date > ?', (last_kept,))
+
+    start_dates = []
+    load_account_history = return_analytics.load_account_history
+    monkeypatch.setattr(return_analytics, "load_account_history", lambda db, account_id, start_date=None: start_dates.append(start_date) or load_account_history(db, account_id, start_date))
+    df_new = risk_metrics.calculate_account_risk(db, account_id, benchmark, window=20)
+    assert start_dates == [last_kept]
+    assert len(df_new) == 30
+    pd.testing.assert_frame_equal(read_risk(db), full, check_dtype=False, check_exact=False, rtol=1e-9, atol=1e-9)
+
+def test_changed_history_rebuilds_the_table(portfolio):
+    db = tracker.get_database()
+    risk_metrics.calculate_account_risk(db, account_id, window=20)
+    first_day = db.get_value(f'SELECT MIN(Date) FROM "ACCOUNT_{account_id}_HISTORICAL_VALUE"')
+    db.execute(f'UPDATE "ACCOUNT_{account_id}_HISTORICAL_VALUE" SET total_cost = total_cost + 1 WHERE Date == ?', (first_day,))
+    df_risk = risk_metrics.calculate_account_risk(db, account_id, window=20)
+    assert len(df_risk) == len(read_risk(db))
+
+def test_tracker_continues_after_a_total_loss():
+    risk_tracker = risk_metrics.RiskTracker(window=3)
+    rows = [risk_tracker.append(account_return) for account_return in [0.5, -1.0, 0.0]]
+    df_risk = pd.DataFrame(rows, columns=risk_metrics.metric_columns)
+    restored = risk_metrics.RiskTracker.from_history(df_risk, window=3)
+    assert (restored.peak, restored.wealth, restored.max_drawdown) == (1.5, 0.0, -1.0)
+    assert restored.append(0.1)["drawdown"] == -1.0 and not math.isnan(restored.append(0.1)["volatility"])
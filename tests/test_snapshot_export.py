@@ -0,0 +1,57 @@
+"""
+Snapshots of the valuation history read back by the application.
+
+The daily balance is read from the snapshot only while it was exported from the current ACCOUNT_{id}_HISTORICAL_VALUE table,
+and an account without holdings is exported too.
+"""
+
+
+
+import pytest
+
+import invest_tracker_main as tracker
+import snapshot_export
+from lazy_import import lazy_module
+
+pd = lazy_module("pandas")
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracker.db = None
+    db = tracker.get_database()
+    tracker.initialize_database(db)
+    yield db
+    tracker.db = None
+
+
+def write_history(db, account_id: int, balances: list):
+    dates = pd.date_range("2023-12-30", periods=len(balances)).strftime("%Y-%m-%d")
+    db.write_df(pd.DataFrame({"Date": dates, "account_balance": balances, "total_cost": [100.0] * len(balances)}),
+                f"ACCOUNT_{account_id}_HISTORICAL_VALUE", index=False)
+
+
+def test_account_without_holdings_is_exported(db):
+    account = tracker.Account("Konto")
+    write_history(db, account.id, [100.0, 101.0, 102.0])
+    assert snapshot_export.export_valuation_snapshot(db, account.id) == {"holdings": 0, "accounts": 3}
+    assert snapshot_export.is_snapshot_current(db, account.id)
+
+def test_history_is_read_from_the_current_snapshot_only(db, monkeypatch):
+    account = tracker.Account("Konto")
+    write_history(db, account.id, [100.0, 101.0, 102.0])
+    snapshot_export.export_valuation_snapshot(db, account.id)
+
+    queries = []
+    read_sql = db.read_sql
+    monkeypatch.setattr(db, "read_sql", lambda query, params=(): queries.append(query) or read_sql(query, params))
+    assert list(account.historical_balance_in("PLN", db)["account_balance"]) == [100.0, 101.0, 102.0]
+    assert not any(query.startswith("SELECT Date, account_balance, total_cost") for query in queries)
+    monkeypatch.undo()
+
+    write_history(db, account.id, [100.0, 101.0, 105.0])     #Valued again, not exported yet
+    assert not snapshot_export.is_snapshot_current(db, account.id)
+    assert list(account.historical_balance_in("PLN", db)["account_balance"]) == [100.0, 101.0, 105.0]
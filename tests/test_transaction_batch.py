@@ -0,0 +1,21 @@
+"""
+Running units of TransactionBatch counted per type (type_of_transaction_value), like the POSITIONS table.
+"""
+
+
+
+from lazy_import import lazy_module
+from transaction_batch import TransactionBatch
+
+pd = lazy_module("pandas")
+
+
+def test_running_units_are_counted_per_type():
+    #Two types without a ticker and a ticker bought on two accounts, not in date order
+    df = pd.DataFrame({"account_id": [1, 1, 1, 1, 2, 1],
+                       "date_of_purchase": ["2024-01-03", "2024-01-01", "2024-01-02", "2024-01-04", "2024-01-01", "2024-01-02"],
+                       "type_of_transaction_value": ["PLN", "PLN", "USD", "USD", "SYN0000.WA", "SYN0000.WA"],
+                       "yahoo_ticker": [None, None, None, None, "SYN0000.WA", "SYN0000.WA"],
+                       "number_of_units": [100, 50, 10, -4, 7, 3]})
+    units = TransactionBatch.from_frame(df).running_units()
+    assert list(units) == [150, 50, 10, 6, 7, 3]
@@ -0,0 +1,274 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Stage tracing
+
+Records nested spans of a run - stages of main() and their sub-steps (per ticker, per NBP window, per import batch):
+- wall time and CPU time of the thread running the span,
+- peak RSS of the process when the span ended (and the current RSS on Linux),
+- counters: rows processed, calls to external providers (http_calls) and statements of Database objects (db_statements, db_rows).
+  Counters of a span include the counters of its children.
+
+Spans are exported in the Chrome trace event format (JSON), which can be opened in chrome://tracing or https://ui.perfetto.dev
+to find the hot stage of a slow run. Statements of raw sqlite3 connections (nbp_api, yahoo_finance_api) are not counted.
+
+When tracing is disabled span() returns a shared empty context manager and count() returns at once, so instrumented code costs nothing.
+
+Usage:
+    tracing.enable_tracing()
+    with tracing.span("import_transactions"):
+        ...
+        tracing.count("rows", imported)
+    tracing.export_chrome_trace("invest_tracker_trace.json")
+
+Classes:
+- Span: One finished or running span.
+- Tracer: Spans of a run.
+    - span(self, name: str, category: str, **args): Context manager recording a span.
+    - count(self, counter: str, value: int): Adds to a counter of the innermost span of the thread.
+    - export_chrome_trace(self, path: str): Writes the spans as Chrome trace JSON.
+    - summary(self, max_depth: int): Text table of the spans.
+
+Functions:
+- enable_tracing(), disable_tracing(), get_tracer(): Start, stop and return the tracer of the process.
+- span(name: str, category: str, **args), count(counter: str, value: int): Record on the tracer, if enabled.
+- traced(name: str, category: str): Decorator recording every call of a function as a span.
+- export_chrome_trace(path: str), print_summary(max_depth: int): Output of the tracer.
+"""
+
+
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import data_base
+
+try:
+    import resource
+except ImportError:     #Windows
+    resource = None
+
+tracer = None   #Tracer of the process, set by enable_tracing()
+_disabled_span = nullcontext()
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process in MB, or None when it can't be read.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     #Kilobytes on Linux
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Span:
+
+    __slots__ = ("name", "category", "args", "thread_id", "depth", "start", "end", "cpu_start", "cpu_time", "peak_rss", "rss", "counters", "parent")
+
+    def __init__(self, name: str, category: str, args: dict, thread_id: int, depth: int, parent=None):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread_id = thread_id
+        self.depth = depth
+        self.parent = parent
+        self.start = time.perf_counter_ns()
+        self.cpu_start = time.thread_time_ns()
+        self.end = None
+        self.cpu_time = 0
+        self.peak_rss = None
+        self.rss = None
+        self.counters: dict = {}    #{counter: value}, with the counters of children
+
+    @property
+    def wall_time(self):
+        return ((self.end or time.perf_counter_ns()) - self.start) / 1e9
+
+    def __repr__(self):
+        return f"Span('{self.name}', wall_time={self.wall_time:.3f}, counters={self.counters})"
+
+
+class Tracer:
+
+    def __init__(self):
+        self.spans: list = []               #Spans in order of their start
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self._local = threading.local()     #Stack of open spans of every thread
+        self._lock = threading.Lock()
+        self._thread_names: dict = {}       #{thread id: thread name}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start_span(self, name: str, category: str="stage", **args):
+        stack = self._stack()
+        thread = threading.current_thread()
+        started = Span(name, category, args, thread.ident, len(stack), stack[-1] if stack else None)
+        stack.append(started)
+        with self._lock:
+            self._thread_names.setdefault(thread.ident, thread.name)
+            self.spans.append(started)
+        return started
+
+    def end_span(self, ended: Span):
+        ended.end = time.perf_counter_ns()
+        ended.cpu_time = time.thread_time_ns() - ended.cpu_start
+        ended.peak_rss = peak_rss_mb()
+        ended.rss = current_rss_mb()
+        stack = self._stack()
+        if ended in stack:
+            del stack[stack.index(ended):]
+        if ended.parent is not None:
+            with self._lock:
+                for counter, value in ended.counters.items():
+                    ended.parent.counters[counter] = ended.parent.counters.get(counter, 0) + value
+
+    def span(self, name: str, category: str="stage", **args):
+        """
+        Context manager recording a span. It yields the Span, whose args can be completed inside the block.
+        """
+        return _SpanContext(self, name, category, args)
+
+    def count(self, counter: str, value: int=1):
+        stack = self._stack()
+        if stack:
+            current = stack[-1]
+            current.counters[counter] = current.counters.get(counter, 0) + value
+
+    def to_chrome_trace(self):
+        """
+        Returns the spans as a dictionary in the Chrome trace event format: complete ("X") events with arguments
+        and an "rss_mb" counter track.
+        """
+        thread_ids = {ident: number for number, ident in enumerate(self._thread_names, start=1)}
+        events = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "invest_tracker"}}]
+        events += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread_ids[ident], "args": {"name": name}}
+                   for ident, name in self._thread_names.items()]
+        for recorded in self.spans:
+            end = recorded.end or time.perf_counter_ns()
+            args = {key: value if isinstance(value, (int, float, bool, type(None))) else str(value) for key, value in recorded.args.items()}
+            args.update(recorded.counters)
+            args["cpu_ms"] = round(recorded.cpu_time / 1e6, 3)
+            args["peak_rss_mb"] = recorded.peak_rss
+            events.append({"name": recorded.name, "cat": recorded.category, "ph": "X", "pid": self.pid, "tid": thread_ids[recorded.thread_id],
+                           "ts": (recorded.start - self.origin) / 1e3, "dur": (end - recorded.start) / 1e3, "args": args})
+            if recorded.rss is not None:
+                events.append({"name": "rss_mb", "ph": "C", "pid": self.pid, "ts": (end - self.origin) / 1e3, "args": {"rss_mb": round(recorded.rss, 1)}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str="invest_tracker_trace.json"):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_chrome_trace(), file)
+        print(f"[###############100%###############] Trace of {len(self.spans)} spans saved to '{path}' (open in https://ui.perfetto.dev)")
+        return path
+
+    def summary(self, max_depth: int=1):
+        """
+        Returns a text table of the spans down to max_depth (0 - stages only) in order of their start.
+        """
+        lines = [f"{'span':<48} {'wall s':>9} {'cpu s':>8} {'peak MB':>8} {'rows':>9} {'http':>6} {'db stmts':>9}"]
+        for recorded in self.spans:
+            if recorded.depth > max_depth:
+                continue
+            name = "  " * recorded.depth + recorded.name + "".join(f" {value}" for value in recorded.args.values())
+            counters = recorded.counters
+            peak = f"{recorded.peak_rss:.0f}" if recorded.peak_rss is not None else "-"
+            lines.append(f"{name[:48]:<48} {recorded.wall_time:>9.3f} {recorded.cpu_time / 1e9:>8.3f} {peak:>8} "
+                         f"{counters.get('rows', 0):>9} {counters.get('http_calls', 0):>6} {counters.get('db_statements', 0):>9}")
+        return "\n".join(lines)
+
+
+class _SpanContext:
+
+    __slots__ = ("tracer", "name", "category", "args", "recorded")
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.recorded = self.tracer.start_span(self.name, self.category, **self.args)
+        return self.recorded
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is not None:
+            self.recorded.args["error"] = repr(exc_info[1])
+        self.tracer.end_span(self.recorded)
+        return False
+
+
+def enable_tracing():
+    """
+    Starts a new tracer for the process. Statements of every Database object are counted in the innermost span.
+    """
+    global tracer
+    tracer = Tracer()
+    data_base.Database.tracer = tracer
+    return tracer
+
+def disable_tracing():
+    """
+    Stops tracing and returns the tracer with the recorded spans.
+    """
+    global tracer
+    stopped, tracer = tracer, None
+    data_base.Database.tracer = None
+    return stopped
+
+def get_tracer():
+    return tracer
+
+def span(name: str, category: str="stage", **args):
+    if tracer is None:
+        return _disabled_span
+    return tracer.span(name, category, **args)
+
+def count(counter: str, value: int=1):
+    if tracer is not None:
+        tracer.count(counter, value)
+
+def traced(name: str=None, category: str="function"):
+    """
+    Decorator recording every call of a function as a span named after the function.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return function(*args, **kwargs)
+            with tracer.span(span_name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def export_chrome_trace(path: str="invest_tracker_trace.json"):
+    if tracer is None:
+        print("Tracing is disabled.")
+        return None
+    return tracer.export_chrome_trace(path)
+
+def print_summary(max_depth: int=1):
+    if tracer is None:
+        print("Tracing is disabled.")
+    else:
+        print(tracer.summary(max_depth))
@@ -0,0 +1,290 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+In-memory transactions
+
+Transaction (invest_tracker_main) writes itself to the data base when it is created and needs a live connection.
+This module keeps transactions in memory without any data base:
+- TransactionRecord: one transaction with __slots__ (no per-instance __dict__, no properties, no I/O).
+- TransactionBatch: many transactions stored column by column in typed numpy arrays. Text columns are dictionary encoded
+  (int32 codes + list of distinct values), dates are datetime64[D]. Exchange rates, costs and running number of units are
+  calculated for whole columns at once.
+
+The data base is used only by explicit calls: TransactionBatch.load(db) reads the Transactions table, persist(db) inserts the batch.
+
+Classes:
+- TransactionRecord: A single transaction.
+- TransactionBatch: Column-oriented container of transactions.
+    - from_records(cls, records: list), from_frame(cls, df), from_csv(cls, path: str), load(cls, db, account_id: int): Build a batch.
+    - to_records(self), to_frame(self): Convert a batch.
+    - exchange_rates(self, df_exchange_rates): Exchange rate to PLN of every transaction on its date of purchase.
+    - costs(self, rates): Total cost of every transaction in PLN (with commission).
+    - running_units(self): Number of units of the type (type_of_transaction_value) on the account after every transaction.
+    - calculate(self, df_exchange_rates): Fills total_cost and total_number_of_units_after_transaction.
+    - persist(self, db): Inserts the batch into the Transactions table.
+"""
+
+
+
+from lazy_import import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+
+class TransactionRecord:
+
+    __slots__ = ("id", "account_id", "date_of_purchase", "operation_ticker", "type_of_transaction_value", "currency",
+                 "number_of_units", "price_of_one_unit", "commission", "yahoo_ticker", "type_of_investment",
+                 "total_cost", "total_number_of_units_after_transaction")
+
+    def __init__(self,
+                 account_id: int = 0,
+                 date_of_purchase: str = '-',
+                 operation_ticker: str = '-',
+                 type_of_transaction_value: str = '-',
+                 currency: str = '-',
+                 number_of_units: int = 0,
+                 price_of_one_unit: float = 0.00,
+                 commission: float = 0.00,
+                 yahoo_ticker: str = None,
+                 type_of_investment: str = None,
+                 id: int = None,
+                 total_cost: float = None,
+                 total_number_of_units_after_transaction: int = None):
+        self.id = id
+        self.account_id = account_id
+        self.date_of_purchase = date_of_purchase
+        self.operation_ticker = operation_ticker
+        self.type_of_transaction_value = type_of_transaction_value
+        self.currency = currency
+        self.number_of_units = number_of_units
+        self.price_of_one_unit = price_of_one_unit
+        self.commission = commission
+        self.yahoo_ticker = yahoo_ticker
+        self.type_of_investment = type_of_investment
+        self.total_cost = total_cost
+        self.total_number_of_units_after_transaction = total_number_of_units_after_transaction
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, TransactionRecord) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return (f"TransactionRecord(id={self.id}, account_id={self.account_id}, date_of_purchase='{self.date_of_purchase}', "
+                f"yahoo_ticker='{self.yahoo_ticker}', number_of_units={self.number_of_units}, price_of_one_unit={self.price_of_one_unit})")
+
+
+class TransactionBatch:
+
+    #Column name: numpy dtype, "text" columns are dictionary encoded
+    columns = {"id": "int64",
+               "account_id": "int32",
+               "date_of_purchase": "datetime64[D]",
+               "operation_ticker": "text",
+               "type_of_transaction_value": "text",
+               "currency": "text",
+               "number_of_units": "int64",
+               "price_of_one_unit": "float64",
+               "commission": "float64",
+               "yahoo_ticker": "text",
+               "type_of_investment": "text",
+               "total_cost": "float64",
+               "total_number_of_units_after_transaction": "float64"}
+
+    def __init__(self, data: dict=None, categories: dict=None):
+        self.data: dict = data or {name: np.empty(0, dtype="int32" if dtype == "text" else dtype) for name, dtype in self.columns.items()}
+        self.categories: dict = categories or {name: [] for name, dtype in self.columns.items() if dtype == "text"}     #{text column: distinct values}
+
+    def __len__(self):
+        return len(self.data["account_id"])
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __getitem__(self, position: int):
+        values = {}
+        for name, dtype in self.columns.items():
+            value = self.data[name][position]
+            if dtype == "text":
+                value = self.categories[name][value] if value >= 0 else None
+            elif dtype == "datetime64[D]":
+                value = str(value)
+            elif name == "id":
+                value = int(value) if value >= 0 else None
+            elif dtype.startswith("float"):
+                value = None if np.isnan(value) else float(value)
+            else:
+                value = int(value)
+            values[name] = value
+        return TransactionRecord(**values)
+
+    def column(self, name: str):
+        """
+        Returns a column as a numpy array, text columns are decoded to an object array.
+        """
+        if self.columns[name] == "text":
+            categories = np.array(list(self.categories[name]) + [None], dtype=object)
+            return categories[self.data[name]]
+        return self.data[name]
+
+    @staticmethod
+    def _encode(values):
+        codes, categories = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        return codes.astype(np.int32), [str(category) for category in categories]
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Builds a batch from a DataFrame with columns of the Transactions table. Missing columns are filled with empty values.
+        """
+        data = {}
+        categories = {}
+        length = len(df)
+        for name, dtype in cls.columns.items():
+            if dtype == "text":
+                values = df[name] if name in df.columns else pd.Series([None] * length)
+                data[name], categories[name] = cls._encode(values.where(pd.notna(values), None))
+            elif name not in df.columns:
+                data[name] = np.full(length, -1 if name == "id" else (np.nan if dtype.startswith("float") else 0), dtype=dtype)
+            elif dtype == "datetime64[D]":
+                data[name] = pd.to_datetime(df[name]).to_numpy().astype(dtype)
+            elif name == "id":
+                data[name] = pd.to_numeric(df[name], errors='coerce').fillna(-1).to_numpy().astype(dtype)
+            else:
+                data[name] = pd.to_numeric(df[name], errors='coerce').to_numpy().astype(dtype)
+        return cls(data, categories)
+
+    @classmethod
+    def from_records(cls, records: list):
+        return cls.from_frame(pd.DataFrame([record.as_dict() for record in records], columns=list(cls.columns)))
+
+    @classmethod
+    def from_csv(cls, path: str='transakcje.csv'):
+        """
+        Reads transactions from a CSV file in the format of transakcje.csv (separator ';').
+        """
+        return cls.from_frame(pd.read_csv(path, sep=";", encoding="utf-8", dtype={"yahoo_ticker": str}))
+
+    @classmethod
+    def load(cls, db, account_id: int=None):
+        """
+        Reads the transactions of an account (or all transactions) from the Transactions table.
+        """
+        query = f"SELECT {', '.join(cls.columns)} FROM Transactions"
+        params = ()
+        if account_id is not None:
+            query += " WHERE account_id == ?"
+            params = (account_id,)
+        return cls.from_frame(db.read_sql(query + " ORDER BY date_of_purchase, id", params))
+
+    def to_frame(self):
+        df = pd.DataFrame({name: self.column(name) for name in self.columns})
+        df["date_of_purchase"] = df["date_of_purchase"].astype(str)
+        df["id"] = df["id"].where(df["id"] >= 0)
+        return df
+
+    def to_records(self):
+        return list(self)
+
+    def select(self, mask):
+        """
+        Returns a new batch with the transactions selected by a boolean mask or an array of positions.
+        """
+        return TransactionBatch({name: values[mask] for name, values in self.data.items()}, {name: list(values) for name, values in self.categories.items()})
+
+    def exchange_rates(self, df_exchange_rates):
+        """
+        Returns the exchange rate to PLN of every transaction on its date of purchase.
+
+        Like nbp_api.get_exchange_rate, the rate of the last published day on or before the date is used. Missing rates are NaN.
+
+        :param df_exchange_rates: DataFrame indexed by Date with '{currency}_PLN' columns (EXCHANGE_RATE_TABLE).
+        :rtype: numpy.ndarray
+        """
+        rates = np.full(len(self), np.nan)
+        currencies = self.data["currency"]
+        dates = self.data["date_of_purchase"]
+        for code, currency in enumerate(self.categories["currency"]):
+            selected = currencies == code
+            if currency == "PLN":
+                rates[selected] = 1.0
+                continue
+            column_name = f"{currency}_PLN"
+            if df_exchange_rates is None or column_name not in df_exchange_rates.columns:
+                continue
+            df_rates = pd.to_numeric(df_exchange_rates[column_name], errors='coerce').dropna()
+            rate_dates = pd.to_datetime(df_rates.index).to_numpy().astype("datetime64[D]")
+            order = np.argsort(rate_dates, kind="stable")
+            rate_dates, rate_values = rate_dates[order], df_rates.to_numpy()[order]
+            positions = np.searchsorted(rate_dates, dates[selected], side="right") - 1
+            found = positions >= 0
+            selected_rates = np.full(len(positions), np.nan)
+            selected_rates[found] = rate_values[positions[found]]
+            rates[selected] = selected_rates
+        return rates
+
+    def costs(self, rates):
+        """
+        Returns the total cost of every transaction in PLN: number of units * price of one unit * exchange rate + commission.
+        """
+        return self.data["number_of_units"] * self.data["price_of_one_unit"] * rates + self.data["commission"]
+
+    def running_units(self):
+        """
+        Returns the number of units of the type (type_of_transaction_value) on the account after every transaction,
+        in order of date of purchase (and id or position for transactions of the same day). Units are counted per type like in POSITIONS
+        and Transaction.get_total_number_of_units, also when types share a yahoo_ticker.
+        """
+        length = len(self)
+        if length == 0:
+            return np.empty(0, dtype=np.int64)
+        sequence = np.where(self.data["id"] >= 0, self.data["id"], np.arange(length))
+        types = self.data["type_of_transaction_value"]
+        order = np.lexsort((sequence, self.data["date_of_purchase"], types, self.data["account_id"]))
+        units = self.data["number_of_units"][order]
+        totals = np.cumsum(units)
+        group_starts = np.ones(length, dtype=bool)
+        group_starts[1:] = (self.data["account_id"][order][1:] != self.data["account_id"][order][:-1]) | (types[order][1:] != types[order][:-1])
+        offsets = np.maximum.accumulate(np.where(group_starts, np.arange(length), 0))
+        totals = totals - totals[offsets] + units[offsets]
+        result = np.empty(length, dtype=np.int64)
+        result[order] = totals
+        return result
+
+    def calculate(self, df_exchange_rates):
+        """
+        Fills total_cost and total_number_of_units_after_transaction of the whole batch.
+        """
+        self.data["total_cost"] = self.costs(self.exchange_rates(df_exchange_rates))
+        self.data["total_number_of_units_after_transaction"] = self.running_units().astype(np.float64)
+        return self
+
+    def persist(self, db):
+        """
+        Inserts the transactions without id into the Transactions table and assigns their ids.
+
+        :return: The number of inserted transactions.
+        :rtype: int
+        """
+        new = np.flatnonzero(self.data["id"] < 0)
+        if len(new) == 0:
+            return 0
+        df = self.select(new).to_frame()
+        df = df.astype(object).where(pd.notna(df), None)
+        rows = [(None, int(row.account_id), row.date_of_purchase, row.operation_ticker, row.type_of_transaction_value, row.currency,
+                 int(row.number_of_units), row.price_of_one_unit, row.commission, row.yahoo_ticker, None,
+                 row.total_cost, row.total_number_of_units_after_transaction, None, row.type_of_investment)
+                for row in df.itertuples(index=False)]
+        if len(rows) == 1:
+            db.insert("Transactions", rows[0])
+        else:
+            db.insert("Transactions", *rows)
+        last_id = db.get_last_id("Transactions")
+        self.data["id"][new] = np.arange(last_id - len(new) + 1, last_id + 1)
+        print(f"[###############100%###############] {len(new)} transactions saved to the data base")
+        return len(new)
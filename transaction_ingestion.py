@@ -0,0 +1,288 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Streaming ingestion of broker statements
+
+Imports any number of CSV files in the format of transakcje.csv (separator ';') without loading them whole:
+1) Every file is parsed by its own worker process in chunks of chunk_rows rows. A chunk is sorted by date of purchase and,
+   when the file has more than one chunk, written to a temporary run file.
+2) Chunks and runs of all files are merged into date order with heapq.merge (external merge sort), reading one row of every run at a time.
+   Transactions of the same date keep the order of the files and of the rows in a file.
+3) Every row has a fingerprint - a hash of its normalized content and of the number of identical rows before it in the same file.
+   Fingerprints of imported rows are kept in the IMPORTED_TRANSACTIONS table, rows already imported are skipped,
+   so importing a statement which has grown costs only its new rows. Deleting a transaction deletes its fingerprint (trigger).
+4) New rows are inserted in batches of chunk_rows with their total cost (exchange rates of EXCHANGE_RATE_TABLE, NBP for later dates),
+   number of units and account balance after the transaction continued from the POSITIONS and Accounts tables.
+
+Usage:
+    python transaction_ingestion.py statements/2023.csv statements/2024.csv [--chunk-rows N] [--workers N]
+
+Functions:
+- fingerprint_of(fields: tuple, occurrence: int): Fingerprint of a normalized row.
+- parse_csv_file(path: str, source_index: int, chunk_rows: int, run_dir: str): Parses one file into sorted chunks or run files.
+- read_sorted_rows(paths: list, chunk_rows: int, workers: int): Yields rows of all files in date order.
+- sort_csv_by_date(path: str, output_path: str, chunk_rows: int): Sorts a CSV file by date of purchase with bounded memory.
+- install_import_tracking(db): Creates the IMPORTED_TRANSACTIONS table and its trigger.
+- ingest_csv_files(db, paths: list, chunk_rows: int, workers: int): Imports new transactions of CSV files.
+"""
+
+
+
+import argparse
+import bisect
+import csv
+import hashlib
+import heapq
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import nbp_api as nbp
+import tracing
+
+
+csv_columns = ("account_id", "date_of_purchase", "operation_ticker", "type_of_transaction_value", "currency",
+               "number_of_units", "price_of_one_unit", "commission", "yahoo_ticker", "type_of_investment")
+default_chunk_rows = 50_000
+
+#A sorted row is (date_of_purchase, source index, line number, fingerprint, *csv_columns), all text.
+#Source index and line number are zero padded, so the first three fields sort as text.
+_sort_key = itemgetter(0, 1, 2)
+
+
+def fingerprint_of(fields: tuple, occurrence: int=0):
+    """
+    Returns the fingerprint of a row: a hash of its normalized fields (in order of csv_columns)
+    and of the number of identical rows before it in the same file.
+    """
+    text = ";".join("" if field is None else str(field) for field in fields) + f"#{occurrence}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def _normalized(row: dict, path: str, line: int):
+    try:
+        return (int(row["account_id"]), row["date_of_purchase"].strip().replace(".", "-"), row["operation_ticker"].strip(),
+                row["type_of_transaction_value"].strip(), row["currency"].strip().upper(), int(row["number_of_units"]),
+                float(row["price_of_one_unit"]), float(row["commission"]), (row["yahoo_ticker"] or "").strip(),
+                (row["type_of_investment"] or "").strip())
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"Can't read transaction in '{path}' line {line}: {error}")
+
+def _write_run(rows: list, run_dir: str, source_index: int, run_number: int):
+    run_path = os.path.join(run_dir, f"run_{source_index:05d}_{run_number:05d}.csv")
+    rows.sort(key=_sort_key)
+    with open(run_path, "w", encoding="utf-8", newline="") as file:
+        csv.writer(file, delimiter=";").writerows(rows)
+    return run_path
+
+def parse_csv_file(path: str, source_index: int=0, chunk_rows: int=default_chunk_rows, run_dir: str=None):
+    """
+    Reads a CSV file in chunks of chunk_rows rows, normalizes and fingerprints every row.
+
+    :return: A sorted list of rows when the file fits in one chunk, otherwise a list of paths of sorted run files in run_dir.
+    """
+    rows = []
+    run_paths = []
+    occurrences = {}     #{digest of row content: identical rows seen before}
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for line, row in enumerate(csv.DictReader(file, delimiter=";"), start=2):
+            fields = _normalized(row, path, line)
+            content = fingerprint_of(fields)
+            occurrence = occurrences.get(content, 0)
+            occurrences[content] = occurrence + 1
+            raw = tuple((row[column] or "").strip() for column in csv_columns)
+            rows.append((fields[1], f"{source_index:05d}", f"{line:012d}", fingerprint_of(fields, occurrence), *raw))
+            if len(rows) >= chunk_rows:
+                run_paths.append(_write_run(rows, run_dir or tempfile.gettempdir(), source_index, len(run_paths)))
+                rows = []
+    if not run_paths:
+        rows.sort(key=_sort_key)
+        return rows
+    if rows:
+        run_paths.append(_write_run(rows, run_dir or tempfile.gettempdir(), source_index, len(run_paths)))
+    return run_paths
+
+def _parse_in_worker(arguments: tuple):
+    return parse_csv_file(*arguments)
+
+def _read_run(run_path: str):
+    with open(run_path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.reader(file, delimiter=";"):
+            yield tuple(row)
+
+def read_sorted_rows(paths: list, chunk_rows: int=default_chunk_rows, workers: int=None):
+    """
+    Yields rows (date_of_purchase, source index, line number, fingerprint, *csv_columns) of all files in date order.
+    Files are parsed in parallel, runs are merged with heapq.merge and deleted when the generator finishes.
+    """
+    paths = list(paths)
+    workers = min(workers or os.cpu_count() or 1, max(len(paths), 1))
+    with tempfile.TemporaryDirectory(prefix="invest_tracker_runs_") as run_dir:
+        arguments = [(path, source_index, chunk_rows, run_dir) for source_index, path in enumerate(paths)]
+        if workers == 1:
+            parts = [parse_csv_file(*argument) for argument in arguments]
+        else:
+            with ProcessPoolExecutor(max_workers= workers, mp_context= multiprocessing.get_context("spawn")) as executor:
+                parts = list(executor.map(_parse_in_worker, arguments))
+        sources = []
+        for part in parts:
+            if part and isinstance(part[0], str):
+                sources.extend(_read_run(run_path) for run_path in part)
+            else:
+                sources.append(part)
+        yield from heapq.merge(*sources, key=_sort_key)
+
+def sort_csv_by_date(path: str, output_path: str=None, chunk_rows: int=default_chunk_rows):
+    """
+    Sorts a CSV file by date of purchase (stable) with at most chunk_rows rows in memory. The file is replaced when output_path is None.
+    """
+    output_path = output_path or path
+    directory = os.path.dirname(os.path.abspath(output_path))
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", dir=directory, suffix=".csv", delete=False) as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(csv_columns)
+        for row in read_sorted_rows([path], chunk_rows, workers=1):
+            writer.writerow(row[4:])
+    os.replace(file.name, output_path)
+
+
+def install_import_tracking(db):
+    """
+    Creates the IMPORTED_TRANSACTIONS table (fingerprint, transaction_id, source) and the trigger deleting fingerprints of deleted transactions.
+    """
+    if not db.check_table_exists("IMPORTED_TRANSACTIONS"):
+        db.create_table("IMPORTED_TRANSACTIONS", "fingerprint PRIMARY KEY", "transaction_id INTEGER", "source")
+    db.create_index("IMPORTED_TRANSACTIONS", "transaction_id")
+    db.create_trigger("Transactions_imported_after_delete", "Transactions", "AFTER DELETE",
+                      "DELETE FROM IMPORTED_TRANSACTIONS WHERE transaction_id = OLD.id")
+
+def _known_fingerprints(db, fingerprints: list):
+    known = set()
+    for start in range(0, len(fingerprints), 500):
+        part = fingerprints[start:start + 500]
+        df = db.read_sql(f"SELECT fingerprint FROM IMPORTED_TRANSACTIONS WHERE fingerprint IN ({','.join('?' * len(part))})", tuple(part))
+        known.update(df["fingerprint"])
+    return known
+
+
+class _ExchangeRates:
+    #Rates to PLN on or before a date: EXCHANGE_RATE_TABLE up to its last date, NBP (once per currency and date) after it
+
+    def __init__(self, db):
+        self.db = db
+        self.tables = {}    #{currency: (dates, rates)}
+        self.fetched = {}   #{(currency, date): rate}
+
+    def _table_of(self, currency: str):
+        if currency not in self.tables:
+            column_name = f"{currency}_PLN"
+            dates, rates = [], []
+            if self.db.check_table_exists("EXCHANGE_RATE_TABLE") and column_name in self.db.get_column_names("EXCHANGE_RATE_TABLE"):
+                df = self.db.read_sql(f'SELECT Date, "{column_name}" FROM EXCHANGE_RATE_TABLE WHERE "{column_name}" IS NOT NULL ORDER BY Date')
+                dates, rates = [str(value)[:10] for value in df["Date"]], [float(value) for value in df[column_name]]
+            self.tables[currency] = (dates, rates)
+        return self.tables[currency]
+
+    def rate(self, currency: str, date_of_purchase: str):
+        if currency == "PLN":
+            return 1.0
+        dates, rates = self._table_of(currency)
+        position = bisect.bisect_right(dates, date_of_purchase) - 1
+        if position >= 0 and date_of_purchase <= dates[-1]:
+            return rates[position]
+        key = (currency, date_of_purchase)
+        if key not in self.fetched:
+            self.fetched[key] = nbp.get_exchange_rate(currency, date_of_purchase)
+        return self.fetched[key]
+
+
+def _insert_batch(db, batch: list, paths: list, rates: _ExchangeRates, units: dict, balances: dict):
+    transactions = []
+    for row in batch:
+        account_id, date_of_purchase, operation_ticker, type_of_transaction_value, currency, number_of_units, price_of_one_unit, commission, yahoo_ticker, type_of_investment = _normalized(dict(zip(csv_columns, row[4:])), paths[int(row[1])], int(row[2]))
+        total_cost = number_of_units * price_of_one_unit * rates.rate(currency, date_of_purchase) + commission
+        key = (account_id, type_of_transaction_value)
+        if key not in units:
+            units[key] = db.get_value("SELECT number_of_units FROM POSITIONS WHERE account_id = ? AND type_of_transaction_value = ?", key, default=0)
+        units[key] += number_of_units
+        if account_id not in balances:
+            balances[account_id] = db.get_value("SELECT balance FROM Accounts WHERE id = ?", (account_id,))
+        if balances[account_id] is not None:
+            balances[account_id] += total_cost
+        transactions.append((None, account_id, date_of_purchase, operation_ticker, type_of_transaction_value, currency, number_of_units,
+                             price_of_one_unit, commission, yahoo_ticker, None, total_cost, units[key], balances[account_id], type_of_investment))
+    if len(transactions) == 1:
+        db.insert("Transactions", transactions[0])
+    else:
+        db.insert("Transactions", *transactions)
+    last_id = db.get_last_id("Transactions")
+    first_id = last_id - len(transactions) + 1
+    fingerprints = [(row[3], first_id + position, os.path.basename(paths[int(row[1])])) for position, row in enumerate(batch)]
+    if len(fingerprints) == 1:
+        db.insert("IMPORTED_TRANSACTIONS", fingerprints[0])
+    else:
+        db.insert("IMPORTED_TRANSACTIONS", *fingerprints)
+
+def ingest_csv_files(db, paths: list, chunk_rows: int=default_chunk_rows, workers: int=None):
+    """
+    Imports transactions of CSV files into the Transactions table in date order, skipping rows which were imported before.
+
+    :param db: The Database with the Transactions, Accounts and POSITIONS tables.
+    :param paths: Paths of the CSV files.
+    :param chunk_rows: Rows parsed, sorted and inserted at once; files with more rows are sorted with run files on disk.
+    :param workers: Number of processes parsing the files, defaults to the number of CPUs.
+    :return: The number of imported transactions.
+    :rtype: int
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    install_import_tracking(db)
+    rates = _ExchangeRates(db)
+    units = {}          #{(account_id, type_of_transaction_value): units after the last inserted transaction}
+    balances = {}       #{account_id: balance after the last inserted transaction}
+    seen = set()        #Fingerprints imported by this call, for rows repeated in more than one file
+    imported = skipped = 0
+    batch = []
+
+    def flush(batch: list):
+        nonlocal imported, skipped
+        known = _known_fingerprints(db, [row[3] for row in batch])
+        new = []
+        for row in batch:
+            if row[3] in known or row[3] in seen:
+                skipped += 1
+                continue
+            seen.add(row[3])
+            new.append(row)
+        if new:
+            with tracing.span("ingest_batch", "batch", rows=len(new)):
+                _insert_batch(db, new, paths, rates, units, balances)
+                tracing.count("rows", len(new))
+            imported += len(new)
+
+    for row in read_sorted_rows(paths, chunk_rows, workers):
+        batch.append(row)
+        if len(batch) >= chunk_rows:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    print(f"[###############100%###############] {imported} transactions imported from {len(paths)} files, {skipped} already imported")
+    return imported
+
+
+def main():
+    import invest_tracker_main as tracker
+    parser = argparse.ArgumentParser(description="Imports new transactions of broker statements (CSV files) into the data base.")
+    parser.add_argument("paths", nargs="+", help="CSV files in the format of transakcje.csv.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--chunk-rows", type=int, default=default_chunk_rows, help="Rows kept in memory per file and inserted at once.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parsing processes, defaults to the number of CPUs.")
+    args = parser.parse_args()
+    ingest_csv_files(tracker.get_database(args.database), args.paths, args.chunk_rows, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Note:
+    - This module is part of Invest Tracker aplication.
+
+Multi-account valuation runner
+
+Values all accounts stored in the data base at once:
+1) Synchronizes exchange rates (NBP) and historical prices (Yahoo Finance) of all tickers of all accounts - once.
+2) Loads the shared market data (exchange rates, close prices, bond values, last market prices) - once.
+   Exchange rates and close prices are appended to the memory-mapped matrices of market_matrix_cache and the workers map them from disk.
+3) Values every account (investment view, historical values, historical balance and total cost) in a pool of worker processes,
+   calculates its returns (return_analytics), appends the new days of its rolling risk metrics (risk_metrics, against the benchmark
+   given with --benchmark) and writes its snapshot (snapshot_export) when pyarrow is installed.
+
+Every worker opens its own connection to the data base and receives the shared market data once, when it starts.
+With low_memory the workers read the ledgers and historical values as typed frames (Database.read_typed) of float32 values
+under a memory budget per worker.
+The data base is switched to WAL mode so the workers can read while another one writes.
+
+Usage:
+    python valuation_runner.py [--workers N] [--no-sync] [--no-matrix-cache] [--low-memory] [--memory-budget-mb MB] [--benchmark TICKER]
+
+Functions:
+- get_account_ids(db): Returns ids of all accounts in the Accounts table.
+- synchronize_market_data(db, currencies: list): Downloads new exchange rates and prices of all tickers of all accounts.
+- load_market_data(db, currencies: list, matrix_cache): Loads MarketData shared by all accounts.
+- value_account(account_id: int): Values one account, runs in a worker process.
+- run_valuation_for_all_accounts(database_name: str, workers: int, currencies: list, sync: bool, use_matrix_cache: bool, low_memory: bool, memory_budget_mb: float,
+                                  benchmark_ticker: str):
+    Values all accounts in parallel.
+"""
+
+
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import invest_tracker_main as tracker
+import data_base
+import interest_goverment_bond as bond_interest
+import nbp_api as nbp
+import yahoo_finance_api as yfin
+import snapshot_export
+import return_analytics
+import risk_metrics
+from market_data import MarketData
+from market_matrix_cache import MarketMatrixCache
+
+
+worker_market_data = None   #MarketData of the worker process, set by initialize_worker()
+worker_benchmark_ticker = None  #Benchmark of the risk metrics of the worker process, set by initialize_worker()
+
+
+def get_account_ids(db):
+    df_accounts = db.get_table_df("Accounts", "id", sort_col="id", sort_order="ASC")
+    return [int(account_id) for account_id in df_accounts["id"]]
+
+def synchronize_market_data(db, currencies: list=["USD", "GBP", "EUR"]):
+    nbp.check_nbp_api_for_new_exchange_rates(currencies, name_of_db= db.name)
+    df_tickers = db.get_table_df("Transactions", "yahoo_ticker")
+    for ticker in df_tickers["yahoo_ticker"].drop_duplicates():
+        if ticker:
+            yfin.download_historical_data(ticker= ticker, name_of_db= db.name)
+
+def load_market_data(db, currencies: list=["USD", "GBP", "EUR"], matrix_cache=None):
+    df_transactions = db.read_sql("SELECT DISTINCT yahoo_ticker, currency FROM Transactions")
+    start_date = db.read_sql("SELECT MIN(date_of_purchase) FROM Transactions").iloc[0, 0]
+    currencies = list(currencies) + list(df_transactions["currency"])
+    return MarketData.load(db, list(df_transactions["yahoo_ticker"]), currencies, start_date, matrix_cache)
+
+def initialize_worker(database_name: str, market_data, low_memory: bool=False, memory_budget_mb: float=None, benchmark_ticker: str=None):
+    global worker_market_data, worker_benchmark_ticker
+    if low_memory:
+        data_base.Database.enable_low_memory_mode("float32", memory_budget_mb)
+    tracker.db = None
+    bond_interest.connect(database_name)    #Last bond values of get_current_bond_value are read from the valued data base
+    tracker.get_database(database_name, timeout=600.0)
+    worker_market_data = market_data
+    worker_benchmark_ticker = benchmark_ticker
+
+def value_account(account_id: int):
+    start = time.perf_counter()
+    db = tracker.get_database()
+    account = tracker.Account.from_database(account_id, db)
+    account.market_data = worker_market_data
+    account.investment_view_by_type()
+    account.historical_values_for_investmens_on(db=db)
+    account.calculate_historical_balance_and_append_to_db(db=db)
+    account.calculate_historical_total_cost_for(db=db)
+    return_analytics.calculate_account_returns(db, account_id)
+    risk_metrics.calculate_account_risk(db, account_id, worker_benchmark_ticker)
+    if snapshot_export.pyarrow_available():
+        snapshot_export.export_valuation_snapshot(db, account_id)
+    return time.perf_counter() - start
+
+def run_valuation_for_all_accounts(database_name: str="invest_tracker_data_base", workers: int=None, currencies: list=["USD", "GBP", "EUR"], sync: bool=True,
+                                   use_matrix_cache: bool=True, low_memory: bool=False, memory_budget_mb: float=None, benchmark_ticker: str=None):
+    """
+    Values all accounts of the data base in a pool of worker processes.
+
+    :param database_name: The name of the SQLite database file.
+    :param workers: The number of worker processes. Defaults to the number of CPUs.
+    :param currencies: The currencies synchronized with NBP.
+    :param sync: Download new exchange rates and prices before the valuation.
+    :param use_matrix_cache: Serve exchange rates and close prices from the memory-mapped matrix cache.
+    :param low_memory: Read typed float32 frames in the workers (Database.enable_low_memory_mode).
+    :param memory_budget_mb: The memory budget of typed frames of every worker, None - no limit.
+    :param benchmark_ticker: The benchmark of the risk metrics (beta), None - without a benchmark.
+    :return: A dictionary {account_id: valuation time in seconds}.
+    :rtype: dict
+    """
+    db = tracker.get_database(database_name)
+    db.set_journal_mode("WAL")
+    bond_interest.connect(database_name)
+    account_ids = get_account_ids(db)
+    if sync:
+        synchronize_market_data(db, currencies)
+        if benchmark_ticker:
+            yfin.download_historical_data(ticker= benchmark_ticker, name_of_db= db.name)
+    market_data = load_market_data(db, currencies, MarketMatrixCache(database_name) if use_matrix_cache else None)
+    workers = min(workers or os.cpu_count() or 1, max(len(account_ids), 1))
+
+    print(f"Valuation of {len(account_ids)} accounts with {workers} workers")
+    results = {}
+    with ProcessPoolExecutor(max_workers= workers,
+                             mp_context= multiprocessing.get_context("spawn"),
+                             initializer= initialize_worker,
+                             initargs= (database_name, market_data, low_memory, memory_budget_mb, benchmark_ticker)) as executor:
+        for account_id, valuation_time in zip(account_ids, executor.map(value_account, account_ids)):
+            results[account_id] = valuation_time
+            print(f"Account {account_id} valued in {valuation_time:.2f} s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Values all accounts of the data base in parallel.")
+    parser.add_argument("--database", default="invest_tracker_data_base")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes, defaults to the number of CPUs.")
+    parser.add_argument("--no-sync", action="store_true", help="Don't download new exchange rates and prices.")
+    parser.add_argument("--no-matrix-cache", action="store_true", help="Load exchange rates and prices from the data base instead of the memory-mapped matrices.")
+    parser.add_argument("--low-memory", action="store_true", help="Read float32 typed frames in the workers.")
+    parser.add_argument("--memory-budget-mb", type=float, default=None, help="Memory budget of typed frames of every worker (with --low-memory).")
+    parser.add_argument("--benchmark", default=None, help="Ticker of the benchmark of the risk metrics, e.g. WIG20.WA or ^GSPC.")
+    args = parser.parse_args()
+    run_valuation_for_all_accounts(args.database, args.workers, sync= not args.no_sync, use_matrix_cache= not args.no_matrix_cache,
+                                   low_memory= args.low_memory, memory_budget_mb= args.memory_budget_mb, benchmark_ticker= args.benchmark)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,19 @@ Note:
 This script provides functions to manage financial data for an investment tracker application. It includes functionalities to retrieve the last market price of various assets, download historical data for specified tickers, and update the local SQLite database.
 
 Dependencies:
-- yfinance (yf)
-- decimal
+- yfinance (yf, imported on first use)
+- money
+- instruments
 - datetime
 - nbp_api
 - interest_government_bond (bond_value)
 - sqlite3 (sql)
+- tracing
 
 Functions:
 1. get_last_market_price(ticker: str, date_param: str = str(date.today())) -> Tuple[float, str]:
     - Returns the last market price and currency for the given ticker.
-    - If the ticker represents a government bond ('EDO', 'COI', 'ROS', 'ROD'), it utilizes the 'bond_value' module.
+    - If the ticker represents a government bond ('EDO', 'COI', 'ROS', 'ROD' - instruments.is_bond), it utilizes the 'bond_value' module.
     - If the ticker is 'CASH', returns a default value of 1.00 PLN.
     - For other tickers, fetches information using yfinance and returns the last market price and currency.
 
@@ -45,12 +47,16 @@ Note:
 
 
 
-import yfinance as yf
-from decimal import *
 from datetime import date, timedelta, datetime
 import nbp_api
 import interest_goverment_bond as bond_value
+import money
+import instruments
 import sqlite3 as sql
+import tracing
+from lazy_import import lazy_module
+
+yf = lazy_module("yfinance")
 
 
 
@@ -60,15 +66,16 @@ def get_last_market_price(ticker: str, date_param: str= str(date.today())):
     
     #if ticker == "":
 
-    if ticker[:3] in ['EDO', 'COI', 'ROS', 'ROD']:
+    if instruments.is_bond(ticker):
         last_market_price, currency = bond_value.get_current_bond_value(ticker)
-    elif ticker == "CASH":
+    elif instruments.is_cash(ticker):
         last_market_price, currency = 1.00, "PLN"
     else:
+        tracing.count("http_calls")
         ticker = yf.Ticker(ticker)
         stockinfo = ticker.fast_info
         last_market_price = stockinfo["last_price"]
-        last_market_price = float(Decimal(last_market_price).quantize(Decimal(10) ** -3))
+        last_market_price = float(money.Money.from_float(last_market_price, scale=3))
         currency = stockinfo["currency"]  
     
     return  last_market_price, currency
@@ -79,14 +86,14 @@ def download_historical_data(ticker: str,
                              name_of_db: str,
                              period=None,
                              start_date=None):
-    if ticker not in ['','CASH'] and (ticker[:3] not in ['EDO', 'COI', 'ROS', 'ROD']):
+    if instruments.has_market_prices(ticker):
         conn = sql.connect(name_of_db)
         cur = conn.cursor()
         
         if period == None and start_date == None:
             try:
-                cur.execute(f"SELECT Date FROM '{ticker}'")
-                last_date = cur.fetchall()[-1][0]
+                cur.execute(f"SELECT MAX(Date) FROM '{ticker}'")
+                last_date = cur.fetchone()[0]
                 last_date = last_date.split(' ')[0]
                 #today = date.today()
                 last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
@@ -97,24 +104,31 @@ def download_historical_data(ticker: str,
             except sql.OperationalError:
                 period = "max"
                 
-        if period != None:
-            df = yf.Ticker(ticker).history(period = period,
-                                        interval = '1d')
-        else:
-            df = yf.Ticker(ticker).history(start = start_date,
-                                        interval = '1d')
-
-        if not df.empty:
-            df = df.reset_index()
-            df = df.assign(Date =df.Date.dt.date, Year=df.Date.dt.year, Month=df.Date.dt.month, Day=df.Date.dt.day)
-            df = df.set_index("Date")
-            df = df.drop(columns = "Stock Splits")
-            df = df.round(2)
-            df.to_sql(ticker, conn, if_exists="append")
-
-            print(f"[###############100%###############] Successfully updated '{ticker}' data's")
-        else:
-            print(f"[#                0%               ] Failed updating '{ticker}' data's")
+        with tracing.span("download_prices", "ticker", ticker=ticker):
+            tracing.count("http_calls")
+            if period != None:
+                df = yf.Ticker(ticker).history(period = period,
+                                            interval = '1d')
+            else:
+                df = yf.Ticker(ticker).history(start = start_date,
+                                            interval = '1d')
+
+            if not df.empty:
+                df = df.reset_index()
+                df = df.assign(Date =df.Date.dt.date, Year=df.Date.dt.year, Month=df.Date.dt.month, Day=df.Date.dt.day)
+                df = df.set_index("Date")
+                df = df.drop(columns = "Stock Splits")
+                df = df.round(2)
+                df.to_sql(ticker, conn, if_exists="append")
+                tracing.count("rows", len(df))
+                cur.execute(f"""CREATE INDEX IF NOT EXISTS "ix_{ticker}_Date" ON '{ticker}' (Date)""")
+                conn.commit()
+
+                print(f"[###############100%###############] Successfully updated '{ticker}' data's")
+                return True
+            else:
+                print(f"[#                0%               ] Failed updating '{ticker}' data's")
+    return False
 
 
 